@@ -2,9 +2,17 @@ import os
 import requests
 import json
 import time
+import hashlib
+import math
+from datetime import datetime, timedelta, timezone
 from flask import (Flask, request, jsonify, render_template, flash, redirect,
-                   url_for, session)
+                   url_for, session, current_app, has_request_context)
+from flask.cli import with_appcontext
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, delete as sql_delete, event, insert as sql_insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from flask_migrate import Migrate
 from flask_login import (LoginManager, UserMixin, login_user, logout_user,
                          login_required, current_user)
@@ -12,13 +20,29 @@ from flask_wtf import FlaskForm
 from flask_wtf.csrf import CSRFProtect, generate_csrf
 from wtforms import StringField, PasswordField, SubmitField, BooleanField
 from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError
-from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
 import logging
+import click
 import markdown
 from markupsafe import Markup
 from urllib.parse import urlparse, parse_qs
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from config import config # Import the config dictionary
+from pipeline import StagePipeline, submit as submit_background, with_app_context
+from cache import LocalLRU, ResponseCache, StaleWhileRevalidateCache, normalize_query
+from http_client import RETRY_STATUS_CODES, UpstreamClient
+from singleflight import SingleFlight
+from tasks import TaskQueue
+from ratelimit import RateLimiter, RateLimitExceeded
+from passwords import PasswordHasher
+from db_routing import RoutingSession, read_replica
+from listing_search import create_search_index, drop_search_index, search_listings
+import metrics
+import profiling
+from skills import top_skills
+import salary_stats
+import trends
 
 # --- Basic Setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s:%(name)s:%(message)s')
@@ -28,16 +52,26 @@ load_dotenv() # Load environment variables early
 
 # --- Extensions Initialization (outside factory) ---
 logger.info("--- Initializing extensions (globally) ---")
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 login_manager = LoginManager()
 csrf = CSRFProtect()
+upstream = UpstreamClient()
+adzuna_limiter = RateLimiter('adzuna')
+flights = SingleFlight()
+search_cache = ResponseCache('search', single_flight=flights)
+histogram_cache = StaleWhileRevalidateCache('histogram', single_flight=flights)
+saved_ids_cache = LocalLRU('saved_ids')
+user_cache = LocalLRU('user')
+salary_stats_cache = LocalLRU('salary_stats')
+password_hasher = PasswordHasher()
+task_queue = TaskQueue()
 logger.info("--- Extensions initialized ---")
 
 # --- API Configuration (Constants) ---
 ADZUNA_APP_ID = os.getenv('ADZUNA_APP_ID')
 ADZUNA_APP_KEY = os.getenv('ADZUNA_APP_KEY')
-ADZUNA_API_BASE_URL = 'https://api.adzuna.com/v1/api/jobs'
+ADZUNA_API_BASE_URL = os.getenv('ADZUNA_API_BASE_URL', 'https://api.adzuna.com/v1/api/jobs') # Overridable for the offline benchmarks
 RESULTS_PER_PAGE = 20
 AZURE_AI_ENDPOINT = os.getenv('AZURE_AI_ENDPOINT')
 AZURE_AI_KEY = os.getenv('AZURE_AI_KEY')
@@ -55,14 +89,34 @@ class User(UserMixin, db.Model):
     saved_jobs = db.relationship('SavedJob', backref='user', lazy=True, cascade="all, delete-orphan")
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
 
     def __repr__(self):
         return f'<User {self.email}>'
 
+class CachedUser(UserMixin):
+    """
+    Lightweight identity Flask-Login hands out as current_user: just the id and email, so
+    authenticated requests need no database round trip. Call load() for the full User row.
+    """
+    __slots__ = ('id', 'email')
+
+    def __init__(self, id, email):
+        self.id = id
+        self.email = email
+
+    def load(self):
+        return db.session.get(User, self.id)
+
+    def __repr__(self):
+        return f'<CachedUser {self.email}>'
+
 class SavedJob(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     adzuna_job_id = db.Column(db.String(100), nullable=False)
@@ -71,10 +125,128 @@ class SavedJob(db.Model):
     location = db.Column(db.String(150))
     adzuna_url = db.Column(db.String(500))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    __table_args__ = (db.UniqueConstraint('user_id', 'adzuna_job_id', name='_user_job_uc'),)
+    __table_args__ = (db.UniqueConstraint('user_id', 'adzuna_job_id', name='_user_job_uc'),
+                      db.Index('ix_saved_job_user_id_id', 'user_id', 'id')) # Keyset pagination, newest first
+    # Full details of the job as last fetched from Adzuna, if it is still in job_listing
+    listing = db.relationship('JobListing', primaryjoin='foreign(SavedJob.adzuna_job_id) == JobListing.adzuna_job_id',
+                              viewonly=True, uselist=False)
 
     def __repr__(self):
         return f'<SavedJob {self.title} ({self.adzuna_job_id})>'
+
+class JobListing(db.Model):
+    """ Every listing fetched from Adzuna, upserted by record_job_listings and full-text indexed (listing_search.py). """
+    __tablename__ = 'job_listing'
+    id = db.Column(db.Integer, primary_key=True)
+    adzuna_job_id = db.Column(db.String(100), unique=True, nullable=False)
+    country = db.Column(db.String(2), nullable=False)
+    title = db.Column(db.String(300))
+    company = db.Column(db.String(255))
+    location = db.Column(db.String(255))
+    description = db.Column(db.Text)
+    adzuna_url = db.Column(db.String(500))
+    created = db.Column(db.String(40)) # Adzuna's posting timestamp, as sent
+    first_seen_at = db.Column(db.DateTime, nullable=False)
+    last_seen_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<JobListing {self.title} ({self.adzuna_job_id})>'
+
+event.listen(JobListing.__table__, 'after_create', create_search_index)
+event.listen(JobListing.__table__, 'before_drop', drop_search_index)
+
+class TrackedQuery(db.Model):
+    """ A search whose market numbers are snapshotted periodically into market_snapshot (see run_market_snapshots). """
+    __tablename__ = 'tracked_query'
+    id = db.Column(db.Integer, primary_key=True)
+    query_key = db.Column(db.String(255), unique=True, nullable=False) # normalize_query(country, what, where)
+    what = db.Column(db.String(200), nullable=False)
+    location = db.Column(db.String(200), nullable=False)
+    country = db.Column(db.String(2), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    last_snapshot_at = db.Column(db.DateTime)
+    snapshots = db.relationship('MarketSnapshot', backref='tracked_query', lazy=True, cascade="all, delete-orphan")
+
+    def __repr__(self):
+        return f'<TrackedQuery {self.query_key}>'
+
+class MarketSnapshot(db.Model):
+    """
+    One time bucket of a tracked query's market numbers: a single snapshot, or several merged by
+    downsampling (trends.py), in which case counts and salaries are averages over `samples` snapshots.
+    """
+    __tablename__ = 'market_snapshot'
+    id = db.Column(db.Integer, primary_key=True)
+    tracked_query_id = db.Column(db.Integer, db.ForeignKey('tracked_query.id'), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    resolution = db.Column(db.Integer, nullable=False) # bucket width in seconds
+    samples = db.Column(db.Integer, nullable=False, default=1)
+    total_jobs = db.Column(db.Integer)
+    salary_p10 = db.Column(db.Integer)
+    salary_p25 = db.Column(db.Integer)
+    salary_median = db.Column(db.Integer)
+    salary_p75 = db.Column(db.Integer)
+    salary_p90 = db.Column(db.Integer)
+    listings_sampled = db.Column(db.Integer, nullable=False, default=0) # listings the skill counts come from
+    top_skills = db.Column(db.Text) # JSON {skill: listings mentioning it}
+    # One row per bucket; also serves the trend read (one range scan per query)
+    __table_args__ = (db.UniqueConstraint('tracked_query_id', 'bucket_start', name='uq_market_snapshot_query_bucket'),)
+
+    def to_point(self):
+        """ Column values as a plain dict (the shape trends.py works with). """
+        return {'id': self.id, 'bucket_start': self.bucket_start, 'resolution': self.resolution,
+                'samples': self.samples, 'total_jobs': self.total_jobs, 'listings_sampled': self.listings_sampled,
+                **{field: getattr(self, field) for field in trends.SALARY_FIELDS},
+                'top_skills': json.loads(self.top_skills) if self.top_skills else {}}
+
+    def to_dict(self):
+        point = self.to_point()
+        del point['id']
+        return point | {'bucket_start': self.bucket_start.isoformat() + 'Z'}
+
+    def __repr__(self):
+        return f'<MarketSnapshot {self.tracked_query_id} {self.bucket_start}>'
+
+class AISummaryCache(db.Model):
+    """ Azure AI summaries keyed by a hash of the exact prompt inputs, stored with their rendered HTML. """
+    __tablename__ = 'ai_summary_cache'
+    prompt_hash = db.Column(db.String(64), primary_key=True)
+    summary_markdown = db.Column(db.Text, nullable=False)
+    summary_html = db.Column(db.Text, nullable=False)
+    size_bytes = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<AISummaryCache {self.prompt_hash[:12]}>'
+
+class Task(db.Model):
+    """ A unit of background work for the embedded task queue (see tasks.py). """
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    task_key = db.Column(db.String(255), index=True) # De-duplication key
+    token = db.Column(db.String(32), unique=True, index=True) # Unguessable handle for the status URL
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued') # queued, running, done, failed
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    locked_by = db.Column(db.String(100))
+    run_after = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime)
+    leased_until = db.Column(db.DateTime) # Renewed by the running worker; reclaimed once it lapses
+    finished_at = db.Column(db.DateTime)
+    __table_args__ = (db.Index('ix_task_claim', 'status', 'priority', 'run_after'),)
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name, 'status': self.status, 'attempts': self.attempts,
+                'result': json.loads(self.result) if self.result else None, 'error': self.error}
+
+    def __repr__(self):
+        return f'<Task {self.id} {self.name} ({self.status})>'
 logger.info("--- Models defined ---")
 
 # --- Forms (using Flask-WTF) ---
@@ -117,23 +289,108 @@ def create_app(config_name=None):
     migrate.init_app(app, db)
     login_manager.init_app(app)
     csrf.init_app(app)
+    upstream.init_app(app)
+    upstream.rate_limited(ADZUNA_API_BASE_URL) # adzuna_get retries 429/5xx through adzuna_limiter
+    adzuna_limiter.init_app(app)
+    flights.init_app(app)
+    search_cache.init_app(app)
+    histogram_cache.init_app(app)
+    saved_ids_cache.init_app(app)
+    user_cache.init_app(app)
+    salary_stats_cache.init_app(app)
+    password_hasher.init_app(app)
+    task_queue.init_app(app, db, Task)
+    app.cli.add_command(trends_command)
 
     # --- Register Blueprints ---
     from routes import main_bp
     app.register_blueprint(main_bp)
+    metrics.init_app(app, main_bp.name)
+    profiling.init_app(app)
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return load_cached_user(int(user_id))
 
     logger.info(f"--- EXITING create_app(), returning app: {app.name} ---")
     return app
 
 # --- Helper Functions ---
 
-def get_salary_histogram(country_code, location, job_title):
-    """ Fetches salary histogram data from Adzuna. """
-    if not ADZUNA_APP_ID or not ADZUNA_APP_KEY: return None
+# --- User Loading ---
+USER_SESSION_KEY = '_user_identity'
+
+
+def load_cached_user(user_id):
+    """
+    Flask-Login user loader. Serves a CachedUser from the per-process cache (USER_CACHE_TTL), then
+    from the identity signed into the session cookie (if USER_SESSION_IDENTITY), and only then
+    from the database (the replica if there is one). Returns None for unknown users, which logs the session out.
+    """
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    use_session = current_app.config.get('USER_SESSION_IDENTITY', False)
+    record = session.get(USER_SESSION_KEY) if use_session else None
+    if record and record.get('id') == user_id and time.time() - record.get('at', 0) < user_cache.ttl:
+        user = CachedUser(user_id, record['email'])
+    else:
+        with read_replica():
+            row = db.session.get(User, user_id)
+        if row is None:
+            return None
+        user = CachedUser(row.id, row.email)
+        if use_session:
+            session[USER_SESSION_KEY] = {'id': row.id, 'email': row.email, 'at': time.time()}
+    user_cache.set(user_id, user)
+    return user
+
+
+def invalidate_cached_user(user_id):
+    """ Forgets a cached identity; call on logout and whenever account details change. """
+    user_cache.delete(user_id)
+    if has_request_context():
+        session.pop(USER_SESSION_KEY, None)
+
+
+def utcnow():
+    """ Naive UTC timestamp, matching how DateTime columns are stored. """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def adzuna_get(url, upstream_name, params):
+    """
+    GET against the Adzuna API through the client-side rate limiter. Raises RateLimitExceeded when out of budget.
+    429/5xx answers are retried here rather than by the session, so every attempt takes a token and
+    counts against the daily quota, and a 429 slows the limiter down before the next one.
+    """
+    if upstream.replaying: # Recorded responses cost no quota
+        return upstream.get(url, upstream_name, params=params)
+    retries = upstream.settings['UPSTREAM_RETRIES']
+    for attempt in range(retries + 1):
+        adzuna_limiter.acquire()
+        response = upstream.get(url, upstream_name, params=params)
+        adzuna_limiter.record_response(response.status_code)
+        if response.status_code not in RETRY_STATUS_CODES or attempt == retries:
+            return response
+        delay = upstream.retry_delay(response, attempt)
+        logger.warning(f"Adzuna answered {response.status_code} ({upstream_name}); retrying in {delay:.2f}s.")
+        time.sleep(delay)
+
+
+def _adzuna_quota_remaining():
+    return {(): adzuna_limiter.usage()['remaining_today']} if adzuna_limiter.enabled else {}
+
+
+metrics.GaugeCallback('adzuna_quota_remaining', "Adzuna requests left in today's client-side quota.", (),
+                      _adzuna_quota_remaining)
+
+
+def _request_salary_histogram(country_code, location, job_title):
+    """
+    Fetches salary histogram data from Adzuna. Raises requests exceptions on failure.
+    Returns {} when Adzuna has no data, so that "no data" can be cached like any other answer.
+    """
     histogram_url = f"{ADZUNA_API_BASE_URL}/{country_code.lower()}/histogram"
     params = {
         'app_id': ADZUNA_APP_ID, 'app_key': ADZUNA_APP_KEY,
@@ -141,32 +398,55 @@ def get_salary_histogram(country_code, location, job_title):
         'content-type': 'application/json'
     }
     logger.info(f"Fetching salary histogram for: {params}")
+    response = adzuna_get(histogram_url, 'adzuna_histogram', params)
+    response.raise_for_status()
+    data = response.json()
+    if 'histogram' in data and data['histogram']:
+        logger.info("Successfully fetched salary histogram.")
+        stats = salary_stats.salary_stats(data['histogram'], salary_stats_cache)
+        average_salary = stats['mean'] if stats else None
+        return {"histogram": data['histogram'], "average": average_salary}
+    else:
+        logger.info("No salary histogram data found."); return {}
+
+
+def get_salary_histogram(country_code, location, job_title):
+    """ Salary histogram data (see cached_salary_histogram) with its statistics under 'stats'. """
+    return with_salary_stats(cached_salary_histogram(country_code, location, job_title))
+
+
+def cached_salary_histogram(country_code, location, job_title):
+    """
+    Returns salary histogram data, served from the stale-while-revalidate histogram cache.
+    Stale entries are returned immediately and refreshed in the background (not while the
+    Adzuna quota is low); upstream errors only surface (as None) when nothing is cached for the query.
+    """
+    if not ADZUNA_APP_ID or not ADZUNA_APP_KEY: return None
+    cache_key = normalize_query(country_code, location, job_title)
+    loader = partial(_request_salary_histogram, country_code, location, job_title)
     try:
-        response = requests.get(histogram_url, params=params, timeout=15)
-        response.raise_for_status()
-        data = response.json()
-        if 'histogram' in data and data['histogram']:
-            logger.info("Successfully fetched salary histogram.")
-            total_salary = 0; total_count = 0
-            for salary_point, count in data['histogram'].items():
-                try: total_salary += float(salary_point) * count; total_count += count
-                except ValueError: continue
-            average_salary = round(total_salary / total_count) if total_count > 0 else None
-            return {"histogram": data['histogram'], "average": average_salary}
-        else:
-            logger.info("No salary histogram data found."); return None
+        return histogram_cache.get_or_revalidate(cache_key, loader, refresh=not adzuna_limiter.budget_low()) or None
+    except RateLimitExceeded as e: logger.warning(f"Skipping salary histogram: {e}"); return None
     except requests.exceptions.Timeout: logger.error("Adzuna histogram request timed out."); return None
     except requests.exceptions.HTTPError as e: logger.error(f"Adzuna histogram HTTP Error: {e.response.status_code}. Response: {e.response.text}"); return None
     except requests.exceptions.RequestException as e: logger.error(f"Adzuna histogram connection error: {e}"); return None
     except Exception as e: logger.error(f"Unexpected error fetching salary histogram: {e}"); return None
 
 
-def get_ai_summary(query_details, total_jobs, job_listings_sample, salary_data):
-    """ Calls Azure AI model for an enhanced recruiter-focused summary. """
-    if not AZURE_AI_ENDPOINT or not AZURE_AI_KEY:
-        logger.warning("Azure AI credentials not configured. Skipping AI summary.")
-        return None
+def with_salary_stats(salary_data):
+    """ Adds 'stats' (median, percentiles and spread, memoized by histogram content) to cached salary data. """
+    if not salary_data: return None
+    return {**salary_data, 'stats': salary_stats.salary_stats(salary_data.get('histogram'), salary_stats_cache)}
+
+
+def compare_salary_histograms(histograms):
+    """ salary_stats for many histograms in one vectorized pass; only ones not seen before are computed. """
+    with profiling.timed('salary_stats'):
+        return salary_stats.compare(histograms, salary_stats_cache)
 
+
+def _ai_prompt_inputs(job_listings_sample, salary_data):
+    """ Extracts the sample titles, description excerpts and salary text that go into the AI prompt. """
     sample_titles = [job['title'] for job in job_listings_sample[:7]]
     sample_descriptions_list = [ job['description'] for job in job_listings_sample[:5] if isinstance(job.get('description'), str) ]
     combined_descriptions = "\n---\n".join(sample_descriptions_list)
@@ -177,6 +457,12 @@ def get_ai_summary(query_details, total_jobs, job_listings_sample, salary_data):
     salary_info = "Not available"
     if salary_data and salary_data.get('average'): salary_info = f"approximately {salary_data['average']:,} (currency based on country)"
     elif salary_data and salary_data.get('histogram'): salary_info = "Distribution data available, but average could not be calculated."
+    return sample_titles, combined_descriptions, salary_info
+
+
+def build_ai_request(query_details, total_jobs, job_listings_sample, salary_data):
+    """ Builds the Azure chat-completions (payload, headers) for the recruiter-focused summary. """
+    sample_titles, combined_descriptions, salary_info = _ai_prompt_inputs(job_listings_sample, salary_data)
 
     system_message = (
         "You are an AI assistant providing recruitment market analysis for a recruiter. "
@@ -203,6 +489,16 @@ def get_ai_summary(query_details, total_jobs, job_listings_sample, salary_data):
         "temperature": 0.3
     }
     headers = { 'Content-Type': 'application/json', 'api-key': AZURE_AI_KEY }
+    return payload, headers
+
+
+def get_ai_summary(query_details, total_jobs, job_listings_sample, salary_data):
+    """ Calls Azure AI model for an enhanced recruiter-focused summary. """
+    if not AZURE_AI_ENDPOINT or not AZURE_AI_KEY:
+        logger.warning("Azure AI credentials not configured. Skipping AI summary.")
+        return None
+
+    payload, headers = build_ai_request(query_details, total_jobs, job_listings_sample, salary_data)
 
     # --- ADDED LOGGING ---
     logger.info(f"Attempting to call Azure AI Endpoint: {AZURE_AI_ENDPOINT}")
@@ -210,7 +506,7 @@ def get_ai_summary(query_details, total_jobs, job_listings_sample, salary_data):
         # Log the payload before sending (use json.dumps for pretty printing)
         logger.debug(f"Azure AI Request Payload:\n{json.dumps(payload, indent=2)}")
 
-        response = requests.post(AZURE_AI_ENDPOINT, headers=headers, json=payload, timeout=30)
+        response = upstream.post(AZURE_AI_ENDPOINT, 'azure_ai', headers=headers, json=payload)
         response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
         response_data = response.json()
 
@@ -241,6 +537,311 @@ def get_ai_summary(query_details, total_jobs, job_listings_sample, salary_data):
         return None
 
 
+# Bump when the prompt wording changes so cached summaries from the old prompt stop matching.
+AI_PROMPT_VERSION = 1
+
+
+def _count_bucket(total_jobs):
+    """ Rounds a job count to 2 significant figures (1523 -> 1500) so small day-to-day changes share a cache entry. """
+    try: return int(float(f"{int(total_jobs):.2g}"))
+    except (TypeError, ValueError): return 0
+
+
+def ai_summary_cache_key(query_details, total_jobs, job_listings_sample, salary_data):
+    """ SHA-256 over everything that shapes the AI prompt (query, count bucket, titles, excerpts, salary). """
+    sample_titles, combined_descriptions, salary_info = _ai_prompt_inputs(job_listings_sample, salary_data)
+    prompt_inputs = {
+        'version': AI_PROMPT_VERSION,
+        'query': normalize_query(query_details['what'], query_details['where'], query_details['country']),
+        'count_bucket': _count_bucket(total_jobs),
+        'titles': sample_titles,
+        'descriptions': combined_descriptions,
+        'salary': salary_info,
+    }
+    encoded = json.dumps(prompt_inputs, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def render_ai_summary(summary_markdown):
+    with profiling.timed('markdown'):
+        return markdown.markdown(summary_markdown, extensions=['fenced_code', 'tables'])
+
+
+_ai_cache_hits = metrics.CACHE_REQUESTS.labels('ai_summary', 'hit')
+_ai_cache_misses = metrics.CACHE_REQUESTS.labels('ai_summary', 'miss')
+
+
+def load_cached_ai_summary(prompt_hash):
+    """ Returns the cached, pre-rendered summary HTML for prompt_hash, or None. """
+    try:
+        entry = db.session.get(AISummaryCache, prompt_hash)
+        if entry is not None and entry.expires_at > utcnow():
+            logger.info("AI summary served from cache.")
+            _ai_cache_hits.inc()
+            return entry.summary_html
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Could not read AI summary cache: {e}")
+    _ai_cache_misses.inc()
+    return None
+
+
+def store_ai_summary(prompt_hash, summary_markdown, summary_html):
+    """ Saves a summary and its HTML, then runs the expiry/size eviction sweep. """
+    now = utcnow()
+    entry = AISummaryCache(prompt_hash=prompt_hash, summary_markdown=summary_markdown, summary_html=summary_html,
+                           size_bytes=len(summary_markdown.encode('utf-8')) + len(summary_html.encode('utf-8')),
+                           created_at=now, expires_at=now + timedelta(seconds=current_app.config['AI_SUMMARY_CACHE_TTL']))
+    try:
+        db.session.merge(entry)
+        db.session.commit()
+        sweep_ai_summary_cache()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Could not store AI summary in cache: {e}")
+
+
+def sweep_ai_summary_cache():
+    """ Deletes expired summaries, then the oldest ones until the table fits AI_SUMMARY_CACHE_MAX_BYTES. """
+    max_bytes = current_app.config['AI_SUMMARY_CACHE_MAX_BYTES']
+    removed = AISummaryCache.query.filter(AISummaryCache.expires_at <= utcnow()).delete(synchronize_session=False)
+    total_bytes = db.session.query(db.func.coalesce(db.func.sum(AISummaryCache.size_bytes), 0)).scalar()
+    if total_bytes > max_bytes:
+        oldest = db.session.query(AISummaryCache.prompt_hash, AISummaryCache.size_bytes).order_by(AISummaryCache.created_at)
+        doomed = []
+        for prompt_hash, size_bytes in oldest.yield_per(200):
+            if total_bytes <= max_bytes:
+                break
+            doomed.append(prompt_hash)
+            total_bytes -= size_bytes
+        removed += AISummaryCache.query.filter(AISummaryCache.prompt_hash.in_(doomed)).delete(synchronize_session=False)
+    db.session.commit()
+    if removed:
+        logger.info(f"AI summary cache sweep removed {removed} entries.")
+    return removed
+
+
+def get_ai_summary_html(query_details, total_jobs, job_listings_sample, salary_data):
+    """
+    Returns the AI summary as safe HTML, using the persistent summary cache.
+    A cache hit costs no Azure tokens and no markdown rendering.
+    """
+    if not AZURE_AI_ENDPOINT or not AZURE_AI_KEY:
+        logger.warning("Azure AI credentials not configured. Skipping AI summary.")
+        return None
+    prompt_hash = ai_summary_cache_key(query_details, total_jobs, job_listings_sample, salary_data)
+    cached_html = load_cached_ai_summary(prompt_hash)
+    if cached_html is not None:
+        return Markup(cached_html)
+
+    def generate():
+        summary_markdown = get_ai_summary(query_details, total_jobs, job_listings_sample, salary_data)
+        if not summary_markdown:
+            return None
+        summary_html = render_ai_summary(summary_markdown)
+        store_ai_summary(prompt_hash, summary_markdown, summary_html)
+        return summary_html
+
+    # Identical prompts arriving together share one Azure call.
+    summary_html = flights.do(f"ai:{prompt_hash}", generate, recheck=partial(load_cached_ai_summary, prompt_hash))
+    return Markup(summary_html) if summary_html else None
+
+
+def stream_ai_summary(query_details, total_jobs, job_listings_sample, salary_data):
+    """
+    Streams the Azure completion as it is generated. Yields ('chunk', text) for each
+    delta, then a final ('html', rendered_html) once the summary is complete, which is
+    also written to the summary cache. A cache hit yields only the ('html', ...) event.
+    Raises requests exceptions on upstream failure.
+    """
+    if not AZURE_AI_ENDPOINT or not AZURE_AI_KEY:
+        logger.warning("Azure AI credentials not configured. Skipping AI summary.")
+        return
+    prompt_hash = ai_summary_cache_key(query_details, total_jobs, job_listings_sample, salary_data)
+    cached_html = load_cached_ai_summary(prompt_hash)
+    if cached_html is not None:
+        yield 'html', cached_html
+        return
+
+    payload, headers = build_ai_request(query_details, total_jobs, job_listings_sample, salary_data)
+    payload['stream'] = True
+    logger.info(f"Streaming AI summary from Azure AI Endpoint: {AZURE_AI_ENDPOINT}")
+    parts = []
+    with upstream.post(AZURE_AI_ENDPOINT, 'azure_ai', headers=headers, json=payload, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            data = line[len('data:'):].strip()
+            if data == '[DONE]':
+                break
+            try:
+                choices = json.loads(data).get('choices') or [{}]
+            except ValueError:
+                logger.warning(f"Skipping malformed Azure AI stream line: {data[:200]}")
+                continue
+            text = (choices[0].get('delta') or {}).get('content')
+            if text:
+                parts.append(text)
+                yield 'chunk', text
+
+    summary_markdown = ''.join(parts).strip()
+    if not summary_markdown:
+        logger.warning("Azure AI stream finished without any content.")
+        return
+    summary_html = render_ai_summary(summary_markdown)
+    store_ai_summary(prompt_hash, summary_markdown, summary_html)
+    yield 'html', summary_html
+
+
+# --- Saved-Job Listing and Export ---
+SAVED_JOB_EXPORT_FIELDS = ('id', 'adzuna_job_id', 'title', 'company', 'location', 'adzuna_url')
+
+
+def saved_jobs_page(user_id, before_id=None, per_page=50):
+    """
+    One page of a user's saved jobs, newest first, using keyset pagination on (user_id, id):
+    the next page starts below the last ID shown, so every page is an index range scan
+    however deep the user pages. Each job's stored listing (full description) is joined in, and
+    the page is read from the replica if there is one. Returns (jobs, next_before_id or None).
+    """
+    query = SavedJob.query.filter(SavedJob.user_id == user_id)
+    if before_id is not None:
+        query = query.filter(SavedJob.id < before_id)
+    with read_replica():
+        jobs = query.options(db.joinedload(SavedJob.listing)).order_by(SavedJob.id.desc()).limit(per_page + 1).all()
+    if len(jobs) > per_page:
+        return jobs[:per_page], jobs[per_page - 1].id
+    return jobs, None
+
+
+def iter_saved_jobs(user_id, batch_size=500):
+    """
+    Yields every saved job of a user as a dict, newest first, fetching batch_size rows at a time
+    through a server-side cursor (stream_results) so memory stays flat for any number of rows.
+    """
+    columns = [getattr(SavedJob, field) for field in SAVED_JOB_EXPORT_FIELDS]
+    statement = (select(*columns).where(SavedJob.user_id == user_id).order_by(SavedJob.id.desc())
+                 .execution_options(yield_per=batch_size, stream_results=True))
+    with read_replica():
+        result = db.session.execute(statement)
+    for row in result:
+        yield row._asdict()
+
+
+# --- Saved-Job Status Lookups ---
+def saved_job_ids_for(user_id, adzuna_job_ids):
+    """
+    Returns which of the given Adzuna job IDs the user has saved. Only IDs not already in the
+    per-user cache are queried, selecting just the ID column through the (user_id, adzuna_job_id)
+    unique index, so the cost depends on the listings shown rather than on how many jobs are saved.
+    The lookup reads the primary, not the replica: answers are cached until the next save/unsave,
+    so a lagging replica read would keep a just-saved job showing as unsaved.
+    """
+    wanted = {job_id for job_id in adzuna_job_ids if job_id}
+    if not wanted:
+        return set()
+    known = saved_ids_cache.get(user_id) or {} # adzuna_job_id -> saved?
+    missing = wanted - known.keys()
+    if missing:
+        known = dict(known)
+        known.update(dict.fromkeys(missing, False))
+        rows = (db.session.query(SavedJob.adzuna_job_id)
+                .filter(SavedJob.user_id == user_id, SavedJob.adzuna_job_id.in_(missing)).all())
+        known.update((job_id, True) for (job_id,) in rows)
+        saved_ids_cache.set(user_id, known)
+    return {job_id for job_id in wanted if known[job_id]}
+
+
+def invalidate_saved_job_ids(user_id):
+    """ Drops the user's cached saved-job statuses; call after any save/unsave commits. """
+    saved_ids_cache.delete(user_id)
+
+
+SAVED_JOB_FIELDS = ('adzuna_job_id', 'title', 'company', 'location', 'adzuna_url')
+
+
+def save_jobs(user_id, jobs):
+    """
+    Saves many jobs for a user in one INSERT ... ON CONFLICT (user_id, adzuna_job_id) DO NOTHING,
+    so concurrent saves cannot race (other databases use _insert_missing_saved_jobs). Returns one
+    {'adzuna_job_id', 'status'} per input item, with status 'saved', 'already_saved' or 'invalid'.
+    The caller commits.
+    """
+    rows = {}
+    for job in jobs:
+        if _valid_saved_job(job):
+            row = {field: _fit(field, job.get(field), SavedJob) for field in SAVED_JOB_FIELDS}
+            rows.setdefault(job['adzuna_job_id'], row | {'user_id': user_id})
+    inserted = set()
+    insert = {'postgresql': postgresql_insert, 'sqlite': sqlite_insert}.get(db.session.get_bind().dialect.name)
+    if rows and insert is None:
+        inserted = _insert_missing_saved_jobs(user_id, rows)
+    elif rows:
+        statement = (insert(SavedJob).values(list(rows.values()))
+                     .on_conflict_do_nothing(index_elements=['user_id', 'adzuna_job_id'])
+                     .returning(SavedJob.adzuna_job_id))
+        inserted = {job_id for (job_id,) in db.session.execute(statement)}
+
+    results = []
+    for job in jobs:
+        job_id = job.get('adzuna_job_id') if isinstance(job, dict) else None
+        if not _valid_saved_job(job): status = 'invalid'
+        elif job_id in inserted: status = 'saved'; inserted.discard(job_id) # a repeated ID is reported once as saved
+        else: status = 'already_saved'
+        results.append({'adzuna_job_id': job_id, 'status': status})
+    return results
+
+
+def _insert_missing_saved_jobs(user_id, rows):
+    """
+    Portable save for databases without ON CONFLICT: selects which IDs are already saved, then
+    inserts the rest, each in a savepoint so one lost race (a unique violation) only skips that row.
+    Returns the set of IDs inserted.
+    """
+    existing = set(db.session.scalars(select(SavedJob.adzuna_job_id).where(
+        SavedJob.user_id == user_id, SavedJob.adzuna_job_id.in_(list(rows)))))
+    inserted = set()
+    for job_id, row in rows.items():
+        if job_id in existing:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(sql_insert(SavedJob).values(row))
+            inserted.add(job_id)
+        except IntegrityError: # Saved concurrently
+            pass
+    return inserted
+
+
+def _valid_saved_job(job):
+    """ Required fields are non-empty strings, optional ones strings or missing; IDs must fit their column. """
+    return (isinstance(job, dict)
+            and all(isinstance(job.get(field), str) and job.get(field) for field in ('adzuna_job_id', 'title', 'adzuna_url'))
+            and all(isinstance(job.get(field), (str, type(None))) for field in ('company', 'location'))
+            and len(job['adzuna_job_id']) <= SavedJob.__table__.c.adzuna_job_id.type.length)
+
+
+def unsave_jobs(user_id, adzuna_job_ids):
+    """
+    Removes many saved jobs in one DELETE ... WHERE adzuna_job_id IN (...).
+    Returns one {'adzuna_job_id', 'status'} per input ID, with status 'removed' or 'not_found'. The caller commits.
+    """
+    wanted = {job_id for job_id in adzuna_job_ids if isinstance(job_id, str) and job_id}
+    removed = set()
+    if wanted:
+        statement = (sql_delete(SavedJob)
+                     .where(SavedJob.user_id == user_id, SavedJob.adzuna_job_id.in_(wanted))
+                     .returning(SavedJob.adzuna_job_id))
+        removed = {job_id for (job_id,) in db.session.execute(statement)}
+    results = []
+    for job_id in adzuna_job_ids:
+        status = 'removed' if job_id in removed else 'not_found'
+        removed.discard(job_id)
+        results.append({'adzuna_job_id': job_id, 'status': status})
+    return results
+
+
 def extract_adzuna_job_id(url):
     """Extracts the Adzuna job ID from the redirect URL."""
     if not url: return None
@@ -258,87 +859,540 @@ def extract_adzuna_job_id(url):
     except Exception as e: logger.error(f"Error parsing Adzuna URL {url}: {e}"); return None
 
 
+# --- Job Listing Store ---
+JOB_LISTING_FIELDS = {'title': 'title', 'company': 'company', 'location': 'location',
+                      'description': 'description', 'adzuna_url': 'url', 'created': 'created'} # column -> listing key
+_next_listing_sweep = 0.0
+
+
+def record_job_listings(country, job_listings):
+    """
+    Upserts freshly fetched listings into job_listing in one INSERT ... ON CONFLICT (adzuna_job_id)
+    DO UPDATE, refreshing their details and last_seen_at. Runs in its own transaction and never
+    raises: the store is a by-product of searching, not part of it (search_adzuna queues it on the
+    background pool).
+    """
+    if not job_listings or not current_app.config.get('JOB_LISTING_STORE_ENABLED', True):
+        return
+    now = utcnow()
+    rows = {}
+    for job in job_listings:
+        row = {column: _fit(column, job.get(key)) for column, key in JOB_LISTING_FIELDS.items()}
+        rows[job['adzuna_job_id']] = row | {'adzuna_job_id': job['adzuna_job_id'], 'country': country.lower(),
+                                            'first_seen_at': now, 'last_seen_at': now}
+    try:
+        with profiling.timed('listing_store'), db.engine.begin() as connection:
+            dialect = connection.dialect.name
+            if dialect == 'postgresql': insert = postgresql_insert
+            elif dialect == 'sqlite': insert = sqlite_insert
+            else: logger.debug(f"Job listing store needs ON CONFLICT support; {dialect} is not supported."); return
+            statement = insert(JobListing).values(list(rows.values()))
+            updated = {column: statement.excluded[column] for column in (*JOB_LISTING_FIELDS, 'country', 'last_seen_at')}
+            connection.execute(statement.on_conflict_do_update(index_elements=['adzuna_job_id'], set_=updated))
+        sweep_job_listings()
+    except Exception as e:
+        logger.error(f"Could not store {len(rows)} job listings: {e}")
+
+
+def _fit(column, value, model=None):
+    """ Truncates a value to its column's length in model (JobListing by default); Postgres rejects longer strings. """
+    length = getattr((model or JobListing).__table__.c[column].type, 'length', None)
+    return value[:length] if isinstance(value, str) and length else value
+
+
+def sweep_job_listings():
+    """ Deletes listings not seen for JOB_LISTING_RETENTION_DAYS; runs at most once an hour per process. """
+    global _next_listing_sweep
+    if time.monotonic() < _next_listing_sweep:
+        return 0
+    _next_listing_sweep = time.monotonic() + 3600
+    cutoff = utcnow() - timedelta(days=current_app.config.get('JOB_LISTING_RETENTION_DAYS', 30))
+    with db.engine.begin() as connection:
+        removed = connection.execute(sql_delete(JobListing).where(JobListing.last_seen_at < cutoff)).rowcount
+    if removed:
+        logger.info(f"Job listing sweep removed {removed} listings not seen since {cutoff:%Y-%m-%d}.")
+    return removed
+
+
+def search_local_listings(country, what, where, page=1):
+    """
+    Answers a search from job_listing: (total_jobs, job_listings) for the page, like search_adzuna,
+    or None when fewer than LOCAL_SEARCH_MIN_RESULTS listings seen in the last LOCAL_SEARCH_MAX_AGE
+    seconds match (the corpus is too thin or stale to stand in for Adzuna).
+    """
+    cfg = current_app.config
+    since = utcnow() - timedelta(seconds=cfg.get('LOCAL_SEARCH_MAX_AGE', 6 * 3600))
+    try:
+        with profiling.timed('local_search'), db.engine.connect() as connection:
+            total, listings = search_listings(connection, country, what, where, since,
+                                              limit=RESULTS_PER_PAGE, offset=(page - 1) * RESULTS_PER_PAGE)
+    except Exception as e:
+        logger.error(f"Local listing search failed for '{what}' in '{where}': {e}")
+        return None
+    if total < max(1, cfg.get('LOCAL_SEARCH_MIN_RESULTS', RESULTS_PER_PAGE)):
+        return None
+    logger.info(f"Answered '{what}' in '{where}' (page {page}) from {total} stored listings.")
+    return total, listings
+
+
 # --- Main Data Fetching Logic ---
-def fetch_market_insights(what, where, country, generate_summary=True): # Added generate_summary flag
+def search_adzuna(country, what, where, page=1):
+    """
+    Calls the Adzuna search API for one results page and normalises the listings.
+    Returns (total_jobs, job_listings). Raises requests exceptions on failure so the
+    caller (which owns the request context) can decide how to report them.
+    """
+    api_url = f"{ADZUNA_API_BASE_URL}/{country.lower()}/search/{page}"
+    params = { 'app_id': ADZUNA_APP_ID, 'app_key': ADZUNA_APP_KEY, 'what': what, 'where': where, 'results_per_page': RESULTS_PER_PAGE, 'content-type': 'application/json' }
+    logger.info(f"Fetching Adzuna data for: {params}")
+    response = adzuna_get(api_url, 'adzuna_search', params)
+    response.raise_for_status()
+    adzuna_data = response.json()
+    logger.info("Successfully fetched data from Adzuna.")
+
+    job_listings = []
+    total_jobs = adzuna_data.get('count', 0)
+    results = adzuna_data.get('results', [])
+    for job in results:
+        adzuna_url = job.get('redirect_url')
+        adzuna_job_id = extract_adzuna_job_id(adzuna_url)
+        if adzuna_job_id: job_listings.append({ "adzuna_job_id": adzuna_job_id, "title": job.get('title'), "company": job.get('company', {}).get('display_name', 'N/A'), "location": job.get('location', {}).get('display_name', 'N/A'), "description": job.get('description', 'No description available.'), "url": adzuna_url, "created": job.get('created') })
+        else: logger.warning(f"Skipping job due to missing Adzuna ID: {job.get('title')}")
+    try: # Stored off the request path: the search (and any single-flight waiters) never waits on the upsert
+        submit_background(record_job_listings, country, job_listings)
+    except RuntimeError as e: # pool shut down
+        logger.warning(f"Could not queue {len(job_listings)} job listings for storage: {e}")
+    return total_jobs, job_listings
+
+
+def get_search_results(country, what, where, page=1):
     """
-    Fetches job listings, salary data, and optionally AI summary.
-    Returns an 'insights_data' dictionary or None if a critical error occurs.
+    Returns (total_jobs, job_listings) for one Adzuna results page, served from the search cache when possible.
+    While the Adzuna quota is low, or if the rate limiter turns the call away, an expired cache entry is served instead.
+    LOCAL_SEARCH_MODE 'prefer' answers from the stored listings first; 'fallback' uses them when Adzuna cannot be used.
+    """
+    local_mode = current_app.config.get('LOCAL_SEARCH_MODE', 'off')
+    if local_mode == 'prefer':
+        local = search_local_listings(country, what, where, page)
+        if local is not None:
+            return local
+    search_key = normalize_query(country, what, where, page)
+    if adzuna_limiter.budget_low():
+        stale = search_cache.get(search_key, allow_stale=True)
+        if stale is None and local_mode == 'fallback':
+            stale = search_local_listings(country, what, where, page)
+        if stale is not None:
+            logger.info(f"Adzuna budget low: serving cached results for '{what}' in '{where}' (page {page}).")
+            return stale
+    try:
+        return search_cache.get_or_load(search_key, partial(search_adzuna, country, what, where, page))
+    except RateLimitExceeded:
+        stale = search_cache.get(search_key, allow_stale=True)
+        if stale is None and local_mode == 'fallback':
+            stale = search_local_listings(country, what, where, page)
+        if stale is None:
+            raise
+        logger.warning(f"Adzuna rate limited: serving expired cached results for '{what}' in '{where}' (page {page}).")
+        return stale
+    except requests.exceptions.RequestException:
+        local = search_local_listings(country, what, where, page) if local_mode == 'fallback' else None
+        if local is None:
+            raise
+        logger.warning(f"Adzuna unavailable: serving stored listings for '{what}' in '{where}' (page {page}).")
+        return local
+
+
+def prefetch_search_pages(country, what, where, adzuna_pages):
+    """ Warms the search cache with the given Adzuna pages in the background (fire-and-forget). """
+    if not search_cache.enabled or adzuna_limiter.budget_low():
+        return
+    for page in adzuna_pages:
+        if not search_cache.contains(normalize_query(country, what, where, page)):
+            logger.info(f"Prefetching Adzuna results page {page} for '{what}' in '{where}'.")
+            submit_background(_prefetch_search_page, country, what, where, page)
+
+
+def _prefetch_search_page(country, what, where, page):
+    try:
+        get_search_results(country, what, where, page)
+    except Exception as e:
+        logger.warning(f"Prefetch of Adzuna results page {page} failed: {e}")
+
+
+def gather_summary_inputs(what, where, country):
+    """
+    Fetches (in parallel, normally straight from the caches) the search results and salary
+    data the AI prompt is built from. Returns (total_jobs, job_listings, salary_data).
+    Raises the search error if the search failed.
+    """
+    pipeline = StagePipeline()
+    pipeline.add('search', partial(get_search_results, country, what, where))
+    pipeline.add('histogram', partial(get_salary_histogram, country, where, what))
+    outcome = pipeline.run()
+    if 'search' in outcome.errors:
+        raise outcome.errors['search']
+    total_jobs, job_listings = outcome.get('search')
+    return total_jobs, job_listings, outcome.get('histogram')
+
+
+class InsightsError(Exception):
+    """ A user-facing failure of the fetch pipeline (flashed by fetch_market_insights, reported per row in reports). """
+
+
+def fetch_market_insights(what, where, country, generate_summary=True, page=1, pages=1): # Added generate_summary flag
+    """
+    Fetches job listings, salary data, and optionally AI summary for the results page.
+    Returns an 'insights_data' dictionary or None (after flashing the reason) if a critical error occurs.
+    """
+    try:
+        return collect_market_insights(what, where, country, generate_summary=generate_summary, page=page, pages=pages)
+    except InsightsError as e:
+        flash(str(e), "error")
+        return None
+
+
+def collect_market_insights(what, where, country, generate_summary=True, page=1, pages=1, prefetch=True):
+    """
+    Builds the 'insights_data' dictionary without touching the request context, so it can
+    also run on worker threads (reports, tasks). Raises InsightsError on critical errors.
+    `page` is the page shown to the user and `pages` how many Adzuna result pages (of
+    RESULTS_PER_PAGE) it spans; those pages, the histogram and the AI summary run in
+    parallel on the shared upstream pool, and (if `prefetch`) the following page is loaded
+    into the search cache afterwards so the "Next" click is served from memory.
     """
 
     logger.info(f"RUNTIME IN fetch_market_insights - ADZUNA_APP_ID: '{ADZUNA_APP_ID}'")
     logger.info(f"RUNTIME IN fetch_market_insights - ADZUNA_APP_KEY: '{ADZUNA_APP_KEY}'")
     
-    logger.info(f"Fetching insights for: what='{what}', where='{where}', country='{country}', generate_summary={generate_summary}")
+    logger.info(f"Fetching insights for: what='{what}', where='{where}', country='{country}', generate_summary={generate_summary}, page={page}, pages={pages}")
     if not all([what, where, country]):
-        flash("Missing search criteria.", "error")
-        return None
+        raise InsightsError("Missing search criteria.")
 
     if not ADZUNA_APP_ID or not ADZUNA_APP_KEY:
-        flash("Adzuna API credentials not configured.", "error")
-        return None
-
-    # Initialize data containers
-    insights_data = None
-    adzuna_data = None
-    job_listings = []
-    total_jobs = 0
-    salary_data = None
-    ai_summary_html = None # Default to None
+        raise InsightsError("Adzuna API credentials not configured.")
 
     query_details = {'what': what, 'where': where, 'country': country}
+    first_adzuna_page = (page - 1) * pages + 1
+    adzuna_pages = list(range(first_adzuna_page, first_adzuna_page + pages))
 
-    # --- 1. Call Adzuna Search API ---
-    api_url = f"{ADZUNA_API_BASE_URL}/{country.lower()}/search/1"
-    params = { 'app_id': ADZUNA_APP_ID, 'app_key': ADZUNA_APP_KEY, 'what': what, 'where': where, 'results_per_page': RESULTS_PER_PAGE, 'content-type': 'application/json' }
-    try:
-        logger.info(f"Fetching Adzuna data for: {params}")
-        response = requests.get(api_url, params=params, timeout=20)
-        response.raise_for_status()
-        adzuna_data = response.json()
-        logger.info("Successfully fetched data from Adzuna.")
-
-        total_jobs = adzuna_data.get('count', 0)
-        results = adzuna_data.get('results', [])
-        for job in results:
-            adzuna_url = job.get('redirect_url')
-            adzuna_job_id = extract_adzuna_job_id(adzuna_url)
-            if adzuna_job_id: job_listings.append({ "adzuna_job_id": adzuna_job_id, "title": job.get('title'), "company": job.get('company', {}).get('display_name', 'N/A'), "location": job.get('location', {}).get('display_name', 'N/A'), "description": job.get('description', 'No description available.'), "url": adzuna_url, "created": job.get('created') })
-            else: logger.warning(f"Skipping job due to missing Adzuna ID: {job.get('title')}")
-
-    except requests.exceptions.Timeout: flash("Adzuna search request timed out. Please try again.", "error"); return None
-    except requests.exceptions.HTTPError as e: flash(f"Adzuna API Error ({e.response.status_code}). Please check search terms or try again later.", "error"); return None
-    except requests.exceptions.RequestException as e: flash("Could not connect to Adzuna. Please check your connection or try again later.", "error"); return None
-    except Exception as e: logger.error(f"Unexpected error during Adzuna search: {e}"); flash("An internal server error occurred while fetching job listings.", "error"); return None
-
-    # --- 2. Call Adzuna Histogram (Salary) ---
-    salary_data = get_salary_histogram(country, where, what)
-
-    # --- 3. Call Azure AI Summary (Conditional) ---
+    # --- 1 & 2. Adzuna Search pages and Histogram (Salary) in parallel ---
+    pipeline = StagePipeline()
+    for adzuna_page in adzuna_pages:
+        pipeline.add(f'search_{adzuna_page}', partial(get_search_results, country, what, where, adzuna_page))
+    pipeline.add('histogram', partial(get_salary_histogram, country, where, what))
+
+    # --- 3. Azure AI Summary (Conditional) ---
+    # The summary always describes the market as seen on the first results page (so every page
+    # shares one cached summary), and includes the salary estimate, so it waits on both.
     if generate_summary: # Only call if the flag is True
-        logger.info("Generate summary flag is true, calling get_ai_summary.")
-        ai_summary_raw = get_ai_summary(query_details, total_jobs, job_listings[:10], salary_data)
-        if ai_summary_raw:
-            html_summary = markdown.markdown(ai_summary_raw, extensions=['fenced_code', 'tables'])
-            ai_summary_html = Markup(html_summary)
+        logger.info("Generate summary flag is true, scheduling get_ai_summary_html.")
+        if 1 not in adzuna_pages:
+            pipeline.add('search_1', partial(get_search_results, country, what, where, 1))
+        pipeline.add('ai_summary',
+                     lambda search, salary: get_ai_summary_html(query_details, search[0], search[1][:10], salary),
+                     after=('search_1', 'histogram'))
+    else:
+        logger.info("Generate summary flag is false, skipping AI summary call.")
+
+    outcome = pipeline.run()
+
+    search_error = outcome.errors.get(f'search_{first_adzuna_page}')
+    if search_error is not None:
+        if isinstance(search_error, RateLimitExceeded): logger.warning(f"Adzuna search turned away by rate limiter: {search_error}"); raise InsightsError("Job search is busy right now. Please try again in a minute.")
+        elif isinstance(search_error, requests.exceptions.Timeout): raise InsightsError("Adzuna search request timed out. Please try again.")
+        elif isinstance(search_error, requests.exceptions.HTTPError): raise InsightsError(f"Adzuna API Error ({search_error.response.status_code}). Please check search terms or try again later.")
+        elif isinstance(search_error, requests.exceptions.RequestException): raise InsightsError("Could not connect to Adzuna. Please check your connection or try again later.")
+        else: logger.error(f"Unexpected error during Adzuna search: {search_error}"); raise InsightsError("An internal server error occurred while fetching job listings.")
+
+    total_jobs, job_listings = outcome.get(f'search_{first_adzuna_page}')
+    job_listings = list(job_listings)
+    for adzuna_page in adzuna_pages[1:]:
+        if outcome.ok(f'search_{adzuna_page}'):
+            job_listings.extend(outcome.get(f'search_{adzuna_page}')[1])
         else:
+            logger.warning(f"Adzuna results page {adzuna_page} failed, showing a partial page: {outcome.errors.get(f'search_{adzuna_page}')}")
+
+    total_pages = max(1, math.ceil(total_jobs / (RESULTS_PER_PAGE * pages)))
+    if prefetch and page < total_pages:
+        prefetch_search_pages(country, what, where, [p + pages for p in adzuna_pages])
+    salary_data = outcome.get('histogram')
+    if 'histogram' in outcome.errors:
+        logger.error(f"Unexpected error fetching salary histogram: {outcome.errors['histogram']}")
+
+    ai_summary_html = None # Default to None
+    if generate_summary:
+        ai_summary_html = outcome.get('ai_summary')
+        if not ai_summary_html:
             logger.warning("AI summary generation was requested but failed or returned no content.")
             # Optionally flash a message here if desired
             # flash("Could not generate AI summary.", "warning")
-    else:
-        logger.info("Generate summary flag is false, skipping AI summary call.")
 
+    # --- 4. Skills mentioned across every listing on the page (local, no upstream call) ---
+    with profiling.timed('skills'):
+        skills = top_skills(job_listings, current_app.config.get('TOP_SKILLS_SHOWN', 15))
 
-    # --- 4. Assemble final insights ---
+    # --- 5. Assemble final insights ---
     insights_data = {
         "query": query_details,
         "total_matching_jobs": total_jobs,
         "job_listings": job_listings,
         "salary_data": salary_data,
-        "ai_summary_html": ai_summary_html # Will be None if generate_summary was False or AI failed
+        "ai_summary_html": ai_summary_html, # Will be None if generate_summary was False or AI failed
+        "top_skills": skills,
+        "page": page,
+        "pages": pages,
+        "total_pages": total_pages,
+        "timings": dict(outcome.timings, total=outcome.total_ms)
     }
     return insights_data
 
 
+# --- Bulk Market Reports ---
+REPORT_FIELDS = ['what', 'where', 'country', 'status', 'total_matching_jobs', 'average_salary', 'median_salary',
+                 'salary_p25', 'salary_p75', 'error', 'elapsed_ms']
+
+
+def build_report_row(query):
+    """ Runs the fetch pipeline (no AI summary) for one report query and flattens it into a row. """
+    started = time.perf_counter()
+    row = {'what': query.get('what'), 'where': query.get('where'), 'country': query.get('country'),
+           'status': 'ok', 'total_matching_jobs': None, 'average_salary': None, 'median_salary': None,
+           'salary_p25': None, 'salary_p75': None, 'error': None}
+    try:
+        with adzuna_limiter.patient(): # Reports are paced by the limiter rather than failed by it
+            insights = collect_market_insights(row['what'], row['where'], row['country'], generate_summary=False,
+                                               prefetch=False)
+        row['total_matching_jobs'] = insights['total_matching_jobs']
+        row['average_salary'] = (insights['salary_data'] or {}).get('average')
+        stats = (insights['salary_data'] or {}).get('stats') or {}
+        row.update(median_salary=stats.get('median'), salary_p25=stats.get('p25'), salary_p75=stats.get('p75'))
+    except InsightsError as e:
+        row.update(status='error', error=str(e))
+    except Exception as e:
+        logger.error(f"Unexpected error building report row for {query}: {e}", exc_info=True)
+        row.update(status='error', error='Internal error.')
+    row['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return row
+
+
+def iter_market_report(queries, max_concurrency):
+    """
+    Yields report rows as they complete (not in input order), running at most
+    `max_concurrency` queries at a time. Each row still fans its search and histogram
+    out over the shared upstream pool, which bounds total upstream concurrency.
+    """
+    pending = list(queries)
+    in_flight = set()
+    build_row = with_app_context(build_report_row)
+    with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='report') as report_pool:
+        while pending or in_flight:
+            while pending and len(in_flight) < max_concurrency:
+                in_flight.add(report_pool.submit(build_row, pending.pop(0)))
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+# --- Salary Comparisons ---
+def compare_salaries(queries):
+    """
+    Salary statistics for many (what, where, country) queries side by side. Histograms are fetched
+    concurrently (normally straight from the histogram cache) and summarized together in one pass.
+    Returns one {'what', 'where', 'country', 'stats'} per query, in input order; stats is None without data.
+    """
+    pipeline = StagePipeline()
+    for i, query in enumerate(queries):
+        pipeline.add(f'histogram_{i}', partial(cached_salary_histogram, query['country'], query['where'], query['what']))
+    outcome = pipeline.run()
+    for name, error in outcome.errors.items():
+        logger.error(f"Unexpected error fetching salary histogram for comparison ({name}): {error}")
+    histograms = [(outcome.get(f'histogram_{i}') or {}).get('histogram') for i in range(len(queries))]
+    return [{'what': query['what'], 'where': query['where'], 'country': query['country'], 'stats': stats}
+            for query, stats in zip(queries, compare_salary_histograms(histograms))]
+
+
+# --- Market Trends ---
+def track_query(what, where, country):
+    """
+    Starts snapshotting a search (returning the existing row if it is already tracked) and queues
+    its first snapshot. Returns None once TREND_MAX_TRACKED_QUERIES searches are tracked.
+    """
+    key = normalize_query(country, what, where)
+    tracked = TrackedQuery.query.filter_by(query_key=key).first()
+    if tracked is not None:
+        return tracked
+    if TrackedQuery.query.count() >= current_app.config.get('TREND_MAX_TRACKED_QUERIES', 200):
+        return None
+    tracked = TrackedQuery(query_key=key, what=' '.join(what.split())[:200], location=' '.join(where.split())[:200],
+                           country=country.lower()[:2], created_at=utcnow())
+    db.session.add(tracked)
+    try:
+        db.session.commit()
+    except IntegrityError: # Tracked by someone else in the meantime
+        db.session.rollback()
+        return TrackedQuery.query.filter_by(query_key=key).first()
+    logger.info(f"Tracking market trend for {key}.")
+    task_queue.enqueue('market_snapshots', key=f"market_snapshots:new:{tracked.id}", priority=-10)
+    return tracked
+
+
+def market_trend(what, where, country, days):
+    """
+    Snapshots of a search from the last `days` days, oldest first, in one indexed query (no Adzuna
+    calls). Returns None if the search is not tracked, else a list of MarketSnapshot.to_dict().
+    """
+    since = utcnow() - timedelta(days=days)
+    query = (select(TrackedQuery.id, MarketSnapshot)
+             .outerjoin(MarketSnapshot, and_(MarketSnapshot.tracked_query_id == TrackedQuery.id,
+                                             MarketSnapshot.bucket_start >= since))
+             .where(TrackedQuery.query_key == normalize_query(country, what, where))
+             .order_by(MarketSnapshot.bucket_start))
+    with read_replica(): # Snapshots change a few times a day; replica lag is harmless
+        rows = db.session.execute(query).all()
+    if not rows:
+        return None
+    return [snapshot.to_dict() for _, snapshot in rows if snapshot is not None]
+
+
+def take_market_snapshot(tracked, now):
+    """ Records the current job count, salary percentiles and top skills of a tracked search. """
+    cfg = current_app.config
+    interval = cfg.get('TREND_SNAPSHOT_INTERVAL', 6 * 3600)
+    with adzuna_limiter.patient():
+        insights = collect_market_insights(tracked.what, tracked.location, tracked.country,
+                                           generate_summary=False, prefetch=False)
+    stats = (insights['salary_data'] or {}).get('stats') or {}
+    start = trends.bucket_start(now, interval)
+    if MarketSnapshot.query.filter_by(tracked_query_id=tracked.id, bucket_start=start).first() is None:
+        skills = insights['top_skills'][:cfg.get('TREND_TOP_SKILLS_STORED', 10)]
+        db.session.add(MarketSnapshot(
+            tracked_query_id=tracked.id, bucket_start=start, resolution=interval, samples=1,
+            total_jobs=insights['total_matching_jobs'], salary_p10=stats.get('p10'), salary_p25=stats.get('p25'),
+            salary_median=stats.get('median'), salary_p75=stats.get('p75'), salary_p90=stats.get('p90'),
+            listings_sampled=len(insights['job_listings']),
+            top_skills=json.dumps({skill['name']: skill['count'] for skill in skills})))
+    tracked.last_snapshot_at = now
+    db.session.commit()
+
+
+def downsample_market_snapshots(tracked, now):
+    """ Merges a tracked search's aged snapshots into day/week buckets and drops expired ones (trends.py). """
+    cfg = current_app.config
+    oldest_raw = now - timedelta(days=cfg.get('TREND_RAW_RETENTION_DAYS', 14)) # newer points are never compacted
+    points = [snapshot.to_point() for snapshot in
+              MarketSnapshot.query.filter(MarketSnapshot.tracked_query_id == tracked.id,
+                                          MarketSnapshot.bucket_start < oldest_raw)]
+    delete_ids, inserts = trends.downsample_plan(points, now, trends.tiers(cfg),
+                                                 max_age=cfg.get('TREND_MAX_AGE_DAYS', 730) * trends.DAY,
+                                                 top_skills=cfg.get('TREND_TOP_SKILLS_STORED', 10))
+    if not delete_ids:
+        return 0
+    MarketSnapshot.query.filter(MarketSnapshot.id.in_(delete_ids)).delete(synchronize_session=False)
+    db.session.flush()
+    for point in inserts:
+        db.session.add(MarketSnapshot(tracked_query_id=tracked.id, **{**point, 'top_skills': json.dumps(point['top_skills'])}))
+    db.session.commit()
+    logger.info(f"Compacted {len(delete_ids)} market snapshots of {tracked.query_key} into {len(inserts)}.")
+    return len(delete_ids)
+
+
+def run_market_snapshots(now=None):
+    """
+    Snapshots every tracked search without a snapshot in the current TREND_SNAPSHOT_INTERVAL bucket,
+    then compacts its history. Stops early when the Adzuna quota runs low, so snapshots never
+    starve interactive searches. Returns counts of snapshots taken, failed and skipped.
+    """
+    now = now or utcnow()
+    interval = current_app.config.get('TREND_SNAPSHOT_INTERVAL', 6 * 3600)
+    due = (TrackedQuery.query
+           .filter(or_(TrackedQuery.last_snapshot_at.is_(None),
+                       TrackedQuery.last_snapshot_at < trends.bucket_start(now, interval)))
+           .order_by(TrackedQuery.id).all())
+    outcome = {'taken': 0, 'failed': 0, 'skipped': 0}
+    for i, tracked in enumerate(due):
+        if adzuna_limiter.budget_low():
+            logger.warning(f"Adzuna quota low; skipping {len(due) - i} market snapshot(s) until the next run.")
+            outcome['skipped'] = len(due) - i
+            break
+        try:
+            take_market_snapshot(tracked, now)
+            downsample_market_snapshots(tracked, now)
+            outcome['taken'] += 1
+        except InsightsError as e:
+            logger.warning(f"Market snapshot of {tracked.query_key} failed: {e}")
+            outcome['failed'] += 1
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Unexpected error taking market snapshot of {tracked.query_key}: {e}", exc_info=True)
+            outcome['failed'] += 1
+    return outcome
+
+
+def schedule_market_snapshots():
+    """ Queues the next snapshot run for the start of the next TREND_SNAPSHOT_INTERVAL bucket (once). """
+    interval = current_app.config.get('TREND_SNAPSHOT_INTERVAL', 6 * 3600)
+    delay = interval - time.time() % interval + 1
+    return task_queue.enqueue('market_snapshots', key=f"market_snapshots:{int((time.time() + delay) // interval)}",
+                              priority=-10, delay=delay)
+
+
+@click.group('trends')
+def trends_command():
+    """ Market trend snapshots of tracked searches. """
+
+
+@trends_command.command('snapshot')
+@with_appcontext
+def snapshot_trends_command():
+    """ Snapshots every due tracked search now, for running from cron. """
+    click.echo(json.dumps(run_market_snapshots()))
+
+
+@trends_command.command('schedule')
+@with_appcontext
+def schedule_trends_command():
+    """ Queues the recurring snapshot task; web or `flask worker` processes run it every TREND_SNAPSHOT_INTERVAL. """
+    task = schedule_market_snapshots()
+    click.echo(f"Market snapshots queued as task {task.id} (runs after {task.run_after:%Y-%m-%d %H:%M} UTC"
+               " on a web process or `flask worker`).")
+
+
+# --- Background Tasks ---
+@task_queue.task('ai_summary')
+def ai_summary_task(payload):
+    """ Generates (or fetches from cache) the AI summary for a search; result is {'html': ...}. """
+    what, where, country = payload['what'], payload['where'], payload['country']
+    total_jobs, job_listings, salary_data = gather_summary_inputs(what, where, country)
+    summary_html = get_ai_summary_html({'what': what, 'where': where, 'country': country},
+                                       total_jobs, job_listings[:10], salary_data)
+    if summary_html is None:
+        raise RuntimeError("AI summary generation failed or returned no content.")
+    return {'html': str(summary_html)}
+
+
+@task_queue.task('market_snapshots')
+def market_snapshots_task(payload):
+    """ Runs the due market snapshots, then queues the next run, so the schedule keeps itself going. """
+    try:
+        return run_market_snapshots()
+    finally:
+        schedule_market_snapshots()
+
+
+@task_queue.task('warm_search')
+def warm_search_task(payload):
+    """ Refreshes the search and histogram caches for a query (e.g. ahead of a report). """
+    what, where, country = payload['what'], payload['where'], payload['country']
+    total_jobs, _, salary_data = gather_summary_inputs(what, where, country)
+    return {'total_jobs': total_jobs, 'has_salary_data': bool(salary_data)}
+
+
+def enqueue_ai_summary(what, where, country):
+    """ Queues the AI summary for a search, reusing any queued/recent task for the same query. """
+    return task_queue.enqueue('ai_summary', {'what': what, 'where': where, 'country': country},
+                              key=f"ai_summary:{normalize_query(country, what, where)}", priority=10)
+
+
 # --- Run development server (if script is executed directly) ---
 if __name__ == '__main__':
     dev_app = create_app()
@@ -0,0 +1,146 @@
+"""
+Local stand-ins for the Adzuna and Azure AI APIs, used by the load test.
+
+Each server answers with canned but realistic payloads after a configurable delay
+(latency +/- jitter, in ms) and fails a configurable fraction of calls with a 5xx.
+Every call is counted per endpoint so the load test can report upstream traffic.
+"""
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Named latency/error profiles; override individual values from the command line.
+PROFILES = {
+    'fast': {'latency_ms': 5, 'jitter_ms': 2, 'error_rate': 0.0, 'ai_latency_ms': 20},
+    'realistic': {'latency_ms': 350, 'jitter_ms': 150, 'error_rate': 0.01, 'ai_latency_ms': 2500},
+    'flaky': {'latency_ms': 600, 'jitter_ms': 500, 'error_rate': 0.1, 'ai_latency_ms': 4000},
+}
+
+SEARCH_PATH = re.compile(r'^/v1/api/jobs/(?P<country>[a-z]{2})/search/(?P<page>\d+)$')
+HISTOGRAM_PATH = re.compile(r'^/v1/api/jobs/(?P<country>[a-z]{2})/histogram$')
+AI_SUMMARY = ("**Market Activity:** High volume of listings.\n\n"
+              "**Specific Skills/Technologies/Tools Mentioned:**\n- Python\n- SQL\n- AWS\n\n"
+              "**Sourcing Considerations:** Proactive sourcing is recommended.")
+
+
+def _search_payload(what, where, page):
+    results = []
+    for i in range(20):
+        job_id = f"{zlib.crc32(f'{what}|{where}'.encode('utf-8')) % 10_000_000}{page:03d}{i:02d}"
+        results.append({
+            'title': f"{what.title()} {i + 1}",
+            'company': {'display_name': f"Company {i % 7}"},
+            'location': {'display_name': where.title()},
+            'description': f"We are hiring a {what} in {where}. Python, SQL and AWS experience required. " * 3,
+            'redirect_url': f"https://www.adzuna.co.uk/jobs/details/{job_id}",
+            'created': '2024-01-01T00:00:00Z',
+        })
+    return {'count': 1234, 'results': results}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real APIs
+
+    def log_message(self, *args):
+        pass
+
+    def _delay(self, latency_ms):
+        profile = self.server.profile
+        jitter = random.uniform(-profile['jitter_ms'], profile['jitter_ms'])
+        time.sleep(max(0.0, latency_ms + jitter) / 1000)
+
+    def _fail(self):
+        return random.random() < self.server.profile['error_rate']
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        search, histogram = SEARCH_PATH.match(parts.path), HISTOGRAM_PATH.match(parts.path)
+        endpoint = 'adzuna_search' if search else 'adzuna_histogram' if histogram else 'unknown'
+        self.server.count(endpoint)
+        if endpoint == 'unknown':
+            return self._send_json(404, {'exception': 'NOT_FOUND'})
+        self._delay(self.server.profile['latency_ms'])
+        if self._fail():
+            return self._send_json(503, {'exception': 'SERVICE_UNAVAILABLE'})
+        if search:
+            return self._send_json(200, _search_payload(params.get('what', ''), params.get('where', ''),
+                                                        int(search.group('page'))))
+        return self._send_json(200, {'histogram': {'30000': 12, '45000': 30, '60000': 21, '80000': 6}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        self.server.count('azure_ai')
+        self._delay(self.server.profile['ai_latency_ms'])
+        if self._fail():
+            return self._send_json(503, {'error': {'message': 'Service unavailable'}})
+        if not body.get('stream'):
+            return self._send_json(200, {'choices': [{'message': {'role': 'assistant', 'content': AI_SUMMARY}}]})
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for word in AI_SUMMARY.split(' '):
+            chunk = {'choices': [{'delta': {'content': word + ' '}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, profile):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.profile = profile
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] += 1
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FakeUpstreams:
+    """ Starts the fake Adzuna and Azure servers on ephemeral ports, each on its own thread. """
+
+    def __init__(self, profile):
+        self.adzuna = FakeUpstreamServer(profile)
+        self.azure = FakeUpstreamServer(profile)
+        for server in (self.adzuna, self.azure):
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    @property
+    def adzuna_base_url(self):
+        return f"{self.adzuna.base_url}/v1/api/jobs"
+
+    @property
+    def azure_endpoint(self):
+        return f"{self.azure.base_url}/openai/deployments/bench/chat/completions"
+
+    def call_counts(self):
+        return dict(self.adzuna.calls + self.azure.calls)
+
+    def stop(self):
+        for server in (self.adzuna, self.azure):
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,195 @@
+"""
+Offline load test: drives the real WSGI `application` from wsgi.py against local fake
+Adzuna/Azure servers and reports throughput, latency percentiles and upstream call counts.
+
+    python -m benchmarks.load_test --scenario search --profile realistic -n 400 -c 16
+    python -m benchmarks.load_test --scenario search --profile fast --save-baseline
+    python -m benchmarks.load_test --scenario search --profile fast --compare   # exit 1 on regression
+
+Scenarios:
+    search     results page without the AI summary
+    search_ai  results page with the AI summary generated inline (AI_SUMMARY_MODE=inline)
+    stream     results page, then the summary's server-sent-event stream read to the end
+
+Baselines are JSON files in benchmarks/baselines/<scenario>-<profile>.json. They are only
+comparable on the same machine, so re-record them before comparing on new hardware.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from benchmarks.fake_upstreams import PROFILES, FakeUpstreams
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+ROLES = ['data scientist', 'python developer', 'nurse', 'accountant', 'teacher', 'electrician',
+         'project manager', 'chef', 'software engineer', 'marketing manager']
+CITIES = ['london', 'manchester', 'leeds', 'bristol', 'glasgow']
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scenario', choices=('search', 'search_ai', 'stream'), default='search')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='fast')
+    parser.add_argument('-n', '--requests', type=int, default=200, help='Measured requests.')
+    parser.add_argument('-c', '--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests sent first.')
+    parser.add_argument('--distinct-queries', type=int, default=20,
+                        help='Size of the query mix; fewer means more cache hits.')
+    parser.add_argument('--latency-ms', type=float, help='Override the profile\'s Adzuna latency.')
+    parser.add_argument('--jitter-ms', type=float, help='Override the profile\'s latency jitter.')
+    parser.add_argument('--error-rate', type=float, help='Override the profile\'s upstream error rate.')
+    parser.add_argument('--ai-latency-ms', type=float, help='Override the profile\'s Azure latency.')
+    parser.add_argument('--config', default='production', help='FLASK_CONFIG to run the app with.')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the result as the new baseline.')
+    parser.add_argument('--compare', action='store_true', help='Compare with the saved baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative p95/throughput regression before --compare fails.')
+    parser.add_argument('--output', help='Also write the result JSON here.')
+    return parser.parse_args(argv)
+
+
+def build_profile(args):
+    profile = dict(PROFILES[args.profile])
+    for key in ('latency_ms', 'jitter_ms', 'error_rate', 'ai_latency_ms'):
+        if getattr(args, key) is not None:
+            profile[key] = getattr(args, key)
+    return profile
+
+
+def load_application(args, upstreams, workdir):
+    """ Points the app at the fake upstreams and a scratch database, then imports wsgi. """
+    os.environ.update({
+        'FLASK_CONFIG': args.config,
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'CACHE_DIR': os.path.join(workdir, 'cache'),
+        'ADZUNA_APP_ID': 'bench', 'ADZUNA_APP_KEY': 'bench',
+        'ADZUNA_API_BASE_URL': upstreams.adzuna_base_url,
+        'AZURE_AI_ENDPOINT': upstreams.azure_endpoint, 'AZURE_AI_KEY': 'bench',
+        'AI_SUMMARY_MODE': 'inline' if args.scenario == 'search_ai' else 'stream',
+        'ADZUNA_RATE_LIMIT_ENABLED': 'False',  # measure the app, not the client-side budget
+        'TASK_QUEUE_WORKERS': '0',
+    })
+    from wsgi import application
+    from app import db
+    with application.app_context():
+        db.create_all()
+    return application
+
+
+def query_mix(size):
+    pairs = [(role, city) for city in CITIES for role in ROLES]
+    return pairs[:max(1, min(size, len(pairs)))]
+
+
+def make_request(client, scenario, what, where):
+    """ Sends one scenario request and returns its HTTP status (the worst one for multi-step scenarios). """
+    params = {'what': what, 'where': where, 'country': 'gb',
+              'generate_summary': 'false' if scenario == 'search' else 'true'}
+    response = client.get(f"/?{urlencode(params)}")
+    status = response.status_code
+    if scenario == 'stream' and status == 200:
+        stream = client.get(f"/insights/summary/stream?{urlencode({k: params[k] for k in ('what', 'where', 'country')})}")
+        body = stream.get_data(as_text=True)  # drains the event stream
+        status = stream.status_code if 'event: done' in body or stream.status_code != 200 else 599
+    return status
+
+
+def run_load(application, args):
+    local = threading.local()
+    queries = query_mix(args.distinct_queries)
+
+    def one(i):
+        if not hasattr(local, 'client'):
+            local.client = application.test_client()
+        what, where = queries[i % len(queries)]
+        started = time.perf_counter()
+        try:
+            status = make_request(local.client, args.scenario, what, where)
+        except Exception:
+            status = 'exception'
+        return (time.perf_counter() - started) * 1000, status
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one, range(args.warmup)))
+        started = time.perf_counter()
+        samples = list(pool.map(one, range(args.warmup, args.warmup + args.requests)))
+        elapsed = time.perf_counter() - started
+    return samples, elapsed
+
+
+def summarise(args, profile, samples, elapsed, upstream_calls):
+    latencies = sorted(ms for ms, _ in samples)
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'scenario': args.scenario, 'profile': args.profile, 'upstream_profile': profile,
+        'requests': args.requests, 'concurrency': args.concurrency, 'distinct_queries': args.distinct_queries,
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(len(samples) / elapsed, 2),
+        'latency_ms': {'p50': round(cuts[49], 1), 'p95': round(cuts[94], 1), 'p99': round(cuts[98], 1),
+                       'mean': round(statistics.fmean(latencies), 1), 'max': round(latencies[-1], 1)},
+        'status_counts': {str(k): v for k, v in sorted(Counter(status for _, status in samples).items(), key=str)},
+        'upstream_calls': upstream_calls,
+        'upstream_calls_per_request': round(sum(upstream_calls.values()) / max(1, args.requests + args.warmup), 3),
+        'python': platform.python_version(), 'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def baseline_path(args):
+    return os.path.join(BASELINE_DIR, f"{args.scenario}-{args.profile}.json")
+
+
+def compare(result, baseline, tolerance):
+    """ Returns a list of regressions (empty when within tolerance). """
+    regressions = []
+    if result['latency_ms']['p95'] > baseline['latency_ms']['p95'] * (1 + tolerance):
+        regressions.append(f"p95 {result['latency_ms']['p95']}ms vs baseline {baseline['latency_ms']['p95']}ms")
+    if result['throughput_rps'] < baseline['throughput_rps'] * (1 - tolerance):
+        regressions.append(f"throughput {result['throughput_rps']}/s vs baseline {baseline['throughput_rps']}/s")
+    if result['upstream_calls_per_request'] > baseline['upstream_calls_per_request'] * (1 + tolerance):
+        regressions.append(f"upstream calls/request {result['upstream_calls_per_request']} "
+                           f"vs baseline {baseline['upstream_calls_per_request']}")
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    profile = build_profile(args)
+    upstreams = FakeUpstreams(profile)
+    with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+        try:
+            application = load_application(args, upstreams, workdir)
+            samples, elapsed = run_load(application, args)
+        finally:
+            upstreams.stop()
+    result = summarise(args, profile, samples, elapsed, upstreams.call_counts())
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path(args), 'w') as f:
+            json.dump(result, f, indent=2)
+            f.write('\n')
+        print(f"Saved baseline to {baseline_path(args)}", file=sys.stderr)
+    if args.compare:
+        with open(baseline_path(args)) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Login throughput per password-hash setting: how many logins per second one core sustains
+at each PASSWORD_HASH_METHOD, both for the bare hash check and through the real /login view.
+
+    python -m benchmarks.password_hashing
+    python -m benchmarks.password_hashing --methods scrypt:16384:8:1 pbkdf2:sha256:600000 -c 4
+
+Run it on the target instance size (e.g. basic-xxs) before changing the production cost:
+at 1 vCPU, logins/s/core is the ceiling for a burst of sign-ins before searches start to queue.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+METHODS = ['scrypt:32768:8:1', 'scrypt:16384:8:1', 'pbkdf2:sha256:1000000', 'pbkdf2:sha256:600000']
+PASSWORD = 'correct horse battery staple'
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--methods', nargs='+', default=METHODS, help='werkzeug method strings to compare.')
+    parser.add_argument('-d', '--duration', type=float, default=3.0, help='Seconds measured per method and mode.')
+    parser.add_argument('-c', '--concurrency', type=int, default=os.cpu_count() or 1,
+                        help='Concurrent logins (defaults to the number of cores).')
+    parser.add_argument('--skip-app', action='store_true', help='Only measure the bare hash check.')
+    parser.add_argument('--output', help='Also write the result JSON here.')
+    return parser.parse_args(argv)
+
+
+def measure(func, concurrency, duration):
+    """ Calls func from `concurrency` threads for `duration` seconds; returns (calls/s, mean ms). """
+    deadline = time.perf_counter() + duration
+    counts, latencies, lock = [], [], threading.Lock()
+
+    def worker():
+        count, total = 0, 0.0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            func()
+            total += time.perf_counter() - started
+            count += 1
+        with lock:
+            counts.append(count)
+            latencies.append(total)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - started
+    calls = sum(counts)
+    return calls / elapsed, (sum(latencies) / calls * 1000) if calls else 0.0
+
+
+def load_application(workdir, concurrency):
+    os.environ.update({
+        'FLASK_CONFIG': 'production',
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'CACHE_DIR': os.path.join(workdir, 'cache'),
+        'PASSWORD_HASH_WORKERS': str(concurrency),  # measure the hash cost, not the pool bound
+        'TASK_QUEUE_WORKERS': '0',
+    })
+    from wsgi import application
+    from app import db
+    application.config['WTF_CSRF_ENABLED'] = False
+    with application.app_context():
+        db.create_all()
+    return application
+
+
+def app_login(application, method, concurrency, duration):
+    """ Logins/s through the /login view, with the stored hash made using `method`. """
+    from app import db, password_hasher, User
+    password_hasher.method = method
+    email = f"bench-{method.replace(':', '-')}@example.com"
+    with application.app_context():
+        user = User(email=email)
+        user.set_password(PASSWORD)
+        db.session.add(user)
+        db.session.commit()
+    local = threading.local()
+
+    def login():
+        if not hasattr(local, 'client'):
+            local.client = application.test_client()
+        response = local.client.post('/login', data={'email': email, 'password': PASSWORD})
+        local.client.get('/logout')
+        if response.status_code != 302:
+            raise RuntimeError(f"Login failed with HTTP {response.status_code}")
+    return measure(login, concurrency, duration)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cores = min(args.concurrency, os.cpu_count() or 1)
+    results = []
+    with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+        application = None if args.skip_app else load_application(workdir, args.concurrency)
+        for method in args.methods:
+            stored = generate_password_hash(PASSWORD, method)
+            rate, mean_ms = measure(lambda: check_password_hash(stored, PASSWORD), args.concurrency, args.duration)
+            row = {'method': method, 'hash_checks_per_s': round(rate, 2),
+                   'hash_checks_per_s_per_core': round(rate / cores, 2), 'hash_check_ms': round(mean_ms, 1)}
+            if application is not None:
+                rate, mean_ms = app_login(application, method, args.concurrency, args.duration)
+                row.update({'logins_per_s': round(rate, 2), 'logins_per_s_per_core': round(rate / cores, 2),
+                            'login_ms': round(mean_ms, 1)})
+            print(json.dumps(row), file=sys.stderr)
+            results.append(row)
+    result = {'concurrency': args.concurrency, 'cores_used': cores, 'duration_s': args.duration, 'methods': results}
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
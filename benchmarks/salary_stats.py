@@ -0,0 +1,87 @@
+"""
+Throughput of the salary statistics (salary_stats.py) on many Adzuna-shaped histograms: one
+batched pass against computing each histogram on its own, plus the memoized (cache-hit) path.
+
+    python -m benchmarks.salary_stats                 # 10k synthetic histograms
+    python -m benchmarks.salary_stats -n 100000 --distinct 2000
+
+Synthetic histograms have 8-14 buckets 10k apart with skewed counts, from a fixed seed so runs
+are comparable. --distinct limits how many different histograms there are (repeats hit the cache).
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+
+from cache import LocalLRU
+from salary_stats import compare, summarize
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', '--histograms', type=int, default=10_000, help='Histograms per pass.')
+    parser.add_argument('--distinct', type=int, default=0, help='Different histograms among them (0: all).')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed passes (best is reported).')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Also write the result JSON here.')
+    return parser.parse_args(argv)
+
+
+def synthetic_histograms(count, distinct, seed):
+    rng = random.Random(seed)
+    pool = []
+    for _ in range(distinct or count):
+        start = rng.randint(1, 6) * 10_000
+        buckets = rng.randint(8, 14)
+        peak = rng.randint(1, buckets - 2)
+        pool.append({str(start + i * 10_000): max(0, int(rng.gauss(200, 60) / (1 + abs(i - peak))))
+                     for i in range(buckets)})
+    return [pool[i % len(pool)] for i in range(count)]
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), statistics.median(timings)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    histograms = synthetic_histograms(args.histograms, args.distinct, args.seed)
+
+    batched, batched_median = best_of(args.repeat, lambda: summarize(histograms))
+    one_by_one, _ = best_of(args.repeat, lambda: [summarize([histogram]) for histogram in histograms])
+
+    def cold_then_warm():
+        cache = LocalLRU('benchmark')
+        cache.max_entries, cache.ttl = len(histograms) + 1, 3600
+        started = time.perf_counter()
+        compare(histograms, cache)
+        cold = time.perf_counter() - started
+        started = time.perf_counter()
+        compare(histograms, cache)
+        return cold, time.perf_counter() - started
+    cold, warm = min(cold_then_warm() for _ in range(args.repeat))
+
+    result = {
+        'histograms': len(histograms), 'distinct': args.distinct or len(histograms),
+        'batched_s': round(batched, 4), 'batched_median_s': round(batched_median, 4),
+        'batched_us_per_histogram': round(batched / len(histograms) * 1e6, 2),
+        'one_by_one_s': round(one_by_one, 4), 'speedup_batched': round(one_by_one / batched, 1),
+        'memoized_cold_s': round(cold, 4), 'memoized_warm_s': round(warm, 4),
+        'warm_us_per_histogram': round(warm / len(histograms) * 1e6, 2),
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
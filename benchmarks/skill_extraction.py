@@ -0,0 +1,124 @@
+"""
+Throughput of the local skill extractor (skills.py) on a large corpus of job descriptions,
+optionally against a naive one-regex-per-skill scan of the same corpus.
+
+    python -m benchmarks.skill_extraction                       # 100k synthetic descriptions
+    python -m benchmarks.skill_extraction -n 20000 --compare-regex
+    python -m benchmarks.skill_extraction --input listings.ndjson   # real text: NDJSON with a
+                                                                    # "description" field, or plain lines
+
+Synthetic descriptions are ~500 characters (Adzuna's snippet length) of filler words with a
+few dictionary aliases mixed in, generated from a fixed seed so runs are comparable.
+"""
+import argparse
+import json
+import random
+import re
+import statistics
+import sys
+import time
+
+from skills import SKILLS, NOT_MATCHED_BY_NAME, SkillMatcher
+
+FILLER = ('we are looking for an experienced team member to join our growing business you will work with '
+          'customers and colleagues across the company to deliver high quality results in a fast paced '
+          'environment excellent communication skills and a proactive attitude are essential salary '
+          'benefits hybrid working pension holiday flexible hours office based training progression').split()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', '--descriptions', type=int, default=100_000, help='Synthetic corpus size.')
+    parser.add_argument('--skills-per-description', type=int, default=6, help='Aliases mixed into each one.')
+    parser.add_argument('--input', help='Read descriptions from this file instead of generating them.')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed passes over the corpus (best is reported).')
+    parser.add_argument('--compare-regex', action='store_true',
+                        help='Also time one compiled regex per skill over the corpus (slow on 100k).')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Also write the result JSON here.')
+    return parser.parse_args(argv)
+
+
+def synthetic_corpus(count, skills_per_description, seed):
+    rng = random.Random(seed)
+    aliases = [alias for entries in SKILLS.values() for name, extra in entries.items()
+               for alias in ([*extra] if name in NOT_MATCHED_BY_NAME else [name, *extra])]
+    corpus = []
+    for _ in range(count):
+        words = rng.choices(FILLER, k=80)
+        for alias in rng.sample(aliases, skills_per_description):
+            words.insert(rng.randrange(len(words)), alias + rng.choice(('', ',', '.', ' /')))
+        corpus.append(' '.join(words))
+    return corpus
+
+
+def read_corpus(path):
+    corpus = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('{'):
+                record = json.loads(line)
+                line = f"{record.get('title') or ''}\n{record.get('description') or ''}"
+            if line:
+                corpus.append(line)
+    return corpus
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), statistics.median(timings), result
+
+
+def naive_regex_matcher():
+    """ The obvious alternative: one case-insensitive, word-bounded regex per skill. """
+    patterns = []
+    for entries in SKILLS.values():
+        for name, extra in entries.items():
+            aliases = [*extra] if name in NOT_MATCHED_BY_NAME else [name, *extra]
+            alternation = '|'.join(re.escape(alias) for alias in sorted(aliases, key=len, reverse=True))
+            patterns.append((name, re.compile(rf"(?<![\w.+#])(?:{alternation})(?![\w+#])", re.IGNORECASE)))
+    return lambda text: {name for name, pattern in patterns if pattern.search(text)}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    corpus = read_corpus(args.input) if args.input else synthetic_corpus(
+        args.descriptions, args.skills_per_description, args.seed)
+    total_chars = sum(len(text) for text in corpus)
+
+    started = time.perf_counter()
+    matcher = SkillMatcher()
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    best, median, ranked = best_of(args.repeat, lambda: matcher.rank(corpus, top=10))
+    result = {
+        'descriptions': len(corpus), 'mean_chars': round(total_chars / max(1, len(corpus))),
+        'skills': len(matcher.names), 'compile_ms': round(compile_ms, 2),
+        'scan_s': round(best, 3), 'scan_median_s': round(median, 3),
+        'descriptions_per_s': round(len(corpus) / best),
+        'mb_per_s': round(total_chars / best / 1e6, 2),
+        'us_per_description': round(best / len(corpus) * 1e6, 2),
+        # One results page is 20 listings per Adzuna page, up to MAX_RESULT_PAGES (5) pages
+        'ms_per_search_20_listings': round(best / len(corpus) * 20 * 1000, 3),
+        'ms_per_search_100_listings': round(best / len(corpus) * 100 * 1000, 3),
+        'top_skills': {skill['name']: skill['count'] for skill in ranked},
+    }
+    if args.compare_regex:
+        naive = naive_regex_matcher()
+        regex_best, _, _ = best_of(1, lambda: [naive(text) for text in corpus])
+        result.update({'regex_scan_s': round(regex_best, 3), 'speedup_vs_regex': round(regex_best / best, 1)})
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
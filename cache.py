@@ -0,0 +1,395 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import CACHE_REQUESTS
+from pipeline import submit
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(*parts):
+    """ Builds a cache key that ignores case and extra whitespace ('  Data  Scientist' == 'data scientist'). """
+    return '|'.join(' '.join(str(part).split()).casefold() for part in parts)
+
+
+# --- Backends ---
+# Every backend stores serialized bytes together with the time they were stored.
+# Entries past their expiry are never returned; callers can apply a stricter max_age.
+
+class NullBackend:
+    """ Stores nothing. Used in tests so every call goes to the (mocked) upstream. """
+
+    def get(self, key):
+        return None
+
+    def set(self, key, payload, ttl):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryBackend:
+    """ Per-process LRU dictionary bounded by entry count and total payload bytes. """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (payload, stored_at, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, stored_at, expires_at = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return payload, stored_at
+
+    def set(self, key, payload, ttl):
+        if len(payload) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (payload, now, now + ttl)
+            self._bytes += len(payload)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        payload, _, _ = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+
+class SQLiteBackend:
+    """
+    LRU store in a local SQLite file, shared by every gunicorn worker on the host.
+    Each cache gets its own table so their count/byte limits are independent.
+    A hit refreshes its LRU position at most once per `touch_interval` seconds, so most reads
+    never take SQLite's write lock.
+    """
+
+    touch_interval = 60.0
+
+    def __init__(self, path, table, max_entries, max_bytes):
+        self.path = path
+        self.table = f"cache_{table}"
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{self.table}" ('
+                ' key TEXT PRIMARY KEY, payload BLOB NOT NULL, size INTEGER NOT NULL,'
+                ' stored_at REAL NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "ix_{self.table}_accessed" ON "{self.table}" (accessed_at)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute(f'SELECT payload, stored_at, expires_at, accessed_at FROM "{self.table}" WHERE key = ?',
+                           (key,)).fetchone()
+        if row is None:
+            return None
+        payload, stored_at, expires_at, accessed_at = row
+        if expires_at <= now:
+            conn.execute(f'DELETE FROM "{self.table}" WHERE key = ?', (key,))
+            return None
+        if now - accessed_at >= self.touch_interval:
+            conn.execute(f'UPDATE "{self.table}" SET accessed_at = ? WHERE key = ?', (now, key))
+        return payload, stored_at
+
+    def set(self, key, payload, ttl):
+        if len(payload) > self.max_bytes:
+            return
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                f'INSERT OR REPLACE INTO "{self.table}" (key, payload, size, stored_at, expires_at, accessed_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?)', (key, payload, len(payload), now, now + ttl, now))
+            conn.execute(f'DELETE FROM "{self.table}" WHERE expires_at <= ?', (now,))
+            # Least recently used first: drop everything past the count limit, then past the byte limit.
+            conn.execute(
+                f'DELETE FROM "{self.table}" WHERE key IN ('
+                f' SELECT key FROM "{self.table}" ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+            conn.execute(
+                f'DELETE FROM "{self.table}" WHERE key IN ('
+                f' SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS running'
+                f' FROM "{self.table}") WHERE running > ?)', (self.max_bytes,))
+
+    def delete(self, key):
+        self._connection().execute(f'DELETE FROM "{self.table}" WHERE key = ?', (key,))
+
+    def clear(self):
+        self._connection().execute(f'DELETE FROM "{self.table}"')
+
+
+class LocalLRU:
+    """
+    Small per-process LRU of live Python objects with a TTL (no serialization), for data that is
+    cheap to rebuild and must not outlive `<PREFIX>_TTL` seconds, since other workers cannot invalidate it.
+    Configured with `<PREFIX>_MAX_ENTRIES` and `<PREFIX>_TTL`.
+    """
+
+    def __init__(self, name, config_prefix=None):
+        self.name = name
+        self.config_prefix = config_prefix or f"{name.upper()}_CACHE"
+        self.max_entries = 1000
+        self.ttl = 60
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_entries = app.config.get(f"{self.config_prefix}_MAX_ENTRIES", self.max_entries)
+        self.ttl = app.config.get(f"{self.config_prefix}_TTL", self.ttl)
+        self.clear()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# --- Cache Front-End ---
+class ResponseCache:
+    """
+    JSON response cache with TTL, LRU eviction and hit/miss counters.
+    Configured from the app config using `<PREFIX>_BACKEND`, `_TTL`, `_MAX_ENTRIES` and `_MAX_BYTES`.
+    With `<PREFIX>_STALE_TTL` set above the TTL, entries are kept that much longer and can still be
+    read with `allow_stale=True` (e.g. to avoid an upstream call when its quota is running out).
+    """
+
+    def __init__(self, name, config_prefix=None, single_flight=None):
+        self.name = name
+        self.config_prefix = config_prefix or f"{name.upper()}_CACHE"
+        self.single_flight = single_flight
+        self.backend = NullBackend()
+        self.ttl = 0
+        self.stale_ttl = 0
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        self._hit_metric = CACHE_REQUESTS.labels(name, 'hit')
+        self._miss_metric = CACHE_REQUESTS.labels(name, 'miss')
+
+    def init_app(self, app):
+        cfg = app.config
+        prefix = self.config_prefix
+        backend_name = cfg.get(f"{prefix}_BACKEND", 'memory')
+        self.ttl = cfg.get(f"{prefix}_TTL", 300)
+        self.stale_ttl = max(self.ttl, cfg.get(f"{prefix}_STALE_TTL", self.ttl))
+        max_entries = cfg.get(f"{prefix}_MAX_ENTRIES", 1000)
+        max_bytes = cfg.get(f"{prefix}_MAX_BYTES", 32 * 1024 * 1024)
+        if backend_name == 'memory':
+            self.backend = MemoryBackend(max_entries, max_bytes)
+        elif backend_name == 'sqlite':
+            path = os.path.join(cfg.get('CACHE_DIR', '.cache'), 'upstream_cache.sqlite3')
+            self.backend = SQLiteBackend(path, self.name, max_entries, max_bytes)
+        elif backend_name == 'null':
+            self.backend = NullBackend()
+        else:
+            raise ValueError(f"Unknown cache backend for {prefix}: {backend_name}")
+        logger.info(f"--- {self.name} cache using '{backend_name}' backend (ttl={self.ttl}s) ---")
+
+    @property
+    def enabled(self):
+        return not isinstance(self.backend, NullBackend)
+
+    def contains(self, key):
+        """ True if key has a live entry. Does not touch the hit/miss counters. """
+        try:
+            return self.backend.get(key) is not None
+        except Exception:
+            return False
+
+    def get(self, key, max_age=None, allow_stale=False):
+        """
+        Returns the cached value, or None on a miss (or if older than max_age seconds, which
+        defaults to the TTL). allow_stale=True also returns entries kept past the TTL.
+        """
+        entry = self.get_entry(key, max_age, allow_stale)
+        return entry[0] if entry else None
+
+    def get_entry(self, key, max_age=None, allow_stale=False):
+        """ Like get(), but returns (value, age_in_seconds). """
+        if max_age is None and not allow_stale:
+            max_age = self.ttl
+        try:
+            entry = self.backend.get(key)
+        except Exception as e:
+            logger.error(f"{self.name} cache read failed: {e}")
+            entry = None
+        if entry is not None:
+            payload, stored_at = entry
+            age = time.time() - stored_at
+            if max_age is None or age <= max_age:
+                self._count(hit=True)
+                return json.loads(payload), age
+        self._count(hit=False)
+        return None
+
+    def set(self, key, value, ttl=None):
+        try:
+            payload = json.dumps(value, separators=(',', ':')).encode('utf-8')
+            self.backend.set(key, payload, max(self.ttl, self.stale_ttl) if ttl is None else ttl)
+        except Exception as e:
+            logger.error(f"{self.name} cache write failed: {e}")
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
+
+    def get_or_load(self, key, loader):
+        """ Returns the cached value for key, calling loader() and caching its result on a miss. """
+        value = self.get(key)
+        if value is None:
+            value = self._load(key, loader)
+        return value
+
+    def _load(self, key, loader, recheck=None):
+        """
+        Calls loader() and caches its result. With a single-flight group attached, concurrent
+        misses for the same key share one loader() call; `recheck` (default: a fresh cache read)
+        lets a caller that waited on another worker pick up what that worker stored.
+        """
+        def load_and_store():
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+            return value
+        if self.single_flight is None:
+            return load_and_store()
+        return self.single_flight.do(f"{self.name}:{key}", load_and_store,
+                                     recheck=recheck or (lambda: self.get(key)))
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        (self._hit_metric if hit else self._miss_metric).inc()
+
+    def stats(self):
+        with self._stats_lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+class StaleWhileRevalidateCache(ResponseCache):
+    """
+    ResponseCache that keeps entries for a long (hard) TTL but treats them as stale after
+    `<PREFIX>_SOFT_TTL` seconds. Stale entries are returned immediately while a single
+    background refresh per key runs on the shared upstream pool; if that refresh fails
+    the stale value simply stays in place.
+    """
+
+    def __init__(self, name, config_prefix=None, single_flight=None):
+        super().__init__(name, config_prefix, single_flight)
+        self.soft_ttl = 0
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+
+    def init_app(self, app):
+        super().init_app(app)
+        self.soft_ttl = app.config.get(f"{self.config_prefix}_SOFT_TTL", self.ttl)
+
+    def get_or_revalidate(self, key, loader, refresh=True):
+        """
+        Returns the cached value for key, refreshing it in the background once stale
+        (unless refresh=False, e.g. while the upstream quota is low).
+        On a miss loader() runs inline; its exceptions propagate since there is nothing to fall back to.
+        """
+        entry = self.get_entry(key)
+        if entry is None:
+            return self._load(key, loader)
+        value, age = entry
+        if age > self.soft_ttl and refresh:
+            self._schedule_refresh(key, loader)
+        return value
+
+    def _schedule_refresh(self, key, loader):
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        try:
+            submit(self._refresh, key, loader)
+        except Exception:
+            with self._refresh_lock:
+                self._refreshing.discard(key)
+            raise
+
+    def _refresh(self, key, loader):
+        try:
+            # Another worker may already have refreshed it, so only a *fresh* entry counts on recheck.
+            self._load(key, loader, recheck=lambda: self.get(key, max_age=self.soft_ttl))
+            logger.info(f"Refreshed stale {self.name} cache entry in the background.")
+        except Exception as e:
+            logger.warning(f"Background refresh of {self.name} cache entry failed, keeping stale value: {e}")
+        finally:
+            with self._refresh_lock:
+                self._refreshing.discard(key)
@@ -1,25 +1,197 @@
 import os
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+
+def engine_options(url, pool_size=5, max_overflow=5, pool_recycle=280, statement_timeout_ms=0):
+    """
+    SQLAlchemy engine options for a database URL; each value can be overridden with the matching
+    DATABASE_* environment variable. Pre-ping and a recycle interval below the server's idle cutoff
+    keep us from handing out connections the managed Postgres has already dropped.
+    """
+    if not url or url.startswith('sqlite'):
+        return {}  # SQLite pools are set up by Flask-SQLAlchemy (StaticPool for :memory:)
+    options = {
+        'pool_size': int(os.getenv('DATABASE_POOL_SIZE', str(pool_size))),
+        'max_overflow': int(os.getenv('DATABASE_MAX_OVERFLOW', str(max_overflow))),
+        'pool_timeout': float(os.getenv('DATABASE_POOL_TIMEOUT', '10')),  # seconds to wait for a free connection
+        'pool_recycle': int(os.getenv('DATABASE_POOL_RECYCLE', str(pool_recycle))),  # seconds
+        'pool_pre_ping': os.getenv('DATABASE_POOL_PRE_PING', 'True').lower() in ('true', '1', 't'),
+    }
+    statement_timeout_ms = int(os.getenv('DATABASE_STATEMENT_TIMEOUT_MS', str(statement_timeout_ms)))
+    if statement_timeout_ms and url.startswith('postgres'):
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout_ms}'}
+    return options
+
+
+def replica_binds(url, **kwargs):
+    """ SQLALCHEMY_BINDS entry for the optional read replica (see db_routing.read_replica). """
+    if not url:
+        return {}
+    return {'replica': {'url': url, **engine_options(url, **kwargs)}}
+
+
 class Config:
     SECRET_KEY = os.environ.get('FLASK_SECRET_KEY') or 'you-will-never-guess'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = os.getenv('SQLALCHEMY_ECHO', 'False').lower() in ('true', '1', 't')
     WTF_CSRF_ENABLED = True
+    # Size of the shared thread pool used to run Adzuna/Azure calls concurrently
+    UPSTREAM_MAX_WORKERS = int(os.getenv('UPSTREAM_MAX_WORKERS', '8'))
+    PIPELINE_TIMEOUT = float(os.getenv('PIPELINE_TIMEOUT', '120'))  # seconds a page waits for its concurrent stages
+    # Pooled HTTP client shared by all Adzuna/Azure calls (keep-alive + retries)
+    UPSTREAM_POOL_CONNECTIONS = int(os.getenv('UPSTREAM_POOL_CONNECTIONS', '4'))  # number of hosts to keep pools for
+    UPSTREAM_POOL_MAXSIZE = int(os.getenv('UPSTREAM_POOL_MAXSIZE', '8'))  # keep-alive connections per host
+    UPSTREAM_RETRIES = int(os.getenv('UPSTREAM_RETRIES', '2'))  # on connection errors and 429/5xx
+    UPSTREAM_BACKOFF_FACTOR = float(os.getenv('UPSTREAM_BACKOFF_FACTOR', '0.3'))
+    UPSTREAM_BACKOFF_JITTER = float(os.getenv('UPSTREAM_BACKOFF_JITTER', '0.2'))
+    # Longest wait between retries in seconds, Retry-After included: retries run on web workers
+    UPSTREAM_BACKOFF_MAX = float(os.getenv('UPSTREAM_BACKOFF_MAX', '2'))
+    UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '3.05'))
+    UPSTREAM_READ_TIMEOUTS = {
+        'adzuna_search': float(os.getenv('ADZUNA_SEARCH_READ_TIMEOUT', '20')),
+        'adzuna_histogram': float(os.getenv('ADZUNA_HISTOGRAM_READ_TIMEOUT', '15')),
+        'azure_ai': float(os.getenv('AZURE_AI_READ_TIMEOUT', '30')),
+    }
+    # 'live', 'record' (also save responses, credentials scrubbed) or 'replay' (serve saved responses, no network)
+    UPSTREAM_MODE = os.getenv('UPSTREAM_MODE', 'live')
+    UPSTREAM_RECORDINGS_PATH = os.getenv('UPSTREAM_RECORDINGS_PATH')  # default: CACHE_DIR/upstream_recordings.sqlite3
+    UPSTREAM_REPLAY_LATENCY_SCALE = float(os.getenv('UPSTREAM_REPLAY_LATENCY_SCALE', '1.0'))  # 0 = no delay
+    # Local directory for caches shared between gunicorn workers
+    CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(basedir, '.cache'))
+    # Adzuna search results cache: backend is one of 'memory', 'sqlite' (shared by workers) or 'null'
+    SEARCH_CACHE_BACKEND = os.getenv('SEARCH_CACHE_BACKEND', 'memory')
+    SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', '300'))  # seconds
+    SEARCH_CACHE_MAX_ENTRIES = int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', '1000'))
+    SEARCH_CACHE_MAX_BYTES = int(os.getenv('SEARCH_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+    # Expired search results are kept this long and served instead of calling Adzuna when the quota runs low
+    SEARCH_CACHE_STALE_TTL = int(os.getenv('SEARCH_CACHE_STALE_TTL', str(24 * 3600)))
+    # Coalesce identical in-flight upstream calls: 'process' (per gunicorn worker),
+    # 'host' (across workers via lock files in CACHE_DIR) or 'off'
+    SINGLE_FLIGHT_MODE = os.getenv('SINGLE_FLIGHT_MODE', 'process')
+    SINGLE_FLIGHT_TIMEOUT = float(os.getenv('SINGLE_FLIGHT_TIMEOUT', '35'))  # max wait on another caller, seconds
+    # Salary histograms change slowly: keep them for a week, refresh in the background after 12h
+    HISTOGRAM_CACHE_BACKEND = os.getenv('HISTOGRAM_CACHE_BACKEND', 'memory')
+    HISTOGRAM_CACHE_TTL = int(os.getenv('HISTOGRAM_CACHE_TTL', str(7 * 24 * 3600)))
+    HISTOGRAM_CACHE_SOFT_TTL = int(os.getenv('HISTOGRAM_CACHE_SOFT_TTL', str(12 * 3600)))
+    HISTOGRAM_CACHE_MAX_ENTRIES = int(os.getenv('HISTOGRAM_CACHE_MAX_ENTRIES', '5000'))
+    HISTOGRAM_CACHE_MAX_BYTES = int(os.getenv('HISTOGRAM_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+    # Per-process cache of which displayed jobs each user has saved (invalidated on save/unsave in this worker)
+    SAVED_IDS_CACHE_MAX_ENTRIES = int(os.getenv('SAVED_IDS_CACHE_MAX_ENTRIES', '2000'))  # users
+    SAVED_IDS_CACHE_TTL = int(os.getenv('SAVED_IDS_CACHE_TTL', '60'))  # seconds; bounds staleness across workers
+    SAVED_JOBS_PER_PAGE = int(os.getenv('SAVED_JOBS_PER_PAGE', '50'))
+    SAVED_JOBS_EXPORT_BATCH_SIZE = int(os.getenv('SAVED_JOBS_EXPORT_BATCH_SIZE', '500'))  # rows fetched per round trip
+    # Logged-in users are loaded from a per-process cache (no DB round trip); entries live at most USER_CACHE_TTL
+    USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', '10000'))
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '300'))  # seconds
+    # Also keep the identity in the signed session cookie, so cold workers skip the DB too
+    USER_SESSION_IDENTITY = os.getenv('USER_SESSION_IDENTITY', 'False').lower() in ('true', '1', 't')
+    # Password hashing: any werkzeug method string; hashes made with other settings are upgraded on login.
+    # Measure the cost on the target instance with `python -m benchmarks.password_hashing`.
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))  # hashes computed at once per process
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '16'))  # logins queued behind them
+    PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv('PASSWORD_HASH_QUEUE_TIMEOUT', '5'))  # then answer 503
+    # Salary statistics memoized by histogram content, so they never go stale; the TTL only bounds memory
+    SALARY_STATS_CACHE_MAX_ENTRIES = int(os.getenv('SALARY_STATS_CACHE_MAX_ENTRIES', '20000'))
+    SALARY_STATS_CACHE_TTL = int(os.getenv('SALARY_STATS_CACHE_TTL', str(24 * 3600)))  # seconds
+    SALARY_COMPARE_MAX_QUERIES = int(os.getenv('SALARY_COMPARE_MAX_QUERIES', '50'))  # per /salaries/compare request
+    BULK_SAVE_MAX_ITEMS = int(os.getenv('BULK_SAVE_MAX_ITEMS', '100'))  # jobs per bulk save/unsave request
+    # AI summaries (markdown + rendered HTML) cached in the ai_summary_cache table
+    AI_SUMMARY_CACHE_TTL = int(os.getenv('AI_SUMMARY_CACHE_TTL', str(3 * 24 * 3600)))
+    AI_SUMMARY_CACHE_MAX_BYTES = int(os.getenv('AI_SUMMARY_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+    # Every listing fetched from Adzuna is kept (full-text indexed) in job_listing for JOB_LISTING_RETENTION_DAYS
+    JOB_LISTING_STORE_ENABLED = os.getenv('JOB_LISTING_STORE_ENABLED', 'True').lower() in ('true', '1', 't')
+    JOB_LISTING_RETENTION_DAYS = int(os.getenv('JOB_LISTING_RETENTION_DAYS', '30'))
+    # Searching the stored listings: 'off', 'fallback' (when Adzuna is unavailable or rate limited)
+    # or 'prefer' (before calling Adzuna). Only listings seen within LOCAL_SEARCH_MAX_AGE count, and at
+    # least LOCAL_SEARCH_MIN_RESULTS must match, otherwise the search goes to Adzuna as usual.
+    LOCAL_SEARCH_MODE = os.getenv('LOCAL_SEARCH_MODE', 'off')
+    LOCAL_SEARCH_MAX_AGE = int(os.getenv('LOCAL_SEARCH_MAX_AGE', str(6 * 3600)))  # seconds
+    LOCAL_SEARCH_MIN_RESULTS = int(os.getenv('LOCAL_SEARCH_MIN_RESULTS', '20'))
+    # Skills ranked by how many listings on the results page mention them (skills.py dictionary)
+    TOP_SKILLS_SHOWN = int(os.getenv('TOP_SKILLS_SHOWN', '15'))
+    # Market trends: tracked searches are snapshotted every TREND_SNAPSHOT_INTERVAL (count, salary
+    # percentiles, top skills). Snapshots are merged into daily buckets after TREND_RAW_RETENTION_DAYS,
+    # weekly ones after TREND_DAILY_RETENTION_DAYS, and dropped after TREND_MAX_AGE_DAYS.
+    TREND_SNAPSHOT_INTERVAL = int(os.getenv('TREND_SNAPSHOT_INTERVAL', str(6 * 3600)))  # seconds
+    TREND_RAW_RETENTION_DAYS = int(os.getenv('TREND_RAW_RETENTION_DAYS', '14'))
+    TREND_DAILY_RETENTION_DAYS = int(os.getenv('TREND_DAILY_RETENTION_DAYS', '180'))
+    TREND_MAX_AGE_DAYS = int(os.getenv('TREND_MAX_AGE_DAYS', str(2 * 365)))
+    TREND_MAX_TRACKED_QUERIES = int(os.getenv('TREND_MAX_TRACKED_QUERIES', '200'))  # each costs 2 Adzuna calls per snapshot
+    TREND_TOP_SKILLS_STORED = int(os.getenv('TREND_TOP_SKILLS_STORED', '10'))
+    # Largest result window a user can request, in Adzuna pages of 20 (fetched concurrently)
+    MAX_RESULT_PAGES = int(os.getenv('MAX_RESULT_PAGES', '5'))
+    # 'stream': render listings first and stream the AI summary in over server-sent events
+    #   (each stream holds a worker thread; needs threaded gunicorn workers, see .do/app.yaml)
+    # 'queue': render listings first, generate the summary on the task queue and poll for it
+    # 'inline': wait for the AI summary before rendering the page
+    AI_SUMMARY_MODE = os.getenv('AI_SUMMARY_MODE', 'stream')
+    # Bulk market reports: queries per report and how many run at once
+    REPORT_MAX_QUERIES = int(os.getenv('REPORT_MAX_QUERIES', '100'))
+    REPORT_MAX_CONCURRENCY = int(os.getenv('REPORT_MAX_CONCURRENCY', '10'))
+    # Embedded task queue (task table): worker threads each web process starts on its first request
+    # (0 = only a separate `flask worker` process runs tasks)
+    TASK_QUEUE_WORKERS = int(os.getenv('TASK_QUEUE_WORKERS', '1'))
+    TASK_POLL_INTERVAL = float(os.getenv('TASK_POLL_INTERVAL', '1.0'))  # seconds
+    TASK_MAX_ATTEMPTS = int(os.getenv('TASK_MAX_ATTEMPTS', '3'))
+    TASK_LEASE_SECONDS = int(os.getenv('TASK_LEASE_SECONDS', '300'))  # reclaim tasks whose worker stops renewing (died)
+    TASK_RESULT_TTL = int(os.getenv('TASK_RESULT_TTL', '3600'))  # keep finished tasks (and reuse their results)
+    # Client-side limits for the Adzuna credentials, shared by all workers via CACHE_DIR
+    ADZUNA_RATE_LIMIT_ENABLED = os.getenv('ADZUNA_RATE_LIMIT_ENABLED', 'True').lower() in ('true', '1', 't')
+    ADZUNA_RATE_LIMIT_PER_SECOND = float(os.getenv('ADZUNA_RATE_LIMIT_PER_SECOND', '1.0'))  # sustained rate
+    ADZUNA_RATE_LIMIT_BURST = int(os.getenv('ADZUNA_RATE_LIMIT_BURST', '5'))
+    ADZUNA_RATE_LIMIT_MAX_WAIT = float(os.getenv('ADZUNA_RATE_LIMIT_MAX_WAIT', '2.0'))  # seconds a caller queues for a token
+    # ...and for reports and trend snapshots, which would rather be slow than fail
+    ADZUNA_RATE_LIMIT_BATCH_MAX_WAIT = float(os.getenv('ADZUNA_RATE_LIMIT_BATCH_MAX_WAIT', '300'))
+    ADZUNA_RATE_LIMIT_DAILY_QUOTA = int(os.getenv('ADZUNA_RATE_LIMIT_DAILY_QUOTA', '1000'))
+    ADZUNA_RATE_LIMIT_LOW_BUDGET_FRACTION = float(os.getenv('ADZUNA_RATE_LIMIT_LOW_BUDGET_FRACTION', '0.1'))  # then prefer cached data
+    # Prometheus text metrics at /metrics; with METRICS_TOKEN set, scrapers must send "Authorization: Bearer <token>"
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() in ('true', '1', 't')
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+    # Per-request stage timings in a Server-Timing header (adzuna, azure, markdown, saved_jobs, render, total)
+    SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'False').lower() in ('true', '1', 't')
+    # cProfile dumps (.prof) for a random fraction of requests (0 = off). A profiled request runs several times
+    # slower, so keep the rate small in production. PROFILE_SLOW_MS (0 = off) keeps only sampled requests slower
+    # than that. Only the request thread is profiled; time spent waiting on pool stages shows up as waits.
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+    PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', '0'))
+    PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(CACHE_DIR, 'profiles'))
     # Add other default configs here
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'True').lower() in ('true', '1', 't')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') 
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, pool_size=2, max_overflow=2)
+    SQLALCHEMY_BINDS = replica_binds(os.environ.get('DATABASE_REPLICA_URL'), pool_size=2, max_overflow=2)
 
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:' # Use in-memory SQLite for tests
     WTF_CSRF_ENABLED = False # Disable CSRF checks in tests for simplicity
+    SEARCH_CACHE_BACKEND = 'null' # Every test talks to its own mocked upstream
+    HISTOGRAM_CACHE_BACKEND = 'null'
+    TASK_QUEUE_WORKERS = 0 # Tests run queued tasks explicitly with task_queue.run_pending()
+    ADZUNA_RATE_LIMIT_ENABLED = False # Keeps tests from writing limiter state into CACHE_DIR
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000' # Cheap hashes keep the auth tests fast
+    JOB_LISTING_STORE_ENABLED = False # Upstream mocks would fill job_listing; the store tests turn it on
 
 class ProductionConfig(Config):
     # Production configs are mostly driven by the app.yaml envs
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
+    # Per gunicorn worker; keep workers * (pool_size + max_overflow) under the managed database's connection limit
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, pool_size=5, max_overflow=5,
+                                               statement_timeout_ms=15000)
+    # Optional read replica for lag-tolerant reads (saved jobs pages, user loading)
+    SQLALCHEMY_BINDS = replica_binds(os.environ.get('DATABASE_REPLICA_URL'), pool_size=5, max_overflow=5,
+                                     statement_timeout_ms=15000)
+    SEARCH_CACHE_BACKEND = os.getenv('SEARCH_CACHE_BACKEND', 'sqlite') # Shared by all gunicorn workers
+    HISTOGRAM_CACHE_BACKEND = os.getenv('HISTOGRAM_CACHE_BACKEND', 'sqlite')
+    SINGLE_FLIGHT_MODE = os.getenv('SINGLE_FLIGHT_MODE', 'host')
+    # basic-xxs has one vCPU: hash one password at a time so logins cannot starve searches
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '1'))
+    # No proxy sits in front of the app here, so /metrics stays off unless enabled (set METRICS_TOKEN too)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False').lower() in ('true', '1', 't')
     # Add other production-specific settings if needed
 
 config = {
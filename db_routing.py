@@ -0,0 +1,41 @@
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql import Select
+
+logger = logging.getLogger(__name__)
+
+# SQLALCHEMY_BINDS key of the optional read replica (set from DATABASE_REPLICA_URL in config.py)
+REPLICA_BIND = 'replica'
+
+_prefer_replica = ContextVar('prefer_replica', default=False)
+
+
+class RoutingSession(Session):
+    """
+    db.session class that sends plain SELECTs made inside `read_replica()` to the replica
+    engine, when one is configured. Everything else (writes, flushes, SELECTs while the
+    session has unflushed changes) stays on the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _prefer_replica.get() and isinstance(clause, Select) and not self._flushing:
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None and not (self.new or self.dirty or self.deleted):
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def read_replica():
+    """
+    Routes the queries made inside the block to the read replica (a no-op without one).
+    Only use it for reads that can tolerate replication lag.
+    """
+    token = _prefer_replica.set(True)
+    try:
+        yield
+    finally:
+        _prefer_replica.reset(token)
@@ -0,0 +1,188 @@
+import logging
+import os
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+from metrics import UPSTREAM_ERRORS, UPSTREAM_LATENCY
+from profiling import timed
+from recording import RecordingStore
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+DEFAULTS = {
+    'UPSTREAM_POOL_CONNECTIONS': 4,
+    'UPSTREAM_POOL_MAXSIZE': 8,
+    'UPSTREAM_RETRIES': 2,
+    'UPSTREAM_BACKOFF_FACTOR': 0.3,
+    'UPSTREAM_BACKOFF_JITTER': 0.2,
+    'UPSTREAM_BACKOFF_MAX': 2.0,
+    'UPSTREAM_CONNECT_TIMEOUT': 3.05,
+    'UPSTREAM_READ_TIMEOUTS': {'adzuna_search': 20, 'adzuna_histogram': 15, 'azure_ai': 30},
+    'UPSTREAM_MODE': 'live',
+    'UPSTREAM_RECORDINGS_PATH': None,
+    'UPSTREAM_REPLAY_LATENCY_SCALE': 1.0,
+}
+
+MODES = ('live', 'record', 'replay')
+
+
+class CappedRetry(Retry):
+    """
+    Retry whose waits never exceed backoff_max, including ones an upstream asks for in Retry-After,
+    so a single response cannot hold a web worker for as long as the upstream likes.
+    """
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, self.backoff_max)
+
+
+class UpstreamClient:
+    """
+    One pooled HTTP session shared by every Adzuna and Azure call in the process.
+    Connections are kept alive in per-host pools (UPSTREAM_POOL_MAXSIZE connections per host),
+    connection errors and 429/5xx responses are retried with jittered exponential backoff (each
+    wait, Retry-After included, capped at UPSTREAM_BACKOFF_MAX seconds),
+    and each named upstream gets its own read timeout on top of a shared connect timeout.
+    URLs registered with rate_limited() get no 429/5xx retries; their caller retries through its limiter.
+
+    UPSTREAM_MODE 'record' also saves every response (credentials scrubbed) to a RecordingStore;
+    'replay' serves responses from that store instead of the network, sleeping for the recorded
+    latency times UPSTREAM_REPLAY_LATENCY_SCALE.
+    """
+
+    def __init__(self):
+        self.settings = dict(DEFAULTS)
+        self.rate_limited_prefixes = []
+        self.session = self._build_session()
+        self.store = None
+        self._metrics = {}
+
+    def init_app(self, app):
+        for key in DEFAULTS:
+            if key in app.config:
+                self.settings[key] = app.config[key]
+        old_session, self.session = self.session, self._build_session()
+        old_session.close()
+        mode = self.settings['UPSTREAM_MODE']
+        if mode not in MODES:
+            raise ValueError(f"UPSTREAM_MODE must be one of {MODES}, got '{mode}'")
+        self.store = None
+        if mode != 'live':
+            path = self.settings['UPSTREAM_RECORDINGS_PATH'] or os.path.join(
+                app.config.get('CACHE_DIR', '.cache'), 'upstream_recordings.sqlite3')
+            self.store = RecordingStore(path)
+            logger.info(f"--- Upstream client in {mode} mode using {path} ({self.store.count()} recordings) ---")
+        logger.info(f"--- Upstream client: pool_maxsize={self.settings['UPSTREAM_POOL_MAXSIZE']}, "
+                    f"retries={self.settings['UPSTREAM_RETRIES']} ---")
+
+    def _build_session(self):
+        session = requests.Session()
+        session.mount('https://', self._adapter(retry_status=True))
+        session.mount('http://', self._adapter(retry_status=True))
+        for prefix in self.rate_limited_prefixes:
+            session.mount(prefix, self._adapter(retry_status=False))
+        return session
+
+    def _adapter(self, retry_status):
+        retries = self.settings['UPSTREAM_RETRIES']
+        retry = CappedRetry(
+            total=retries,
+            connect=retries,
+            read=0,  # A read timeout already cost us the full timeout; don't pay it twice
+            status=retries if retry_status else 0,
+            status_forcelist=RETRY_STATUS_CODES if retry_status else (),
+            allowed_methods=frozenset({'GET', 'POST'}),
+            backoff_factor=self.settings['UPSTREAM_BACKOFF_FACTOR'],
+            backoff_jitter=self.settings['UPSTREAM_BACKOFF_JITTER'],
+            backoff_max=self.settings['UPSTREAM_BACKOFF_MAX'],
+            respect_retry_after_header=True,  # but never for longer than backoff_max
+            raise_on_status=False,  # Hand the final response back so callers' raise_for_status() reports it
+        )
+        return HTTPAdapter(pool_connections=self.settings['UPSTREAM_POOL_CONNECTIONS'],
+                           pool_maxsize=self.settings['UPSTREAM_POOL_MAXSIZE'],
+                           max_retries=retry)
+
+    def rate_limited(self, prefix):
+        """
+        Turns off 429/5xx retries for URLs under prefix (connection errors are still retried): their
+        caller re-sends through its client-side rate limiter, so every attempt is counted and throttling
+        is seen. Such callers use retry_delay() between attempts.
+        """
+        if prefix not in self.rate_limited_prefixes:
+            self.rate_limited_prefixes.append(prefix)
+            self.session.mount(prefix, self._adapter(retry_status=False))
+
+    def retry_delay(self, response, attempt):
+        """ Seconds to wait before re-sending after `response` (attempt 0 is the first retry), capped like the session's. """
+        retry_after = None
+        header = response.headers.get('Retry-After')
+        if header:
+            try:
+                retry_after = Retry().parse_retry_after(header)
+            except Exception:
+                pass
+        if retry_after is None:
+            retry_after = (self.settings['UPSTREAM_BACKOFF_FACTOR'] * 2 ** attempt
+                           + random.uniform(0, self.settings['UPSTREAM_BACKOFF_JITTER']))
+        return min(retry_after, self.settings['UPSTREAM_BACKOFF_MAX'])
+
+    def timeout(self, upstream):
+        """ (connect, read) timeout tuple for a named upstream. """
+        read_timeout = self.settings['UPSTREAM_READ_TIMEOUTS'].get(upstream, 30)
+        return (self.settings['UPSTREAM_CONNECT_TIMEOUT'], read_timeout)
+
+    @property
+    def replaying(self):
+        """ True when responses come from recordings, so no upstream quota is spent. """
+        return self.settings['UPSTREAM_MODE'] == 'replay'
+
+    def get(self, url, upstream, **kwargs):
+        return self._send(self.session.get, 'GET', url, upstream, kwargs)
+
+    def post(self, url, upstream, **kwargs):
+        return self._send(self.session.post, 'POST', url, upstream, kwargs)
+
+    def _send(self, send, method, url, upstream, kwargs):
+        """ Sends the request, recording its latency and any error against the upstream's metrics. """
+        latency, http_errors, failures, stage = self._upstream_metrics(upstream)
+        started = time.perf_counter()
+        try:
+            with timed(stage):
+                if self.replaying:
+                    response = self._replay(method, url, kwargs)
+                else:
+                    response = send(url, timeout=self.timeout(upstream), **kwargs)
+                    if self.store is not None:
+                        self.store.record(upstream, method, url, kwargs, response,
+                                          (time.perf_counter() - started) * 1000)
+        except requests.exceptions.RequestException:
+            failures.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - started)
+        if response.status_code >= 400:
+            http_errors.inc()
+        return response
+
+    def _replay(self, method, url, kwargs):
+        response, latency_ms = self.store.replay(method, url, kwargs)
+        scale = self.settings['UPSTREAM_REPLAY_LATENCY_SCALE']
+        if scale > 0:
+            time.sleep(latency_ms * scale / 1000)
+        return response
+
+    def _upstream_metrics(self, upstream):
+        bound = self._metrics.get(upstream)
+        if bound is None:
+            bound = self._metrics[upstream] = (UPSTREAM_LATENCY.labels(upstream),
+                                               UPSTREAM_ERRORS.labels(upstream, 'http_status'),
+                                               UPSTREAM_ERRORS.labels(upstream, 'exception'),
+                                               upstream.split('_', 1)[0])  # Server-Timing stage: 'adzuna' / 'azure'
+        return bound
@@ -0,0 +1,108 @@
+import logging
+import re
+
+from sqlalchemy import DateTime, bindparam, text
+
+logger = logging.getLogger(__name__)
+
+# --- Full-Text Index DDL ---
+# job_listing gets a dialect-specific full-text index that is not part of the model: an external-
+# content FTS5 table kept in sync by triggers on SQLite, and a generated tsvector column with a
+# GIN index on Postgres. create_all() runs these through DDL events (see app.py); the migration
+# that adds job_listing runs the same statements.
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS job_listing_fts USING fts5(title, company, location, description,"
+    " content='job_listing', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS job_listing_fts_insert AFTER INSERT ON job_listing BEGIN"
+    " INSERT INTO job_listing_fts(rowid, title, company, location, description)"
+    " VALUES (new.id, new.title, new.company, new.location, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS job_listing_fts_delete AFTER DELETE ON job_listing BEGIN"
+    " INSERT INTO job_listing_fts(job_listing_fts, rowid, title, company, location, description)"
+    " VALUES ('delete', old.id, old.title, old.company, old.location, old.description); END",
+    # Re-seeing a listing only bumps last_seen_at; reindex just when the text changed
+    "CREATE TRIGGER IF NOT EXISTS job_listing_fts_update AFTER UPDATE ON job_listing"
+    " WHEN old.title IS NOT new.title OR old.company IS NOT new.company"
+    " OR old.location IS NOT new.location OR old.description IS NOT new.description BEGIN"
+    " INSERT INTO job_listing_fts(job_listing_fts, rowid, title, company, location, description)"
+    " VALUES ('delete', old.id, old.title, old.company, old.location, old.description);"
+    " INSERT INTO job_listing_fts(rowid, title, company, location, description)"
+    " VALUES (new.id, new.title, new.company, new.location, new.description); END",
+]
+SQLITE_DROP_DDL = ["DROP TABLE IF EXISTS job_listing_fts"]  # the triggers go with job_listing
+
+POSTGRESQL_DDL = [
+    "ALTER TABLE job_listing ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(company, '')), 'B') || "
+    "to_tsvector('english', coalesce(description, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_job_listing_search_vector ON job_listing USING GIN (search_vector)",
+]
+
+# Objects the model does not know about; migrations/env.py keeps autogenerate away from them
+UNMANAGED_TABLE_PREFIX = 'job_listing_fts'
+UNMANAGED_COLUMNS = {('job_listing', 'search_vector')}
+UNMANAGED_INDEXES = {'ix_job_listing_search_vector'}
+
+
+def create_search_index(target, connection, **kw):
+    """ after_create listener for the job_listing table. """
+    statements = {'sqlite': SQLITE_DDL, 'postgresql': POSTGRESQL_DDL}.get(connection.dialect.name)
+    if statements is None:
+        logger.warning(f"No full-text index for {connection.dialect.name}; local search is unavailable.")
+        return
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+def drop_search_index(target, connection, **kw):
+    """ before_drop listener for the job_listing table (the FTS5 table would otherwise outlive it). """
+    if connection.dialect.name == 'sqlite':
+        for statement in SQLITE_DROP_DDL:
+            connection.execute(text(statement))
+
+
+# --- Queries ---
+# Same keys as the listings search_adzuna() builds, so templates and the AI prompt take either
+LISTING_COLUMNS = ('jl.adzuna_job_id, jl.title, jl.company, jl.location, jl.description,'
+                   ' jl.adzuna_url AS url, jl.created')
+
+_SQLITE_FROM = ("FROM job_listing_fts JOIN job_listing jl ON jl.id = job_listing_fts.rowid"
+                " WHERE job_listing_fts MATCH :what AND jl.country = :country AND jl.last_seen_at >= :since"
+                " AND lower(jl.location) LIKE :where ESCAPE '\\'")
+_POSTGRESQL_FROM = ("FROM job_listing jl, plainto_tsquery('english', :what) query"
+                    " WHERE jl.search_vector @@ query AND jl.country = :country AND jl.last_seen_at >= :since"
+                    " AND lower(jl.location) LIKE :where ESCAPE '\\'")
+_ORDER = {'sqlite': 'ORDER BY job_listing_fts.rank, jl.last_seen_at DESC',
+          'postgresql': 'ORDER BY ts_rank(jl.search_vector, query) DESC, jl.last_seen_at DESC'}
+
+
+def like_pattern(value):
+    """ LIKE pattern matching `value` anywhere, with its own % and _ taken literally (escaped with \\). """
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def fts5_query(what):
+    """ FTS5 MATCH expression requiring every word of `what` (quoted, so user input is never syntax). """
+    return ' '.join(f'"{word}"' for word in re.findall(r'\w+', what.lower()))
+
+
+def search_listings(connection, country, what, where, since, limit, offset=0):
+    """
+    Full-text search over stored listings seen since `since`: every word of `what` must match
+    (title, company, location or description, stemmed) and `where` must appear in the location.
+    Returns (total_matches, [listing dicts]) in relevance order, or (0, []) if nothing is searchable.
+    """
+    dialect = connection.dialect.name
+    if dialect not in _ORDER or not re.search(r'\w', what or ''):
+        return 0, []
+    params = {'what': fts5_query(what) if dialect == 'sqlite' else what, 'country': country.lower(),
+              'since': since, 'where': like_pattern((where or '').strip().lower()), 'limit': limit, 'offset': offset}
+    from_clause = _SQLITE_FROM if dialect == 'sqlite' else _POSTGRESQL_FROM
+    since_param = bindparam('since', type_=DateTime())  # stored format, not the driver's default
+    total = connection.execute(text(f"SELECT COUNT(*) {from_clause}").bindparams(since_param), params).scalar()
+    if not total:
+        return 0, []
+    rows = connection.execute(text(f"SELECT {LISTING_COLUMNS} {from_clause} {_ORDER[dialect]}"
+                                   " LIMIT :limit OFFSET :offset").bindparams(since_param), params)
+    return total, [dict(row._mapping) for row in rows]
@@ -0,0 +1,204 @@
+import bisect
+import logging
+import threading
+import time
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+# --- Metric Types ---
+# Callers bind label values once (`metric.labels('adzuna_search')`) and keep the child;
+# recording is then a short critical section on the child's own lock.
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        """ Returns the child for these label values, creating it on first use. Bind once, reuse. """
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _label_text(self, values, extra=()):
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)]
+        pairs.extend(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._sample_lines(values, child))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def _sample_lines(self, values, child):
+        return [f"{self.name}{self._label_text(values)} {child.value}"]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _sample_lines(self, values, child):
+        counts, total = child.snapshot()
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            bucket_label = f'le="{le}"'
+            lines.append(f"{self.name}_bucket{self._label_text(values, [bucket_label])} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text(values)} {total}")
+        lines.append(f"{self.name}_count{self._label_text(values)} {cumulative}")
+        return lines
+
+
+class GaugeCallback(_Metric):
+    """ Gauge read at scrape time from func(), which returns {label_values_tuple: value}. """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames, func):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            for values, value in sorted(self.func().items()):
+                lines.append(f"{self.name}{self._label_text(values)} {value}")
+        except Exception as e:
+            logger.error(f"Could not collect {self.name}: {e}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REGISTRY = []
+
+
+def render():
+    """ All metrics in the Prometheus text exposition format. """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    return '\n'.join(lines) + '\n'
+
+
+# --- Application Metrics ---
+UPSTREAM_LATENCY = Histogram('upstream_request_duration_seconds',
+                             'Time until an upstream (Adzuna/Azure) response arrived, including retries.', ('upstream',))
+UPSTREAM_ERRORS = Counter('upstream_errors_total',
+                          'Upstream calls that raised or returned an HTTP error status.', ('upstream', 'kind'))
+REQUEST_LATENCY = Histogram('http_request_duration_seconds',
+                            'Time spent in a main blueprint view until the response was returned.', ('endpoint',))
+CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups by outcome.', ('cache', 'result'))
+DB_QUERY_DURATION = Histogram('db_query_duration_seconds', 'SQL statement execution time.', ('operation',),
+                              buckets=DB_BUCKETS)
+
+DB_OPERATIONS = ('select', 'insert', 'update', 'delete')
+_db_children = {op: DB_QUERY_DURATION.labels(op) for op in DB_OPERATIONS + ('other',)}
+_request_children = {}
+_db_events_registered = False
+
+
+def init_app(app, blueprint_name):
+    """ Times every view of the named blueprint and every SQL statement run through SQLAlchemy. """
+    global _db_events_registered
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint.startswith(f"{blueprint_name}."):
+            _request_children[rule.endpoint] = REQUEST_LATENCY.labels(rule.endpoint)
+
+    @app.before_request
+    def _start_request_timer():
+        if request.blueprint == blueprint_name:
+            g._metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request_latency(response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            child = _request_children.get(request.endpoint)
+            if child is not None:
+                child.observe(time.perf_counter() - started)
+        return response
+
+    if not _db_events_registered:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _db_events_registered = True
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context rather than the connection, so a statement that raises
+    # (and never reaches after_cursor_execute) leaves nothing behind
+    if context is not None:
+        context._metrics_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_query_start', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    operation = statement[:6].lower()
+    _db_children.get(operation, _db_children['other']).observe(elapsed)
@@ -5,6 +5,8 @@ from flask import current_app
 
 from alembic import context
 
+from listing_search import UNMANAGED_COLUMNS, UNMANAGED_INDEXES, UNMANAGED_TABLE_PREFIX
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -51,6 +53,19 @@ def get_metadata():
     return target_db.metadata
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    """Keeps autogenerate away from the full-text index objects created
+    outside the models (the FTS5 tables on SQLite, the tsvector column on
+    Postgres; see listing_search.py)."""
+    if type_ == 'table' and name.startswith(UNMANAGED_TABLE_PREFIX):
+        return False
+    if type_ == 'column' and reflected and (object.table.name, name) in UNMANAGED_COLUMNS:
+        return False
+    if type_ == 'index' and reflected and name in UNMANAGED_INDEXES:
+        return False
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -65,7 +80,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -93,6 +109,7 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    conf_args.setdefault("include_object", include_object)
 
     connectable = get_engine()
 
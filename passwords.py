@@ -0,0 +1,83 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from profiling import timed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'  # werkzeug's default, spelled out so stored hashes can be compared
+
+
+class HashingBusy(Exception):
+    """ Raised when the hashing pool stayed full for longer than PASSWORD_HASH_QUEUE_TIMEOUT. """
+
+
+class PasswordHasher:
+    """
+    Password hashing with the method and cost taken from config (PASSWORD_HASH_METHOD, any
+    werkzeug method string such as 'scrypt:16384:8:1' or 'pbkdf2:sha256:600000').
+
+    Hashing runs on a small per-process pool (PASSWORD_HASH_WORKERS threads; hashlib releases
+    the GIL) and at most PASSWORD_HASH_MAX_PENDING calls may wait for it, so a burst of logins
+    uses a bounded share of the CPU and leaves the rest to search requests.
+    """
+
+    def __init__(self):
+        self.method = DEFAULT_METHOD
+        self.workers = 2
+        self.max_pending = 16
+        self.queue_timeout = 5.0
+        self._executor = None
+        self._slots = None
+        self._prefixes = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        cfg = app.config
+        self.method = cfg.get('PASSWORD_HASH_METHOD', self.method)
+        self.workers = cfg.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.max_pending = cfg.get('PASSWORD_HASH_MAX_PENDING', self.max_pending)
+        self.queue_timeout = cfg.get('PASSWORD_HASH_QUEUE_TIMEOUT', self.queue_timeout)
+        self._executor, self._slots = None, None
+        logger.info(f"--- Password hashing: method={self.method}, workers={self.workers}, "
+                    f"max pending={self.max_pending} ---")
+
+    def _submit(self, func, *args):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._slots = threading.BoundedSemaphore(self.workers + self.max_pending)
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password')
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HashingBusy(f"Password hashing pool busy for {self.queue_timeout}s")
+        try:
+            future = self._executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def hash(self, password):
+        with timed('password'):
+            return self._submit(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        with timed('password'):
+            return self._submit(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """ True when a stored hash was made with a different method or cost than configured. """
+        return password_hash.split('$', 1)[0] != self._prefix(self.method)
+
+    def _prefix(self, method):
+        # werkzeug fills in defaults for short forms like 'scrypt' or 'pbkdf2:sha256', so the
+        # stored prefix is only known after hashing once with the method.
+        prefix = self._prefixes.get(method)
+        if prefix is None:
+            prefix = generate_password_hash('', method).split('$', 1)[0]
+            self._prefixes[method] = prefix
+        return prefix
@@ -0,0 +1,251 @@
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_TIMEOUT = 120.0  # seconds a pipeline run waits for its stages
+
+# --- Shared Thread Pool ---
+# One bounded pool per process, shared by every request handled by the worker,
+# so a traffic spike can never fan out into an unbounded number of upstream calls.
+_executor = None
+_executor_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_executor():
+    """ Returns the process-wide upstream thread pool, creating it on first use. """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = DEFAULT_MAX_WORKERS
+                if has_app_context():
+                    max_workers = current_app.config.get('UPSTREAM_MAX_WORKERS', DEFAULT_MAX_WORKERS)
+                logger.info(f"Starting upstream thread pool with {max_workers} workers.")
+                _executor = ThreadPoolExecutor(max_workers=max_workers,
+                                               thread_name_prefix='upstream',
+                                               initializer=_mark_pool_thread)
+    return _executor
+
+
+def _mark_pool_thread():
+    _local.in_pool = True
+
+
+def in_pool_thread():
+    """ True when called from one of the shared pool's worker threads. """
+    return getattr(_local, 'in_pool', False)
+
+
+def with_app_context(func):
+    """
+    Wraps func so it runs inside the current app context on whichever thread calls it,
+    with a copy of the caller's context variables (e.g. the request's stage timings).
+    """
+    app = current_app._get_current_object() if has_app_context() else None
+    context = contextvars.copy_context()
+
+    def call(*args, **kwargs):
+        if app is None:
+            return context.copy().run(func, *args, **kwargs)
+        with app.app_context():
+            return context.copy().run(func, *args, **kwargs)
+    return call
+
+
+def submit(func, *args, **kwargs):
+    """ Runs func on the shared pool inside the current app context (fire-and-forget friendly). """
+    return get_executor().submit(with_app_context(func), *args, **kwargs)
+
+
+# --- Stage Pipeline ---
+class PipelineResult:
+    """ Outcome of a pipeline run: per-stage results, errors and timings (ms). """
+
+    def __init__(self):
+        self.results = {}
+        self.errors = {}
+        self.timings = {}
+        self.total_ms = 0.0
+
+    def ok(self, name):
+        return name in self.results
+
+    def get(self, name, default=None):
+        return self.results.get(name, default)
+
+
+class _Stage:
+    def __init__(self, name, func, after):
+        self.name = name
+        self.func = func
+        self.after = tuple(after)
+
+
+class StagePipeline:
+    """
+    Runs a small graph of named stages on the shared thread pool.
+    A stage starts as soon as every stage listed in its `after` has finished,
+    and receives their results as positional arguments (in `after` order).
+    If a dependency fails, the dependent stage is skipped and recorded as failed.
+    Stages that have not finished after `timeout` seconds (PIPELINE_TIMEOUT) are recorded
+    as failed with a TimeoutError and the run returns without them.
+    """
+
+    def __init__(self, executor=None, timeout=None):
+        self._executor = executor
+        self._timeout = timeout
+        self._stages = []
+
+    def add(self, name, func, after=()):
+        known = {stage.name for stage in self._stages}
+        missing = [dep for dep in after if dep not in known]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on unknown stage(s): {missing}")
+        self._stages.append(_Stage(name, func, after))
+        return self
+
+    def run(self):
+        result = PipelineResult()
+        started = time.perf_counter()
+        app = current_app._get_current_object() if has_app_context() else None
+        context = contextvars.copy_context()
+
+        if in_pool_thread():
+            # Already on a pool worker (e.g. a batch job): waiting on the pool from
+            # inside it could deadlock when it is saturated, so run inline instead.
+            for stage in self._stages:
+                if self._dependency_failed(stage, result):
+                    continue
+                self._execute(stage, result, None, time.perf_counter())
+        else:
+            self._run_concurrently(result, app, context)
+
+        result.total_ms = (time.perf_counter() - started) * 1000
+        stage_summary = ", ".join(f"{name}={ms:.1f}ms" for name, ms in result.timings.items())
+        logger.info(f"Pipeline finished in {result.total_ms:.1f}ms ({stage_summary})")
+        return result
+
+    def _run_concurrently(self, result, app, context):
+        # Stages write into `live`; the caller's result only gets a copy, so stages still
+        # running after a timeout cannot change it while it is being read.
+        live = PipelineResult()
+        executor = self._executor or get_executor()
+        finished = set()
+        waiting = list(self._stages)
+        all_done = threading.Event()
+        lock = threading.Lock()
+
+        def settle():
+            # Caller must hold the lock
+            ready = self._take_ready(waiting, finished, live)
+            if len(finished) == len(self._stages):
+                all_done.set()
+            return ready
+
+        def launch(stages):
+            for stage in stages:
+                future = self._submit(executor, stage, live, app, context, lock)
+                if future is None:
+                    on_done(stage.name)
+                else:
+                    future.add_done_callback(lambda _f, name=stage.name: on_done(name))
+
+        def on_done(name):
+            with lock:
+                finished.add(name)
+                ready = settle()
+            launch(ready)
+
+        with lock:
+            ready = settle()
+        launch(ready)
+        if all_done.wait(self._run_timeout(app)):
+            self._copy(live, result)
+            return
+        with lock:
+            waiting.clear()  # nothing else starts once the caller has given up
+            self._copy(live, result)
+        self._time_out(result)
+
+    def _take_ready(self, waiting, finished, result):
+        """
+        Removes from `waiting` and returns every stage whose dependencies have all finished,
+        skipping (and marking finished) those with a failed dependency.
+        """
+        ready = []
+        progressed = True
+        while progressed:
+            progressed = False
+            for stage in list(waiting):
+                if not all(dep in finished for dep in stage.after):
+                    continue
+                waiting.remove(stage)
+                if self._dependency_failed(stage, result):
+                    finished.add(stage.name)
+                    progressed = True
+                else:
+                    ready.append(stage)
+        return ready
+
+    def _submit(self, executor, stage, result, app, context, lock):
+        """ Queues a stage on the pool; if the pool rejects it, records the error and returns None. """
+        try:
+            return executor.submit(context.copy().run, self._execute, stage, result, app, time.perf_counter())
+        except Exception as e:  # e.g. the pool is shutting down
+            logger.error(f"Could not start stage '{stage.name}': {e}")
+            with lock:
+                result.errors[stage.name] = e
+            return None
+
+    def _run_timeout(self, app):
+        if self._timeout is not None:
+            return self._timeout
+        return app.config.get('PIPELINE_TIMEOUT', DEFAULT_TIMEOUT) if app is not None else DEFAULT_TIMEOUT
+
+    @staticmethod
+    def _copy(live, result):
+        result.results.update(live.results.copy())
+        result.errors.update(live.errors.copy())
+        result.timings.update(live.timings.copy())
+
+    def _time_out(self, result):
+        pending = [stage.name for stage in self._stages
+                   if stage.name not in result.results and stage.name not in result.errors]
+        logger.error(f"Pipeline timed out waiting for stage(s) {pending}.")
+        for name in pending:
+            result.errors[name] = TimeoutError(f"Stage '{name}' did not finish in time")
+
+    @staticmethod
+    def _dependency_failed(stage, result):
+        failed = [dep for dep in stage.after if dep in result.errors]
+        if failed:
+            logger.warning(f"Skipping stage '{stage.name}' because {failed} failed.")
+            result.errors[stage.name] = RuntimeError(f"Skipped: dependency {failed[0]} failed")
+            return True
+        return False
+
+    @staticmethod
+    def _execute(stage, result, app, queued_at):
+        start = time.perf_counter()
+        wait_ms = (start - queued_at) * 1000
+        if wait_ms > 50:
+            logger.info(f"Stage '{stage.name}' waited {wait_ms:.1f}ms for a pool worker.")
+        args = [result.results[dep] for dep in stage.after]
+        try:
+            if app is None:
+                result.results[stage.name] = stage.func(*args)
+            else:
+                with app.app_context():
+                    result.results[stage.name] = stage.func(*args)
+        except Exception as e:
+            result.errors[stage.name] = e
+        finally:
+            result.timings[stage.name] = (time.perf_counter() - start) * 1000
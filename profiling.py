@@ -0,0 +1,129 @@
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from functools import partial
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# Timings of the request being handled. Pipeline stages run on pool threads with a copy
+# of the caller's context, so their spans land in the same RequestTimings.
+_current = ContextVar('request_timings', default=None)
+_NOT_TIMED = nullcontext()
+
+
+class RequestTimings:
+    """ Wall-clock span per stage name; overlapping calls (e.g. parallel Adzuna pages) merge into one span. """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, start, end):
+        with self._lock:
+            span = self.spans.get(name)
+            self.spans[name] = (start, end) if span is None else (min(span[0], start), max(span[1], end))
+
+    def header(self):
+        with self._lock:
+            parts = [f"{name};dur={(end - start) * 1000:.1f}" for name, (start, end) in self.spans.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ', '.join(parts)
+
+
+class _Span:
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timings.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+def timed(name):
+    """ Context manager timing one stage of the current request; a shared no-op when timing is off. """
+    timings = _current.get()
+    if timings is None:
+        return _NOT_TIMED
+    return _Span(timings, name)
+
+
+def init_app(app):
+    """
+    Adds a Server-Timing header (SERVER_TIMING_ENABLED) and writes cProfile dumps to PROFILE_DIR
+    for a PROFILE_SAMPLE_RATE fraction of requests, keeping only those slower than PROFILE_SLOW_MS
+    when it is set. Only sampled requests run under the profiler, which slows them several times
+    over. Registers no hooks at all when everything is off.
+    """
+    server_timing = app.config.get('SERVER_TIMING_ENABLED', False)
+    sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+    slow_ms = app.config.get('PROFILE_SLOW_MS', 0)
+    if slow_ms > 0 and sample_rate <= 0:
+        logger.warning("PROFILE_SLOW_MS has no effect without PROFILE_SAMPLE_RATE; no requests will be profiled.")
+    if not (server_timing or sample_rate > 0):
+        return
+    logger.info(f"--- Request profiling: server_timing={server_timing}, sample_rate={sample_rate}, slow_ms={slow_ms} ---")
+    app.before_request(partial(_start_request, sample_rate))
+    if server_timing:
+        app.after_request(_add_server_timing)
+    app.teardown_request(partial(_finish_request, slow_ms, app.config.get('PROFILE_DIR', 'profiles')))
+
+
+def _start_request(sample_rate):
+    g._timings_token = _current.set(RequestTimings())
+    g._request_started = time.perf_counter()
+    if sample_rate > 0 and random.random() < sample_rate:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:  # another profiler is already active on this thread
+            logger.warning(f"Could not start request profiler: {e}")
+            return
+        g._profiler = profiler
+
+
+def _add_server_timing(response):
+    timings = _current.get()
+    if timings is not None:
+        response.headers['Server-Timing'] = timings.header()
+    return response
+
+
+def _finish_request(slow_ms, profile_dir, exc):
+    token = g.pop('_timings_token', None)
+    if token is not None:
+        try:
+            _current.reset(token)
+        except ValueError:  # streamed responses can finish in a different context
+            _current.set(None)
+    profiler = g.pop('_profiler', None)
+    if profiler is None:
+        return
+    profiler.disable()
+    elapsed_ms = (time.perf_counter() - g.pop('_request_started')) * 1000
+    if elapsed_ms >= slow_ms:
+        _dump_profile(profiler, profile_dir, elapsed_ms)
+
+
+def _dump_profile(profiler, profile_dir, elapsed_ms):
+    endpoint = (request.endpoint or 'unknown').replace('.', '-')
+    path = os.path.join(profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{elapsed_ms:.0f}ms-{os.getpid()}.prof")
+    try:
+        os.makedirs(profile_dir, exist_ok=True)
+        profiler.dump_stats(path)
+        logger.info(f"Wrote request profile to {path} (open with `python -m pstats` or snakeviz).")
+    except OSError as e:
+        logger.error(f"Could not write request profile {path}: {e}")
@@ -0,0 +1,179 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """ Raised when no token became available in time, or the daily quota is used up. """
+
+
+class RateLimiter:
+    """
+    Client-side token bucket plus daily quota for one set of API credentials, kept in a
+    small SQLite file so every gunicorn worker on the host draws from the same budget.
+
+    Callers wait up to `<PREFIX>_MAX_WAIT` seconds for a token; batch work (reports, trend
+    snapshots) runs inside `patient()` and waits up to `<PREFIX>_BATCH_MAX_WAIT` instead, so the
+    limiter paces it rather than failing it. The refill rate adapts:
+    it halves on every 429 and creeps back up towards the configured rate while responses
+    are healthy (additive increase, multiplicative decrease).
+    """
+
+    def __init__(self, name, config_prefix=None):
+        self.name = name
+        self.config_prefix = config_prefix or f"{name.upper()}_RATE_LIMIT"
+        self.enabled = False
+        self.rate = 1.0
+        self.min_rate = 0.1
+        self.burst = 5
+        self.daily_quota = 1000
+        self.max_wait = 2.0
+        self.batch_max_wait = 300.0
+        self.low_budget_fraction = 0.1
+        self.path = None
+        self._local = threading.local()
+        self._max_wait_override = ContextVar(f'{name}_max_wait', default=None)
+
+    def init_app(self, app):
+        cfg, prefix = app.config, self.config_prefix
+        self.enabled = cfg.get(f"{prefix}_ENABLED", True)
+        self.rate = cfg.get(f"{prefix}_PER_SECOND", self.rate)
+        self.min_rate = min(self.rate, cfg.get(f"{prefix}_MIN_PER_SECOND", self.min_rate))
+        self.burst = cfg.get(f"{prefix}_BURST", self.burst)
+        self.daily_quota = cfg.get(f"{prefix}_DAILY_QUOTA", self.daily_quota)
+        self.max_wait = cfg.get(f"{prefix}_MAX_WAIT", self.max_wait)
+        self.batch_max_wait = cfg.get(f"{prefix}_BATCH_MAX_WAIT", self.batch_max_wait)
+        self.low_budget_fraction = cfg.get(f"{prefix}_LOW_BUDGET_FRACTION", self.low_budget_fraction)
+        if self.enabled:
+            self.open(os.path.join(cfg.get('CACHE_DIR', '.cache'), 'ratelimit.sqlite3'))
+        logger.info(f"--- {self.name} rate limiter: enabled={self.enabled}, {self.rate}/s, "
+                    f"burst={self.burst}, daily quota={self.daily_quota} ---")
+
+    def open(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS bucket (name TEXT PRIMARY KEY, tokens REAL NOT NULL, rate REAL NOT NULL,'
+            ' updated_at REAL NOT NULL, day TEXT NOT NULL, day_count INTEGER NOT NULL, last_throttled REAL NOT NULL)')
+        conn.execute('INSERT OR IGNORE INTO bucket VALUES (?, ?, ?, ?, ?, 0, 0)',
+                     (self.name, float(self.burst), float(self.rate), time.time(), self._today()))
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+    def _load(self, conn, now):
+        """ Reads the bucket row, applying refill and the daily roll-over. Caller holds the write lock. """
+        tokens, rate, updated_at, day, day_count, last_throttled = conn.execute(
+            'SELECT tokens, rate, updated_at, day, day_count, last_throttled FROM bucket WHERE name = ?',
+            (self.name,)).fetchone()
+        tokens = min(float(self.burst), tokens + max(0.0, now - updated_at) * rate)
+        today = self._today()
+        if day != today:
+            day, day_count = today, 0
+        return tokens, rate, day, day_count, last_throttled
+
+    @contextmanager
+    def patient(self):
+        """
+        Lets acquire() calls made inside the block (and in pipeline stages it starts, which copy
+        the context) wait up to batch_max_wait for a token instead of max_wait.
+        """
+        token = self._max_wait_override.set(self.batch_max_wait)
+        try:
+            yield
+        finally:
+            self._max_wait_override.reset(token)
+
+    def acquire(self):
+        """ Takes one token, waiting up to max_wait seconds (see patient). Raises RateLimitExceeded otherwise. """
+        if not self.enabled:
+            return
+        max_wait = self._max_wait_override.get()
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        while True:
+            conn = self._connection()
+            now = time.time()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                tokens, rate, day, day_count, last_throttled = self._load(conn, now)
+                if day_count >= self.daily_quota:
+                    raise RateLimitExceeded(f"{self.name} daily quota of {self.daily_quota} requests used up.")
+                granted = tokens >= 1
+                if granted:
+                    tokens -= 1
+                    day_count += 1
+                conn.execute('UPDATE bucket SET tokens = ?, updated_at = ?, day = ?, day_count = ? WHERE name = ?',
+                             (tokens, now, day, day_count, self.name))
+            if granted:
+                return
+            wait = (1 - tokens) / rate
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                raise RateLimitExceeded(f"{self.name} rate limit: no request budget within {max_wait}s.")
+            time.sleep(wait)
+
+    def record_response(self, status_code):
+        """ Adapts the refill rate: halve it on 429, otherwise recover gradually towards the configured rate. """
+        if not self.enabled:
+            return
+        conn = self._connection()
+        now = time.time()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            tokens, rate, day, day_count, last_throttled = self._load(conn, now)
+            if status_code == 429:
+                new_rate, last_throttled, tokens = max(self.min_rate, rate / 2), now, 0.0
+                logger.warning(f"{self.name} returned 429: slowing client-side rate to {new_rate:.2f}/s.")
+            elif rate < self.rate and now - last_throttled > 30:
+                new_rate = min(self.rate, rate + self.rate * 0.1)
+            else:
+                return
+            conn.execute('UPDATE bucket SET tokens = ?, rate = ?, updated_at = ?, day = ?, day_count = ?,'
+                         ' last_throttled = ? WHERE name = ?',
+                         (tokens, new_rate, now, day, day_count, last_throttled, self.name))
+
+    def usage(self):
+        """ Current budget as a dict (for the /quota endpoint and metrics). """
+        if not self.enabled:
+            return {'name': self.name, 'enabled': False}
+        conn = self._connection()
+        tokens, rate, day, day_count, _ = self._load(conn, time.time())
+        return {'name': self.name, 'enabled': True, 'day': day, 'used_today': day_count,
+                'daily_quota': self.daily_quota, 'remaining_today': max(0, self.daily_quota - day_count),
+                'tokens_available': round(tokens, 2), 'current_rate_per_second': round(rate, 3),
+                'configured_rate_per_second': self.rate, 'budget_low': self._budget_low(day_count)}
+
+    def budget_low(self):
+        """ True once less than LOW_BUDGET_FRACTION of today's quota remains; callers should prefer cached data. """
+        if not self.enabled:
+            return False
+        try:
+            _, _, _, day_count, _ = self._load(self._connection(), time.time())
+        except Exception as e:
+            logger.error(f"Could not read {self.name} rate limit state: {e}")
+            return False
+        return self._budget_low(day_count)
+
+    def _budget_low(self, day_count):
+        return self.daily_quota - day_count < self.daily_quota * self.low_budget_fraction
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+logger = logging.getLogger(__name__)
+
+# Never written to the store: Adzuna sends credentials as query params, Azure as a header
+# (request headers are not stored at all).
+SCRUBBED_PARAMS = frozenset({'app_id', 'app_key', 'api-key', 'api_key', 'key', 'code', 'sig'})
+KEPT_RESPONSE_HEADERS = ('Content-Type', 'Retry-After')
+
+
+class ReplayMissError(requests.exceptions.ConnectionError):
+    """ Replay mode found no recording for a request; handled like an unreachable upstream. """
+
+
+def _scrub_url(url, params):
+    """ URL with request params merged in, credentials removed and the query sorted (so it is a stable key). """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query.extend((str(k), str(v)) for k, v in params.items() if v is not None)
+    query = sorted((k, v) for k, v in query if k.lower() not in SCRUBBED_PARAMS)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+
+def request_key(method, url, params=None, json_body=None):
+    """ Stable key for a request: method, scrubbed URL and a hash of the JSON body. """
+    body = json.dumps(json_body, sort_keys=True, separators=(',', ':')) if json_body is not None else ''
+    raw = f"{method.upper()} {_scrub_url(url, params)} {body}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest(), _scrub_url(url, params)
+
+
+class RecordingStore:
+    """
+    Compact on-disk store of upstream responses: one row per distinct request (the latest
+    response wins), bodies zlib-compressed, in a single SQLite file that can be copied
+    between machines to reproduce a production session.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS recordings (key TEXT PRIMARY KEY, upstream TEXT NOT NULL,'
+            ' method TEXT NOT NULL, url TEXT NOT NULL, status INTEGER NOT NULL, headers TEXT NOT NULL,'
+            ' body BLOB NOT NULL, latency_ms REAL NOT NULL, recorded_at REAL NOT NULL)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def record(self, upstream, method, url, kwargs, response, latency_ms):
+        key, scrubbed_url = request_key(method, url, kwargs.get('params'), kwargs.get('json'))
+        headers = {name: response.headers[name] for name in KEPT_RESPONSE_HEADERS if name in response.headers}
+        self._connection().execute(
+            'INSERT OR REPLACE INTO recordings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, upstream, method.upper(), scrubbed_url, response.status_code, json.dumps(headers),
+             zlib.compress(response.content, 6), latency_ms, time.time()))
+
+    def replay(self, method, url, kwargs):
+        """ Returns (requests.Response, original_latency_ms). Raises ReplayMissError if nothing was recorded. """
+        key, scrubbed_url = request_key(method, url, kwargs.get('params'), kwargs.get('json'))
+        row = self._connection().execute(
+            'SELECT status, headers, body, latency_ms FROM recordings WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            raise ReplayMissError(f"No recorded response for {method.upper()} {scrubbed_url}")
+        status, headers, body, latency_ms = row
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(json.loads(headers))
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = url
+        response._content = zlib.decompress(body)
+        response._content_consumed = True  # iter_lines()/iter_content() serve the stored body
+        return response, latency_ms
+
+    def count(self):
+        return self._connection().execute('SELECT COUNT(*) FROM recordings').fetchone()[0]
@@ -1,13 +1,26 @@
 from flask import (Blueprint, render_template, request, flash, redirect, url_for,
-                   jsonify, current_app) # Import current_app for logger
+                   jsonify, current_app, Response, stream_with_context) # Import current_app for logger
 from flask_login import login_required, current_user, login_user, logout_user
 import logging
+import hmac
+import json
+import csv
+import io
 from urllib.parse import urlparse, urlunparse # Added urlunparse
 
 # Import necessary components from your main module (or models/forms files if separated)
 # Assuming app.py structure where these are defined or imported
-from app import db, User, SavedJob, RegistrationForm, LoginForm
+from app import db, User, RegistrationForm, LoginForm
 from app import fetch_market_insights # Import the main data fetching helper
+from app import gather_summary_inputs, stream_ai_summary, enqueue_ai_summary, task_queue
+from app import iter_market_report, REPORT_FIELDS, compare_salaries
+from app import market_trend, track_query
+from app import adzuna_limiter, saved_job_ids_for, invalidate_saved_job_ids
+from app import invalidate_cached_user
+from passwords import HashingBusy
+from app import save_jobs, unsave_jobs, saved_jobs_page, iter_saved_jobs, SAVED_JOB_FIELDS, SAVED_JOB_EXPORT_FIELDS
+import metrics
+from profiling import timed
 
 # Create a Blueprint
 main_bp = Blueprint('main_bp', __name__)
@@ -24,29 +37,119 @@ def home():
     country = request.args.get('country', '')
     # Get the summary flag, default to 'true' if not present or doing initial load
     generate_summary_flag = request.args.get('generate_summary', 'true') == 'true'
+    # Page shown to the user, and how many Adzuna result pages (of 20) make up one page
+    page = max(1, request.args.get('page', 1, type=int))
+    pages = min(max(1, request.args.get('pages', 1, type=int)), current_app.config.get('MAX_RESULT_PAGES', 1))
 
     form_data = {
         'what': what,
         'where': where,
         'country': country,
-        'generate_summary': 'true' if generate_summary_flag else 'false' # Keep for form pre-fill
+        'generate_summary': 'true' if generate_summary_flag else 'false', # Keep for form pre-fill
+        'pages': pages
     }
 
     insights_data = None
     saved_job_ids = set()
+    summary_stream_url = None
+    summary_task_url = None
+    # In 'stream' and 'queue' modes the page renders without waiting for Azure; the summary
+    # is then streamed in over SSE, or generated on the task queue and polled for.
+    summary_mode = current_app.config.get('AI_SUMMARY_MODE')
+    deferred_summary = generate_summary_flag and summary_mode in ('stream', 'queue')
 
     if what and where and country:
         logger.info(f"Home route received search parameters: {form_data}")
         # Pass the boolean flag to the fetch function
-        insights_data = fetch_market_insights(what, where, country, generate_summary=generate_summary_flag)
+        insights_data = fetch_market_insights(what, where, country,
+                                              generate_summary=generate_summary_flag and not deferred_summary,
+                                              page=page, pages=pages)
+        if insights_data and deferred_summary and summary_mode == 'stream':
+            summary_stream_url = url_for('main_bp.stream_summary', what=what, where=where, country=country)
+        elif insights_data and deferred_summary:
+            try:
+                task = enqueue_ai_summary(what, where, country)
+                summary_task_url = url_for('main_bp.task_status', token=task.token)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Could not queue AI summary task: {e}")
 
     if current_user.is_authenticated:
-        saved_job_ids = {job.adzuna_job_id for job in current_user.saved_jobs}
+        with timed('saved_jobs'):
+            shown_ids = [job['adzuna_job_id'] for job in insights_data['job_listings']] if insights_data else []
+            saved_job_ids = saved_job_ids_for(current_user.id, shown_ids)
+
+    with timed('render'):
+        return render_template('index.html',
+                               insights=insights_data,
+                               form_data=form_data, # Pass form_data to pre-fill search boxes & checkbox
+                               saved_job_ids=saved_job_ids,
+                               summary_stream_url=summary_stream_url,
+                               summary_task_url=summary_task_url)
+
+
+@main_bp.route('/insights/summary/stream')
+def stream_summary():
+    """ Streams the AI summary for a search as server-sent events ('chunk' deltas, then the final 'html'). """
+    what = request.args.get('what', '')
+    where = request.args.get('where', '')
+    country = request.args.get('country', '')
+    if not all([what, where, country]):
+        return jsonify({'status': 'error', 'message': 'Missing search criteria.'}), 400
+    query_details = {'what': what, 'where': where, 'country': country}
 
-    return render_template('index.html',
-                           insights=insights_data,
-                           form_data=form_data, # Pass form_data to pre-fill search boxes & checkbox
-                           saved_job_ids=saved_job_ids)
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def generate():
+        yield ": stream open\n\n" # Flushes headers so the browser knows the stream is live
+        completed = False
+        try:
+            total_jobs, job_listings, salary_data = gather_summary_inputs(what, where, country)
+            for event, data in stream_ai_summary(query_details, total_jobs, job_listings[:10], salary_data):
+                completed = completed or event == 'html'
+                yield sse(event, data)
+        except Exception as e:
+            logger.error(f"Error streaming AI summary for {query_details}: {e}")
+        if not completed:
+            yield sse('error', 'Could not generate AI summary.')
+        yield sse('done', '')
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@main_bp.route('/tasks/<token>')
+def task_status(token):
+    """
+    Returns a background task's status and, once done, its result (polled by index.html).
+    Tasks are addressed by their random token, so only pages that queued one can poll it.
+    """
+    task = task_queue.get_by_token(token)
+    if task is None:
+        return jsonify({'status': 'error', 'message': 'Task not found.'}), 404
+    return jsonify(task.to_dict())
+
+
+@main_bp.route('/metrics')
+def metrics_endpoint():
+    """
+    Prometheus scrape endpoint (text exposition format). Disable with METRICS_ENABLED=False;
+    when METRICS_TOKEN is set, the scraper must present it as a bearer token.
+    """
+    if not current_app.config.get('METRICS_ENABLED', True):
+        return jsonify({'status': 'error', 'message': 'Metrics are disabled.'}), 404
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return jsonify({'status': 'error', 'message': 'Unauthorized.'}), 401
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@main_bp.route('/quota')
+@login_required
+def adzuna_quota():
+    """ Shows today's Adzuna request budget as seen by the client-side rate limiter. """
+    return jsonify(adzuna_limiter.usage())
 
 
 @main_bp.route('/insights', methods=['POST'])
@@ -57,6 +160,7 @@ def get_insights():
     country = request.form.get('country')
     # Check if the checkbox was checked - its value will be 'true' if checked, None otherwise
     generate_summary = 'true' if request.form.get('generate_summary') == 'true' else 'false'
+    pages = request.form.get('pages', 1, type=int)
 
     if not all([what, where, country]):
         flash("Please fill in all search fields.", "error")
@@ -67,7 +171,111 @@ def get_insights():
                             what=what,
                             where=where,
                             country=country,
-                            generate_summary=generate_summary)) # Pass summary flag
+                            generate_summary=generate_summary, # Pass summary flag
+                            pages=pages))
+
+
+# --- Report Routes ---
+@main_bp.route('/reports/market', methods=['POST'])
+@login_required
+def market_report():
+    """
+    Runs many (what, where, country) searches concurrently and streams one row per query as it completes.
+    Body: {"queries": [{"what": ..., "where": ..., "country": ...}, ...], "format": "ndjson" | "csv"}.
+    """
+    data = request.get_json(silent=True)
+    queries, error = _query_list(data, current_app.config.get('REPORT_MAX_QUERIES', 100), 'A report')
+    if error:
+        return jsonify({'status': 'error', 'message': error}), 400
+    output_format = data.get('format') or request.args.get('format', 'ndjson')
+    if output_format not in ('ndjson', 'csv'):
+        return jsonify({'status': 'error', 'message': 'Format must be ndjson or csv.'}), 400
+
+    max_concurrency = current_app.config.get('REPORT_MAX_CONCURRENCY', 10)
+    logger.info(f"User {current_user.id} running market report with {len(queries)} queries ({output_format}).")
+    rows = iter_market_report(queries, max_concurrency)
+    return stream_rows(rows, REPORT_FIELDS, output_format, 'market-report')
+
+
+@main_bp.route('/salaries/compare', methods=['POST'])
+@login_required
+def salary_comparison():
+    """
+    Salary statistics (median, p10/p25/p75/p90, spread) for many searches side by side, computed in one batch.
+    Body: {"queries": [{"what": ..., "where": ..., "country": ...}, ...]}.
+    """
+    queries, error = _query_list(request.get_json(silent=True), current_app.config.get('SALARY_COMPARE_MAX_QUERIES', 50),
+                                 'A comparison')
+    if error:
+        return jsonify({'status': 'error', 'message': error}), 400
+    return jsonify({'status': 'success', 'results': compare_salaries(queries)})
+
+
+@main_bp.route('/trends')
+def market_trend_data():
+    """
+    Stored market snapshots of a tracked search (job count, salary percentiles, top skills), oldest
+    first, for the trend chart. Query string: what, where, country and optionally days (default 90).
+    """
+    what, where, country = (request.args.get(field, '').strip() for field in ('what', 'where', 'country'))
+    if not all([what, where, country]):
+        return jsonify({'status': 'error', 'message': 'what, where and country are required.'}), 400
+    days = min(max(1, request.args.get('days', 90, type=int)), current_app.config.get('TREND_MAX_AGE_DAYS', 730))
+    points = market_trend(what, where, country, days)
+    return jsonify({'status': 'success', 'tracked': points is not None, 'days': days, 'points': points or []})
+
+
+@main_bp.route('/trends/track', methods=['POST'])
+@login_required
+def track_market_trend():
+    """ Starts recording snapshots for a search. Body (JSON or form): what, where, country. """
+    data = request.get_json(silent=True) or request.form
+    what, where, country = (str(data.get(field) or '').strip() for field in ('what', 'where', 'country'))
+    if not all([what, where, country]):
+        return jsonify({'status': 'error', 'message': 'what, where and country are required.'}), 400
+    tracked = track_query(what, where, country)
+    if tracked is None:
+        return jsonify({'status': 'error', 'message': 'The limit of tracked searches has been reached.'}), 409
+    logger.info(f"User {current_user.id} tracking market trend for {tracked.query_key}.")
+    return jsonify({'status': 'success', 'tracked': True,
+                    'last_snapshot_at': tracked.last_snapshot_at.isoformat() + 'Z' if tracked.last_snapshot_at else None})
+
+
+def _query_list(data, max_queries, label):
+    """
+    Validates a {"queries": [{"what", "where", "country"}, ...]} body; returns (queries, error message).
+    Callers may read other keys of `data` once it has validated (it is then a dict).
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('queries'), list):
+        return None, 'Expected JSON with a "queries" list.'
+    queries = data['queries']
+    if not queries or len(queries) > max_queries:
+        return None, f'{label} needs between 1 and {max_queries} queries.'
+    if not all(isinstance(q, dict) and all(q.get(field) for field in ('what', 'where', 'country')) for q in queries):
+        return None, 'Each query needs what, where and country.'
+    return queries, None
+
+
+def stream_rows(rows, fieldnames, output_format, filename):
+    """ Streams an iterable of dicts as an NDJSON or CSV download, one line at a time. """
+    if output_format == 'ndjson':
+        body = (json.dumps(row, default=str) + '\n' for row in rows)
+        mimetype = 'application/x-ndjson'
+    else:
+        def csv_lines():
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        body = csv_lines()
+        mimetype = 'text/csv'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'X-Accel-Buffering': 'no',
+                             'Content-Disposition': f'attachment; filename={filename}.{output_format}'})
 
 
 # --- Authentication Routes ---
@@ -78,7 +286,12 @@ def register():
     form = RegistrationForm()
     if form.validate_on_submit():
         user = User(email=form.email.data)
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except HashingBusy as e:
+            logger.warning(f"Registration deferred for {form.email.data}: {e}")
+            flash('We are handling a lot of sign-ins right now. Please try again in a moment.', 'error')
+            return render_template('register.html', title='Register', form=form), 503
         db.session.add(user)
         try:
             db.session.commit()
@@ -99,9 +312,24 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
-        if user is None or not user.check_password(form.password.data):
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+        except HashingBusy as e:
+            logger.warning(f"Login deferred for {form.email.data}: {e}")
+            flash('We are handling a lot of sign-ins right now. Please try again in a moment.', 'error')
+            return render_template('login.html', title='Login', form=form), 503
+        if not valid:
             flash('Invalid email or password.', 'error')
         else:
+            if user.password_needs_rehash():
+                # The stored hash predates the current PASSWORD_HASH_METHOD; upgrade it while we have the password
+                try:
+                    user.set_password(form.password.data)
+                    db.session.commit()
+                    logger.info(f"Rehashed password for {user.email} with the current hash settings.")
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Could not rehash password for {user.email}: {e}")
             login_user(user, remember=form.remember.data)
             flash(f'Welcome back, {user.email}!', 'success')
             logger.info(f"User logged in: {user.email}")
@@ -128,6 +356,7 @@ def login():
 @login_required
 def logout():
     logger.info(f"User logged out: {current_user.email}")
+    invalidate_cached_user(current_user.id)
     logout_user()
     flash('You have been logged out.', 'success')
     return redirect(url_for('main_bp.home'))
@@ -143,7 +372,7 @@ def save_job():
         return jsonify({'status': 'error', 'message': 'Unsupported request format.'}), 415
 
     data = request.get_json()
-    if not data:
+    if not data or not isinstance(data, dict):
         return jsonify({'status': 'error', 'message': 'Invalid JSON request.'}), 400
 
     adzuna_job_id = data.get('adzuna_job_id')
@@ -155,23 +384,73 @@ def save_job():
     if not all([adzuna_job_id, title, adzuna_url]):
         return jsonify({'status': 'error', 'message': 'Missing job details.'}), 400
 
-    existing_save = SavedJob.query.filter_by(user_id=current_user.id, adzuna_job_id=adzuna_job_id).first()
-    if existing_save:
-        return jsonify({'status': 'error', 'message': 'Job already saved.'}), 409
-
-    saved_job = SavedJob(
-        adzuna_job_id=adzuna_job_id, title=title, company=company,
-        location=location, adzuna_url=adzuna_url, user_id=current_user.id
-    )
-    db.session.add(saved_job)
+    job = {'adzuna_job_id': str(adzuna_job_id), 'title': str(title), 'adzuna_url': str(adzuna_url),
+           'company': str(company) if company is not None else None,
+           'location': str(location) if location is not None else None}
     try:
+        # Single INSERT ... ON CONFLICT DO NOTHING: no check-then-insert race between double clicks
+        result = save_jobs(current_user.id, [job])[0]
         db.session.commit()
-        logger.info(f"User {current_user.id} saved job {adzuna_job_id} via AJAX")
-        return jsonify({'status': 'success', 'message': 'Job saved!'})
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error saving job {adzuna_job_id} for user {current_user.id} via AJAX: {e}")
         return jsonify({'status': 'error', 'message': 'Database error saving job.'}), 500
+    if result['status'] == 'already_saved':
+        return jsonify({'status': 'error', 'message': 'Job already saved.'}), 409
+    invalidate_saved_job_ids(current_user.id)
+    logger.info(f"User {current_user.id} saved job {adzuna_job_id} via AJAX")
+    return jsonify({'status': 'success', 'message': 'Job saved!'})
+
+
+@main_bp.route('/saved_jobs/bulk_save', methods=['POST'])
+@login_required
+def bulk_save_jobs():
+    """ Saves many jobs in one statement. Body: {"jobs": [{adzuna_job_id, title, company, location, adzuna_url}, ...]}. """
+    data = request.get_json(silent=True)
+    jobs = data.get('jobs') if isinstance(data, dict) else None
+    max_items = current_app.config.get('BULK_SAVE_MAX_ITEMS', 100)
+    if not isinstance(jobs, list) or not jobs:
+        return jsonify({'status': 'error', 'message': "Provide a non-empty 'jobs' list."}), 400
+    if len(jobs) > max_items:
+        return jsonify({'status': 'error', 'message': f"At most {max_items} jobs per request."}), 400
+    if not all(isinstance(job, dict) and all(job.get(field) is None or isinstance(job.get(field), str)
+                                             for field in SAVED_JOB_FIELDS) for job in jobs):
+        return jsonify({'status': 'error', 'message': 'Each job must be an object with string fields.'}), 400
+    try:
+        results = save_jobs(current_user.id, jobs)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error bulk saving {len(jobs)} jobs for user {current_user.id}: {e}")
+        return jsonify({'status': 'error', 'message': 'Database error saving jobs.'}), 500
+    invalidate_saved_job_ids(current_user.id)
+    saved = sum(1 for result in results if result['status'] == 'saved')
+    logger.info(f"User {current_user.id} bulk saved {saved} of {len(jobs)} jobs")
+    return jsonify({'status': 'success', 'saved': saved, 'results': results})
+
+
+@main_bp.route('/saved_jobs/bulk_unsave', methods=['POST'])
+@login_required
+def bulk_unsave_jobs():
+    """ Removes many saved jobs in one statement. Body: {"adzuna_job_ids": ["...", ...]}. """
+    data = request.get_json(silent=True)
+    job_ids = data.get('adzuna_job_ids') if isinstance(data, dict) else None
+    max_items = current_app.config.get('BULK_SAVE_MAX_ITEMS', 100)
+    if not isinstance(job_ids, list) or not job_ids or not all(isinstance(job_id, str) for job_id in job_ids):
+        return jsonify({'status': 'error', 'message': "Provide a non-empty 'adzuna_job_ids' list of strings."}), 400
+    if len(job_ids) > max_items:
+        return jsonify({'status': 'error', 'message': f"At most {max_items} jobs per request."}), 400
+    try:
+        results = unsave_jobs(current_user.id, job_ids)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error bulk unsaving {len(job_ids)} jobs for user {current_user.id}: {e}")
+        return jsonify({'status': 'error', 'message': 'Database error unsaving jobs.'}), 500
+    invalidate_saved_job_ids(current_user.id)
+    removed = sum(1 for result in results if result['status'] == 'removed')
+    logger.info(f"User {current_user.id} bulk unsaved {removed} of {len(job_ids)} jobs")
+    return jsonify({'status': 'success', 'removed': removed, 'results': results})
 
 
 @main_bp.route('/unsave_job', methods=['POST'])
@@ -199,22 +478,23 @@ def unsave_job():
         if is_ajax: return jsonify({'status': 'error', 'message': message}), 400
         else: flash(message, 'error'); return redirect(url_for('main_bp.saved_jobs_list'))
 
-    job_to_unsave = SavedJob.query.filter_by(user_id=current_user.id, adzuna_job_id=adzuna_job_id).first()
+    try:
+        # Single DELETE; its RETURNING clause tells us whether the job was saved at all
+        result = unsave_jobs(current_user.id, [str(adzuna_job_id)])[0]
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        message = 'Database error unsaving job.'
+        logger.error(f"Error unsaving job {adzuna_job_id} for user {current_user.id}: {e}")
+        if is_ajax: return jsonify({'status': 'error', 'message': message}), 500
+        else: flash(message, 'error'); return redirect(url_for('main_bp.saved_jobs_list'))
 
-    if job_to_unsave:
-        db.session.delete(job_to_unsave)
-        try:
-            db.session.commit()
-            message = 'Job removed from saved list.'
-            logger.info(f"User {current_user.id} unsaved job {adzuna_job_id}")
-            if is_ajax: return jsonify({'status': 'success', 'message': message})
-            else: flash(message, 'success'); return redirect(url_for('main_bp.saved_jobs_list'))
-        except Exception as e:
-            db.session.rollback()
-            message = 'Database error unsaving job.'
-            logger.error(f"Error unsaving job {adzuna_job_id} for user {current_user.id}: {e}")
-            if is_ajax: return jsonify({'status': 'error', 'message': message}), 500
-            else: flash(message, 'error'); return redirect(url_for('main_bp.saved_jobs_list'))
+    if result['status'] == 'removed':
+        invalidate_saved_job_ids(current_user.id)
+        message = 'Job removed from saved list.'
+        logger.info(f"User {current_user.id} unsaved job {adzuna_job_id}")
+        if is_ajax: return jsonify({'status': 'success', 'message': message})
+        else: flash(message, 'success'); return redirect(url_for('main_bp.saved_jobs_list'))
     else:
         message = 'Job not found in your saved list.'
         logger.warning(f"Attempt to unsave non-existent/already unsaved job {adzuna_job_id} for user {current_user.id}")
@@ -225,7 +505,22 @@ def unsave_job():
 @main_bp.route('/saved_jobs')
 @login_required
 def saved_jobs_list():
-    """ Displays the list of jobs saved by the current user. """
-    jobs = SavedJob.query.filter_by(user_id=current_user.id).order_by(SavedJob.id.desc()).all()
-    return render_template('saved_jobs.html', title='Saved Jobs', jobs=jobs)
+    """ Displays the jobs saved by the current user, newest first, one keyset page at a time (?before=<id>). """
+    before_id = request.args.get('before', type=int)
+    per_page = current_app.config.get('SAVED_JOBS_PER_PAGE', 50)
+    jobs, next_before_id = saved_jobs_page(current_user.id, before_id, per_page)
+    return render_template('saved_jobs.html', title='Saved Jobs', jobs=jobs,
+                           next_before_id=next_before_id, is_first_page=before_id is None)
+
+
+@main_bp.route('/saved_jobs/export')
+@login_required
+def export_saved_jobs():
+    """ Streams all of the user's saved jobs as CSV (default) or NDJSON (?format=ndjson). """
+    output_format = request.args.get('format', 'csv')
+    if output_format not in ('ndjson', 'csv'):
+        return jsonify({'status': 'error', 'message': 'Format must be ndjson or csv.'}), 400
+    logger.info(f"User {current_user.id} exporting saved jobs ({output_format}).")
+    rows = iter_saved_jobs(current_user.id, current_app.config.get('SAVED_JOBS_EXPORT_BATCH_SIZE', 500))
+    return stream_rows(rows, SAVED_JOB_EXPORT_FIELDS, output_format, 'saved-jobs')
 
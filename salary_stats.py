@@ -0,0 +1,114 @@
+import hashlib
+import json
+import logging
+import math
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Adzuna histograms map a salary (as a string) to a vacancy count: {"20000": 12, "30000": 40, ...}.
+# Each bucket is treated as `count` vacancies at that salary, the same reading the average has always
+# used, and percentiles interpolate linearly between buckets at their cumulative midpoints.
+PERCENTILES = (10, 25, 50, 75, 90)
+STAT_KEYS = ('count', 'mean', 'median', 'p10', 'p25', 'p75', 'p90', 'iqr', 'spread')
+
+
+def histogram_key(histogram):
+    """ Content hash of a histogram: equal histograms share a key however they were fetched or ordered. """
+    canonical = json.dumps(histogram, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+def histogram_arrays(histogram):
+    """
+    (salaries, counts) as float arrays sorted by salary. Buckets whose salary or count is not a
+    finite number, and empty or negative buckets, are dropped (and logged) rather than failing.
+    """
+    salaries, counts, dropped = [], [], 0
+    for salary, count in (histogram or {}).items():
+        try:
+            salary, count = float(salary), float(count)
+        except (TypeError, ValueError):
+            dropped += 1
+            continue
+        if not (math.isfinite(salary) and math.isfinite(count)) or count <= 0:
+            dropped += int(count != 0)
+            continue
+        salaries.append(salary)
+        counts.append(count)
+    if dropped:
+        logger.warning(f"Dropped {dropped} malformed salary histogram bucket(s).")
+    order = np.argsort(salaries, kind='stable')
+    return np.asarray(salaries, dtype=float)[order], np.asarray(counts, dtype=float)[order]
+
+
+def summarize(histograms):
+    """
+    Statistics for many histograms in one vectorized pass. Histograms are padded into a
+    (histograms x buckets) matrix, so the cost is a few array operations whatever their number.
+    Returns a list aligned with `histograms`: a dict of STAT_KEYS (salaries rounded to whole
+    units), or None for a histogram without usable buckets.
+    """
+    parsed = [histogram_arrays(histogram) for histogram in histograms]
+    results = [None] * len(parsed)
+    rows = [i for i, (salaries, _) in enumerate(parsed) if len(salaries)]
+    if not rows:
+        return results
+
+    lengths = np.array([len(parsed[i][0]) for i in rows])
+    width = lengths.max()
+    salaries = np.empty((len(rows), width))
+    counts = np.zeros((len(rows), width))
+    for row, i in enumerate(rows):
+        n = lengths[row]
+        salaries[row, :n], counts[row, :n] = parsed[i]
+        salaries[row, n:] = parsed[i][0][-1]  # padding repeats the top salary with no weight
+
+    totals = counts.sum(axis=1)
+    means = (salaries * counts).sum(axis=1) / totals
+    # Cumulative midpoint of each bucket as a fraction of the total; padding sits past every target
+    midpoints = (counts.cumsum(axis=1) - counts / 2) / totals[:, None]
+    midpoints[np.arange(width)[None, :] >= lengths[:, None]] = np.inf
+
+    targets = np.array(PERCENTILES) / 100.0
+    above = (midpoints[:, :, None] < targets[None, None, :]).sum(axis=1)  # buckets below each target
+    lower = np.clip(above - 1, 0, None)
+    upper = np.minimum(above, (lengths - 1)[:, None])
+    low_salary, high_salary = np.take_along_axis(salaries, lower, 1), np.take_along_axis(salaries, upper, 1)
+    low_mid, high_mid = np.take_along_axis(midpoints, lower, 1), np.take_along_axis(midpoints, upper, 1)
+    gap = high_mid - low_mid
+    fraction = np.divide(targets[None, :] - low_mid, gap, out=np.zeros_like(gap), where=gap > 0)
+    values = low_salary + np.clip(fraction, 0, 1) * (high_salary - low_salary)
+
+    p10, p25, median, p75, p90 = values.T
+    columns = {'count': totals, 'mean': means, 'median': median, 'p10': p10, 'p25': p25, 'p75': p75,
+               'p90': p90, 'iqr': p75 - p25, 'spread': p90 - p10}
+    for row, i in enumerate(rows):
+        results[i] = {key: int(round(column[row])) for key, column in columns.items()}
+    return results
+
+
+def compare(histograms, cache=None):
+    """
+    summarize() with memoization by histogram_key in `cache` (anything with get/set, e.g. a
+    LocalLRU). Only histograms not seen before are computed, together in one pass.
+    """
+    keys = [histogram_key(histogram) for histogram in histograms]
+    results = [cache.get(key) if cache is not None else None for key in keys]
+    missing = {}  # key -> index of the first histogram with that content
+    for i, (key, result) in enumerate(zip(keys, results)):
+        if result is None:
+            missing.setdefault(key, i)
+    if missing:
+        computed = dict(zip(missing, summarize([histograms[i] for i in missing.values()])))
+        for key, stats in computed.items():
+            if cache is not None and stats is not None:
+                cache.set(key, stats)
+        results = [computed.get(key, result) if result is None else result for key, result in zip(keys, results)]
+    return [dict(stats) if stats is not None else None for stats in results]
+
+
+def salary_stats(histogram, cache=None):
+    """ Statistics for a single histogram (see summarize), or None without usable buckets. """
+    return compare([histogram], cache)[0]
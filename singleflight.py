@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl  # POSIX only; cross-worker mode falls back to per-process coalescing without it
+except ImportError:  # pragma: no cover - Windows dev machines
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_STRIPES = 64
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one upstream request.
+    The first caller (the leader) runs the function; callers arriving while it is in flight
+    wait for and share its result (or exception).
+
+    Modes (SINGLE_FLIGHT_MODE): 'process' coalesces within a gunicorn worker; 'host' also
+    coalesces across workers by taking a striped lock file before running, then calling
+    `recheck()` so a worker that waited can pick up the result another worker just cached;
+    'off' disables coalescing.
+    """
+
+    def __init__(self):
+        self.mode = 'process'
+        self.timeout = 35
+        self.lock_dir = None
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.mode = app.config.get('SINGLE_FLIGHT_MODE', 'process')
+        self.timeout = app.config.get('SINGLE_FLIGHT_TIMEOUT', 35)
+        if self.mode == 'host':
+            if fcntl is None:
+                logger.warning("fcntl unavailable: single-flight falling back to per-process mode.")
+                self.mode = 'process'
+            else:
+                self.lock_dir = os.path.join(app.config.get('CACHE_DIR', '.cache'), 'locks')
+                os.makedirs(self.lock_dir, exist_ok=True)
+        logger.info(f"--- Single-flight coalescing mode: {self.mode} ---")
+
+    def do(self, key, func, recheck=None):
+        """ Runs func() once per key across concurrent callers and returns its result to all of them. """
+        if self.mode == 'off':
+            return func()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                logger.warning(f"Single-flight leader for '{key}' exceeded {self.timeout}s; calling upstream directly.")
+                return func()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._lead(key, func, recheck)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.waiters:
+                logger.info(f"Single-flight shared one upstream call for '{key}' with {call.waiters} waiting caller(s).")
+            call.done.set()
+
+    def _lead(self, key, func, recheck):
+        if self.mode != 'host':
+            return func()
+        with self._host_lock(key) as acquired:
+            if acquired and recheck is not None:
+                value = recheck()
+                if value is not None:
+                    return value
+            return func()
+
+    def _host_lock(self, key):
+        stripe = int(hashlib.sha1(key.encode('utf-8')).hexdigest(), 16) % LOCK_STRIPES
+        return _FileLock(os.path.join(self.lock_dir, f"singleflight-{stripe}.lock"), self.timeout)
+
+
+class _FileLock:
+    """ Exclusive flock with a timeout; yields False (and does not lock) if the timeout passes. """
+
+    def __init__(self, path, timeout):
+        self.path = path
+        self.timeout = timeout
+        self.fd = None
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    logger.warning(f"Timed out waiting for {self.path}; proceeding without the cross-worker lock.")
+                    return False
+                time.sleep(0.02)
+
+    def __exit__(self, *exc):
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self.fd)
+        return False
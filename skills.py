@@ -0,0 +1,204 @@
+import logging
+import re
+import threading
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+# --- Skill Dictionary ---
+# category -> canonical name -> aliases (the canonical name itself always matches). Aliases are
+# matched as whole tokens, case-insensitively, with '-', '/' and whitespace treated alike, so
+# "front-end", "front end" and "Front End" are one alias. Skills whose name is also an everyday
+# word are in NOT_MATCHED_BY_NAME and only match their unambiguous aliases.
+SKILLS = {
+    'Languages': {
+        'Python': [], 'Java': [], 'JavaScript': ['js', 'es6'], 'TypeScript': [],
+        'C#': ['c sharp'], 'C++': ['cpp'], 'Go': ['golang'], 'Rust': ['rust lang', 'rustlang'],
+        'Kotlin': [], 'Swift': ['swiftui', 'swift ios'], 'Ruby': [], 'PHP': [], 'Scala': [],
+        'R': ['r programming', 'rstudio', 'r studio'], 'SQL': ['t-sql', 'tsql', 'pl/sql', 'plsql'],
+        'Bash': ['shell scripting'], 'PowerShell': [], 'VBA': [], 'MATLAB': [], 'Perl': [], 'Dart': [],
+        'HTML': ['html5'], 'CSS': ['css3', 'sass', 'scss'],
+    },
+    'Frameworks': {
+        'React': ['react.js', 'reactjs', 'react native'], 'Angular': ['angularjs', 'angular.js'],
+        'Vue.js': ['vue', 'vuejs', 'nuxt'], 'Node.js': ['node', 'nodejs'], 'Django': [], 'Flask': [],
+        'FastAPI': [], 'Spring': ['spring boot', 'springboot', 'spring framework'], '.NET': ['asp.net', 'dotnet', '.net core'],
+        'Ruby on Rails': ['rails'], 'Laravel': [], 'Express': ['express.js', 'expressjs'], 'Next.js': ['nextjs'],
+        'jQuery': [], 'Flutter': [], 'Android': [], 'iOS': [],
+    },
+    'Data & AI': {
+        'Machine Learning': ['ai/ml', 'ml engineer', 'ml engineering', 'ml models'], 'Deep Learning': [],
+        'AI': ['artificial intelligence', 'genai', 'generative ai', 'llm', 'llms'],
+        'NLP': ['natural language processing'], 'Computer Vision': [], 'Data Science': [],
+        'Data Analysis': ['data analytics'], 'Statistics': ['statistical analysis'],
+        'Pandas': [], 'NumPy': [], 'scikit-learn': ['sklearn'], 'TensorFlow': [], 'PyTorch': [],
+        'Spark': ['pyspark', 'apache spark', 'spark sql', 'spark streaming'], 'Hadoop': [], 'Kafka': ['apache kafka'],
+        'Airflow': [], 'dbt': [], 'ETL': ['elt', 'data pipelines'], 'Data Warehousing': ['data warehouse'],
+        'Snowflake': [], 'Databricks': [], 'BigQuery': ['big query'], 'Redshift': [],
+        'Power BI': ['powerbi'], 'Tableau': [], 'Looker': [],
+        'Excel': ['microsoft excel', 'ms excel', 'advanced excel', 'excel vba', 'vlookup', 'pivot tables'],
+    },
+    'Databases': {
+        'PostgreSQL': ['postgres'], 'MySQL': [], 'SQL Server': ['mssql', 'ms sql'], 'Oracle': [],
+        'MongoDB': ['mongo'], 'Redis': [], 'Elasticsearch': ['elastic search', 'opensearch'],
+        'DynamoDB': [], 'Cassandra': [], 'SQLite': [],
+    },
+    'Cloud & DevOps': {
+        'AWS': ['amazon web services', 'ec2', 's3', 'lambda'], 'Azure': ['microsoft azure'],
+        'GCP': ['google cloud', 'google cloud platform'], 'Docker': ['containerisation', 'containerization'],
+        'Kubernetes': ['k8s', 'eks', 'aks', 'gke'], 'Terraform': [], 'Ansible': [],
+        'CI/CD': ['continuous integration', 'continuous delivery', 'continuous deployment'],
+        'Jenkins': [], 'GitHub Actions': [], 'GitLab': [], 'Git': ['github', 'version control'],
+        'Linux': ['unix'], 'DevOps': [], 'Microservices': ['micro services'], 'REST APIs': ['restful', 'rest api',
+                                                                                            'rest apis'],
+        'GraphQL': [], 'Serverless': [],
+        'Networking': ['tcp/ip', 'dns', 'ccna', 'network engineering', 'network administration'],
+        'Cyber Security': ['cybersecurity', 'information security', 'infosec'],
+    },
+    'Practices & Tools': {
+        'Agile': ['scrum', 'kanban', 'agile methodology', 'agile methodologies', 'agile development'],
+        'Jira': [], 'Confluence': [], 'TDD': ['test driven development'],
+        'Unit Testing': ['pytest', 'junit', 'jest'], 'Selenium': ['cypress', 'playwright'],
+        'Project Management': ['prince2', 'pmp'], 'Stakeholder Management': [], 'Salesforce': [],
+        'SAP': [], 'CRM': [], 'SEO': ['search engine optimisation', 'search engine optimization'],
+        'Google Analytics': [], 'Figma': [], 'UX': ['user experience', 'ux design'], 'UI Design': [],
+        'AutoCAD': [], 'Revit': [], 'SolidWorks': [],
+    },
+    'Finance & Business': {
+        'ACCA': [], 'CIMA': [], 'ACA': [], 'AAT': [], 'Bookkeeping': [], 'Payroll': [],
+        'Financial Modelling': ['financial modeling'], 'Forecasting': ['budgeting'], 'IFRS': [],
+        'Xero': [], 'Sage': [], 'QuickBooks': [], 'Audit': ['auditing'], 'Tax': ['taxation', 'vat'],
+        'Risk Management': [], 'Compliance': ['regulatory compliance', 'aml', 'kyc'], 'Procurement': [],
+        'Business Analysis': [],
+    },
+    'Healthcare & Care': {
+        'NMC Registration': ['nmc pin', 'nmc registered'], 'HCPC Registration': ['hcpc registered'],
+        'GMC Registration': ['gmc registered'], 'Patient Care': [], 'Medication Administration': [
+            'administering medication'], 'Phlebotomy': [], 'Safeguarding': [], 'Dementia Care': [],
+        'Mental Health': [], 'Care Planning': ['care plans'], 'Moving and Handling': ['manual handling'],
+        'First Aid': [], 'CQC': [],
+    },
+    'Trades & Licences': {
+        'CSCS Card': ['cscs'], '18th Edition': ['bs7671', 'bs 7671'], 'Gas Safe': [], 'NVQ': [],
+        'City & Guilds': ['city and guilds'], 'Forklift': ['flt'], 'IPAF': [], 'PASMA': [], 'SMSTS': [],
+        'Driving Licence': ['full uk driving licence', 'driving license', 'clean driving licence'],
+        'HGV': ['class 1', 'class 2', 'cpc'], 'DBS Check': ['dbs', 'enhanced dbs'],
+    },
+    'Languages (Spoken)': {
+        'French': [], 'German': [], 'Spanish': [], 'Mandarin': [], 'Welsh': [], 'Arabic': [], 'Polish': [],
+    },
+}
+
+NOT_MATCHED_BY_NAME = {'Go', 'R', 'Rust', 'Swift', 'Spring', 'Express', 'Tax', 'Audit', 'Sage', 'Excel', 'Spark',
+                       'Agile', 'Networking', 'Compliance'}
+
+# Words: letters/digits, dotted names (node.js, asp.net, .net) and trailing + or # (c++, c#).
+# Everything else, '-', '/' and '&' included, separates tokens.
+_TOKEN = re.compile(r"\.?[a-z0-9]+(?:\.[a-z0-9]+)*[+#]*")
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+# --- Matcher ---
+class SkillMatcher:
+    """
+    Aho-Corasick automaton over word tokens: every alias of every skill is a token sequence, and
+    one left-to-right pass over a text's tokens reports all aliases in it (overlapping and
+    multi-word ones included) in time linear in the text, however large the dictionary.
+
+    The automaton is compiled to a deterministic transition table, so scanning costs one regex
+    pass (in C) to tokenize plus one dict lookup per word. Per state only the transitions that
+    differ from the start state's are stored, which keeps the table small.
+    """
+
+    def __init__(self, skills=SKILLS):
+        self.names, self.categories = [], []
+        goto, output = [{}], [()]  # trie: state -> {token: child}; state -> skill ids ending there
+        for category, entries in skills.items():
+            for name, aliases in entries.items():
+                skill_id = len(self.names)
+                self.names.append(name)
+                self.categories.append(category)
+                for alias in ({*aliases} if name in NOT_MATCHED_BY_NAME else {name, *aliases}):
+                    state = 0
+                    for token in tokenize(alias):
+                        if token not in goto[state]:
+                            goto[state][token] = len(goto)
+                            goto.append({})
+                            output.append(())
+                        state = goto[state][token]
+                    if state and skill_id not in output[state]:
+                        output[state] += (skill_id,)
+        self._root, self._delta, self._output = goto[0], self._compile(goto, output), output
+        logger.debug(f"Compiled {len(self.names)} skills into {len(goto)} matcher states.")
+
+    @staticmethod
+    def _compile(goto, output):
+        """
+        Breadth-first failure links, folded into `output` and into per-state transition
+        overrides: next(state, token) = delta[state].get(token) or root.get(token, 0).
+        """
+        root = goto[0]
+        fail = [0] * len(goto)
+        delta = [{} for _ in goto]
+        queue = deque(root.values())
+        while queue:
+            state = queue.popleft()
+            inherited = delta[fail[state]]
+            delta[state] = {**inherited, **goto[state]}  # overrides inherited from the failure state
+            for token, child in goto[state].items():
+                queue.append(child)
+                fail[child] = inherited.get(token) or root.get(token, 0)
+                output[child] += tuple(s for s in output[fail[child]] if s not in output[child])
+        return delta
+
+    def skill_ids(self, text):
+        """ Set of skill ids mentioned anywhere in text. """
+        root, delta, output = self._root, self._delta, self._output
+        found = set()
+        state = 0
+        for token in _TOKEN.findall(text.lower()):
+            state = delta[state].get(token) or root.get(token, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+    def extract(self, text):
+        """ Canonical names of the skills mentioned in text. """
+        return {self.names[skill_id] for skill_id in self.skill_ids(text)}
+
+    def rank(self, texts, top=15):
+        """
+        Skills ranked by how many of the texts mention them (each text counts once per skill).
+        Returns [{'name', 'category', 'count', 'share'}], share being the fraction of texts.
+        """
+        counts = Counter()
+        total = 0
+        for text in texts:
+            total += 1
+            counts.update(self.skill_ids(text))
+        return [{'name': self.names[skill_id], 'category': self.categories[skill_id], 'count': count,
+                 'share': count / total}
+                for skill_id, count in counts.most_common(top)]
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_matcher():
+    """ The matcher for the built-in dictionary, compiled once per process on first use. """
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = SkillMatcher()
+    return _default
+
+
+def top_skills(job_listings, top=15):
+    """ Ranked skills across the titles and descriptions of normalised job listings. """
+    texts = (f"{job.get('title') or ''}\n{job.get('description') or ''}" for job in job_listings)
+    return default_matcher().rank(texts, top)
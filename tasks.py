@@ -0,0 +1,247 @@
+import json
+import logging
+import os
+import secrets
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class TaskQueue:
+    """
+    Small task queue stored in the application database (the `task` table).
+    Tasks have a priority (higher runs first), retries with exponential backoff, optional
+    de-duplication by task key and a JSON result that callers can poll for by the task's token.
+
+    Work is done by TASK_QUEUE_WORKERS threads that each web process starts when it handles its
+    first request, and/or by a separate `flask worker` process. Other CLI commands (e.g. `flask
+    trends schedule`) only enqueue: a short-lived process never claims tasks it cannot finish.
+    Claims are a conditional UPDATE, so any number of processes can share the table.
+    """
+
+    def __init__(self):
+        self.handlers = {}
+        self.app = None
+        self.db = None
+        self.model = None
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._threads = []
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def init_app(self, app, db, model):
+        self.app = app
+        self.db = db
+        self.model = model
+        app.extensions['task_queue'] = self
+        app.cli.add_command(worker_command)
+        # Started on the first request rather than here, so CLI processes never run workers
+        app.before_request(self.ensure_workers)
+
+    def task(self, name):
+        """ Decorator registering a handler: it receives the task payload and returns a JSON-able result. """
+        def register(func):
+            self.handlers[name] = func
+            return func
+        return register
+
+    # --- Producer side ---
+    def enqueue(self, name, payload=None, key=None, priority=0, max_attempts=None, delay=0):
+        """
+        Queues a task (runnable after `delay` seconds) and returns it. If `key` matches a queued/running
+        task, or one that finished within TASK_RESULT_TTL, that task is returned instead of creating a duplicate.
+        """
+        if name not in self.handlers:
+            raise ValueError(f"No task handler registered for '{name}'")
+        Task, config = self.model, self.app.config
+        if key:
+            recent = _utcnow() - timedelta(seconds=config.get('TASK_RESULT_TTL', 3600))
+            existing = (Task.query
+                        .filter(Task.task_key == key)
+                        .filter(Task.status.in_(ACTIVE_STATUSES) | ((Task.status == 'done') & (Task.finished_at >= recent)))
+                        .order_by(Task.id.desc()).first())
+            if existing is not None:
+                return existing
+        task = Task(name=name, task_key=key, token=secrets.token_urlsafe(16),
+                    payload=json.dumps(payload or {}), priority=priority,
+                    max_attempts=max_attempts or config.get('TASK_MAX_ATTEMPTS', 3),
+                    status='queued', attempts=0, run_after=_utcnow() + timedelta(seconds=delay), created_at=_utcnow())
+        self.db.session.add(task)
+        self.db.session.commit()
+        logger.info(f"Queued task {task.id} '{name}' (key={key}, priority={priority}).")
+        return task
+
+    def get(self, task_id):
+        return self.db.session.get(self.model, task_id)
+
+    def get_by_token(self, token):
+        """ The task with this status token, or None (ids are sequential, so they are not exposed). """
+        return self.model.query.filter_by(token=token).first()
+
+    # --- Consumer side ---
+    def run_next(self):
+        """ Claims and runs the highest-priority runnable task. Returns False if there was none. """
+        Task, session = self.model, self.db.session
+        now = _utcnow()
+        self._requeue_expired_leases(now)
+        candidates = (session.query(Task.id)
+                      .filter(Task.status == 'queued', Task.run_after <= now)
+                      .order_by(Task.priority.desc(), Task.id)
+                      .limit(5).all())
+        for (task_id,) in candidates:
+            claimed = (session.query(Task)
+                       .filter(Task.id == task_id, Task.status == 'queued')
+                       .update({'status': 'running', 'locked_by': self.worker_id, 'started_at': now,
+                                'leased_until': now + self._lease(), 'attempts': Task.attempts + 1},
+                               synchronize_session=False))
+            session.commit()
+            if claimed:
+                self._execute(session.get(Task, task_id))
+                return True
+        return False
+
+    def run_pending(self):
+        """ Runs tasks until none are runnable. Used by tests and one-off maintenance. """
+        ran = 0
+        while self.run_next():
+            ran += 1
+        return ran
+
+    def _execute(self, task):
+        session = self.db.session
+        handler = self.handlers.get(task.name)
+        started = time.perf_counter()
+        try:
+            if handler is None:
+                raise LookupError(f"No task handler registered for '{task.name}'")
+            with self._lease_renewed(task.id):
+                result = handler(json.loads(task.payload or '{}'))
+            task.result = json.dumps(result)
+            task.status = 'done'
+            task.error = None
+            task.finished_at = _utcnow()
+            logger.info(f"Task {task.id} '{task.name}' finished in {(time.perf_counter() - started) * 1000:.1f}ms.")
+        except Exception as e:
+            session.rollback()
+            task = session.get(self.model, task.id)
+            task.error = str(e)[:2000]
+            if task.attempts < task.max_attempts:
+                task.status = 'queued'
+                task.run_after = _utcnow() + timedelta(seconds=2 ** task.attempts)
+                logger.warning(f"Task {task.id} '{task.name}' failed (attempt {task.attempts}), retrying: {e}")
+            else:
+                task.status = 'failed'
+                task.finished_at = _utcnow()
+                logger.error(f"Task {task.id} '{task.name}' failed permanently after {task.attempts} attempts: {e}")
+        session.commit()
+
+    # --- Leases ---
+    def _lease(self):
+        return timedelta(seconds=self.app.config.get('TASK_LEASE_SECONDS', 300))
+
+    @contextmanager
+    def _lease_renewed(self, task_id):
+        """ Keeps extending the task's lease from a heartbeat thread while the block runs. """
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._renew_lease, args=(task_id, done),
+                                     name=f"task-lease-{task_id}", daemon=True)
+        heartbeat.start()
+        try:
+            yield
+        finally:
+            done.set()
+            heartbeat.join()
+
+    def _renew_lease(self, task_id, done):
+        Task = self.model
+        while not done.wait(self._lease().total_seconds() / 3):
+            try:
+                with self.app.app_context():
+                    (Task.query.filter(Task.id == task_id, Task.status == 'running', Task.locked_by == self.worker_id)
+                     .update({'leased_until': _utcnow() + self._lease()}, synchronize_session=False))
+                    self.db.session.commit()
+            except Exception as e:
+                logger.warning(f"Could not renew the lease of task {task_id}: {e}")
+
+    def _requeue_expired_leases(self, now):
+        """ Puts back running tasks whose worker stopped renewing their lease (it died mid-run). """
+        Task = self.model
+        requeued = (Task.query.filter(Task.status == 'running', Task.leased_until < now)
+                    .update({'status': 'queued', 'locked_by': None}, synchronize_session=False))
+        if requeued:
+            logger.warning(f"Re-queued {requeued} task(s) with expired leases.")
+        self.db.session.commit()
+
+    def prune(self):
+        """ Deletes finished tasks older than TASK_RESULT_TTL. """
+        Task = self.model
+        cutoff = _utcnow() - timedelta(seconds=self.app.config.get('TASK_RESULT_TTL', 3600))
+        removed = (Task.query.filter(Task.status.in_(('done', 'failed')), Task.finished_at < cutoff)
+                   .delete(synchronize_session=False))
+        self.db.session.commit()
+        return removed
+
+    # --- Worker threads ---
+    def ensure_workers(self):
+        """ Starts TASK_QUEUE_WORKERS background threads in this process, once. """
+        count = self.app.config.get('TASK_QUEUE_WORKERS', 0)
+        if count <= 0 or self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(count):
+                thread = threading.Thread(target=self.work, name=f"task-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Started {count} task worker thread(s).")
+
+    def work(self):
+        """ Worker loop: run tasks while there are any, otherwise sleep for TASK_POLL_INTERVAL. """
+        poll_interval = self.app.config.get('TASK_POLL_INTERVAL', 1.0)
+        last_prune = 0
+        while not self._stop.is_set():
+            ran = False
+            try:
+                with self.app.app_context():
+                    ran = self.run_next()
+                    if time.monotonic() - last_prune > 300:
+                        self.prune()
+                        last_prune = time.monotonic()
+            except Exception as e:
+                logger.error(f"Task worker error: {e}", exc_info=True)
+            if not ran:
+                self._stop.wait(poll_interval)
+
+    def stop(self):
+        self._stop.set()
+
+
+@click.command('worker')
+@click.option('--threads', default=2, show_default=True, help='Number of worker threads.')
+@with_appcontext
+def worker_command(threads):
+    """ Runs task queue workers in the foreground until interrupted. """
+    task_queue = current_app.extensions['task_queue']
+    task_queue.app.config['TASK_QUEUE_WORKERS'] = threads
+    task_queue.ensure_workers()
+    click.echo(f"Task worker {task_queue.worker_id} running {threads} thread(s). Press Ctrl+C to stop.")
+    try:
+        while any(thread.is_alive() for thread in task_queue._threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        task_queue.stop()
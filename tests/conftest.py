@@ -1,6 +1,11 @@
 import pytest
 from app import create_app, db
 
+def login(client, email='recruiter@example.com', password='password123'):
+    """Registers (if needed) and logs in a user through the auth views."""
+    client.post('/register', data={'email': email, 'password': password, 'confirm_password': password})
+    client.post('/login', data={'email': email, 'password': password})
+
 @pytest.fixture(scope='module')
 def test_app():
     """Create and configure a new app instance for each test module."""
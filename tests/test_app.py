@@ -43,7 +43,7 @@ def test_successful_registration(test_client):
         assert user.email == 'test@example.com'
 
 # KSBs: K14 (Mocking Strategies)
-@patch('app.requests.get') # Patch requests.get in the 'app' module where it's used
+@patch('app.upstream.session.get') # Patch the shared upstream session used by app.py
 def test_fetch_market_insights_mocked(mock_get, test_client, monkeypatch): # Added monkeypatch
     """
     GIVEN a mocked Adzuna API and necessary credentials
@@ -74,9 +74,10 @@ def test_fetch_market_insights_mocked(mock_get, test_client, monkeypatch): # Add
     mock_adzuna_histogram_response.json.return_value = {"histogram": {}}
 
 
-    # The first call to requests.get will be for Adzuna search,
-    # The second will be for the salary histogram.
-    mock_get.side_effect = [mock_adzuna_search_response, mock_adzuna_histogram_response]
+    # Search and histogram run concurrently, so route each call by URL rather than call order.
+    def route_by_url(url, *args, **kwargs):
+        return mock_adzuna_histogram_response if url.endswith('/histogram') else mock_adzuna_search_response
+    mock_get.side_effect = route_by_url
 
     # Use monkeypatch.setattr to directly modify the module-level variables in 'app.py'
     monkeypatch.setattr(main_app, 'ADZUNA_APP_ID', 'test_app_id_set_by_setattr')
@@ -111,7 +112,7 @@ def test_fetch_market_insights_mocked(mock_get, test_client, monkeypatch): # Add
             'results_per_page': 20, # As defined in app.py
             'content-type': 'application/json'
         },
-        timeout=20 # As defined in app.py
+        timeout=(3.05, 20) # (connect, read) as configured in config.py
     )
     # Second call (Adzuna histogram)
     mock_get.assert_any_call(
@@ -123,5 +124,129 @@ def test_fetch_market_insights_mocked(mock_get, test_client, monkeypatch): # Add
             'what': 'devops',
             'content-type': 'application/json'
         },
-        timeout=15 # As defined in get_salary_histogram
+        timeout=(3.05, 15) # (connect, read) as configured in config.py
     )
+
+
+@patch('app.upstream.session.post')
+def test_ai_summary_is_cached_with_rendered_html(mock_post, test_client, monkeypatch):
+    """
+    GIVEN configured Azure credentials and an empty summary cache
+    WHEN the same AI summary is requested twice
+    THEN Azure is called once and the second call returns the stored HTML
+    """
+    mock_response = MagicMock(status_code=200)
+    mock_response.json.return_value = {"choices": [{"message": {"content": "**High** demand"}}]}
+    mock_post.return_value = mock_response
+    monkeypatch.setattr(main_app, 'AZURE_AI_ENDPOINT', 'https://azure.example/chat')
+    monkeypatch.setattr(main_app, 'AZURE_AI_KEY', 'test-key')
+
+    query = {'what': 'devops', 'where': 'london', 'country': 'gb'}
+    listings = [{'title': 'DevOps Engineer', 'description': 'Terraform and AWS.'}]
+    with test_client.application.app_context():
+        first = main_app.get_ai_summary_html(query, 1523, listings, None)
+        second = main_app.get_ai_summary_html({'what': ' DevOps ', 'where': 'London', 'country': 'GB'}, 1530, listings, None)
+        entry = main_app.AISummaryCache.query.one()
+
+    assert mock_post.call_count == 1
+    assert first == second == '<p><strong>High</strong> demand</p>'
+    assert entry.summary_markdown == '**High** demand'
+
+
+def test_ai_summary_cache_sweep_enforces_size_limit(test_client):
+    """
+    GIVEN cached summaries whose total size exceeds AI_SUMMARY_CACHE_MAX_BYTES
+    WHEN the eviction sweep runs
+    THEN the oldest entries are removed until the table fits
+    """
+    app = test_client.application
+    original_limit = app.config['AI_SUMMARY_CACHE_MAX_BYTES']
+    with app.app_context():
+        app.config['AI_SUMMARY_CACHE_MAX_BYTES'] = 250
+        try:
+            for i in range(3):
+                main_app.store_ai_summary(f'hash{i}', 'x' * 50, '<p>' + 'x' * 50 + '</p>')
+            remaining = [entry.prompt_hash for entry in main_app.AISummaryCache.query.all()]
+        finally:
+            app.config['AI_SUMMARY_CACHE_MAX_BYTES'] = original_limit
+    assert remaining == ['hash1', 'hash2']
+
+
+def _mock_adzuna_get():
+    """ A requests.get stand-in answering both Adzuna search and histogram URLs. """
+    search = MagicMock(status_code=200)
+    search.json.return_value = {"count": 1, "results": [{
+        "title": "Software Engineer", "company": {"display_name": "Test Inc"},
+        "location": {"display_name": "Test City"}, "description": "Python and AWS.",
+        "redirect_url": "https://www.adzuna.com/details/1234567", "created": "2023-10-27T10:00:00Z"}]}
+    histogram = MagicMock(status_code=200)
+    histogram.json.return_value = {"histogram": {"40000": 2, "60000": 2}}
+    return lambda url, *args, **kwargs: histogram if url.endswith('/histogram') else search
+
+
+@patch('app.upstream.session.post')
+@patch('app.upstream.session.get')
+def test_home_streams_ai_summary_after_listings(mock_get, mock_post, test_client, monkeypatch):
+    """
+    GIVEN AI_SUMMARY_MODE='stream' and a streaming Azure endpoint
+    WHEN the results page and then its summary stream are requested
+    THEN the page renders without calling Azure, and the stream sends chunks followed by the rendered HTML
+    """
+    mock_get.side_effect = _mock_adzuna_get()
+    stream_response = MagicMock(status_code=200)
+    stream_response.__enter__.return_value = stream_response
+    stream_response.iter_lines.return_value = [
+        'data: {"choices": [{"delta": {"content": "**Busy**"}}]}', '',
+        'data: {"choices": [{"delta": {"content": " market"}}]}', 'data: [DONE]']
+    mock_post.return_value = stream_response
+    for name, value in [('ADZUNA_APP_ID', 'id'), ('ADZUNA_APP_KEY', 'key'),
+                        ('AZURE_AI_ENDPOINT', 'https://azure.example/chat'), ('AZURE_AI_KEY', 'ai-key')]:
+        monkeypatch.setattr(main_app, name, value)
+
+    page = test_client.get('/?what=devops&where=london&country=gb&generate_summary=true')
+    assert page.status_code == 200
+    assert b'Software Engineer' in page.data
+    assert b'id="ai-summary-stream"' in page.data
+    mock_post.assert_not_called()
+
+    stream = test_client.get('/insights/summary/stream?what=devops&where=london&country=gb')
+    body = stream.get_data(as_text=True)
+    assert stream.mimetype == 'text/event-stream'
+    assert 'event: chunk\ndata: "**Busy**"' in body
+    assert 'event: html\ndata: "<p><strong>Busy</strong> market</p>"' in body
+    assert body.rstrip().endswith('event: done\ndata: ""')
+    assert mock_post.call_args.kwargs['json']['stream'] is True
+
+
+@patch('app.upstream.session.get')
+def test_paginated_search_fetches_window_and_prefetches_next_page(mock_get, test_client, monkeypatch):
+    """
+    GIVEN a search with 100 results and an in-memory search cache
+    WHEN page 2 is requested with a window of 2 Adzuna pages
+    THEN Adzuna pages 3 and 4 are fetched and merged, and pages 5 and 6 are prefetched into the cache
+    """
+    from cache import MemoryBackend
+    import time
+
+    def adzuna(url, *args, **kwargs):
+        response = MagicMock(status_code=200)
+        adzuna_page = url.rsplit('/', 1)[-1]
+        response.json.return_value = {"count": 100, "results": [{
+            "title": f"Job on page {adzuna_page}", "redirect_url": f"https://www.adzuna.com/details/10000{adzuna_page}",
+            "created": "2023-10-27T10:00:00Z"}]} if adzuna_page.isdigit() else {"histogram": {}}
+        return response
+    mock_get.side_effect = adzuna
+    monkeypatch.setattr(main_app, 'ADZUNA_APP_ID', 'id')
+    monkeypatch.setattr(main_app, 'ADZUNA_APP_KEY', 'key')
+    monkeypatch.setattr(main_app.search_cache, 'backend', MemoryBackend(100, 1_000_000))
+
+    with test_client.application.test_request_context():
+        insights = main_app.fetch_market_insights('devops', 'london', 'gb', generate_summary=False, page=2, pages=2)
+        next_keys = [main_app.normalize_query('gb', 'devops', 'london', p) for p in (5, 6)]
+        deadline = time.time() + 2
+        while not all(main_app.search_cache.contains(k) for k in next_keys) and time.time() < deadline:
+            time.sleep(0.01)
+
+    assert [job['title'] for job in insights['job_listings']] == ['Job on page 3', 'Job on page 4']
+    assert insights['total_pages'] == 3
+    assert all(main_app.search_cache.contains(k) for k in next_keys)
@@ -0,0 +1,108 @@
+# Tests for cached Flask-Login user loading and password hashing.
+
+import threading
+import time
+
+import pytest
+from flask import g
+from sqlalchemy import event
+
+import app as main_app
+from app import db, CachedUser, User
+from conftest import login
+from passwords import HashingBusy, PasswordHasher
+
+
+def user_queries_during(client, engine, path):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    g.pop('_login_user', None)  # the fixture's app context (and g) outlives each request
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return response, [s for s in statements if 'password_hash' in s]
+
+
+def test_logged_in_requests_load_the_user_from_cache(test_client):
+    """
+    GIVEN a logged-in user
+    WHEN they load pages that only need their identity
+    THEN the user comes from the cache with no database query, and logging out drops the cache entry
+    """
+    login(test_client)
+    main_app.user_cache.clear()
+    db.session.expunge_all()  # requests share the fixture's session; make the first load hit the DB
+    engine = db.engine
+
+    first, queries = user_queries_during(test_client, engine, '/')
+    assert first.status_code == 200 and b'recruiter@example.com' in first.data
+    assert len(queries) == 1
+    _, queries = user_queries_during(test_client, engine, '/')
+    assert queries == []
+    cached = next(iter(main_app.user_cache._entries.values()))[0]
+    assert isinstance(cached, CachedUser)
+
+    test_client.get('/logout')
+    assert main_app.user_cache.get(cached.id) is None
+
+
+def test_session_identity_survives_a_cold_cache(test_client, monkeypatch):
+    """
+    GIVEN USER_SESSION_IDENTITY enabled
+    WHEN the per-process cache is emptied (e.g. another worker serves the request)
+    THEN the identity signed into the session is used instead of the database
+    """
+    monkeypatch.setitem(test_client.application.config, 'USER_SESSION_IDENTITY', True)
+    login(test_client)
+    main_app.user_cache.clear()
+    db.session.expunge_all()
+    engine = db.engine
+    user_queries_during(test_client, engine, '/')  # loads from the DB once and signs the identity in
+    main_app.user_cache.clear()
+    response, queries = user_queries_during(test_client, engine, '/')
+    assert b'recruiter@example.com' in response.data
+    assert queries == []
+
+
+def test_login_upgrades_outdated_password_hashes(test_client, monkeypatch):
+    """
+    GIVEN a user whose password was hashed with older settings
+    WHEN they log in after PASSWORD_HASH_METHOD changed
+    THEN the login succeeds and the stored hash is redone with the new method
+    """
+    login(test_client)
+    test_client.get('/logout')
+    user = User.query.filter_by(email='recruiter@example.com').one()
+    assert user.password_hash.startswith('pbkdf2:sha256:1000$')
+
+    monkeypatch.setattr(main_app.password_hasher, 'method', 'pbkdf2:sha256:2000')
+    response = test_client.post('/login', data={'email': 'recruiter@example.com', 'password': 'password123'})
+    assert response.status_code == 302
+    db.session.refresh(user)
+    assert user.password_hash.startswith('pbkdf2:sha256:2000$')
+    assert not user.password_needs_rehash() and user.check_password('password123')
+
+
+def test_hashing_pool_rejects_work_once_full():
+    """
+    GIVEN a hasher with one worker, no queue and a short queue timeout
+    WHEN a second hash is requested while the first is still running
+    THEN it fails fast with HashingBusy instead of queueing without bound
+    """
+    hasher = PasswordHasher()
+    hasher.method, hasher.workers, hasher.max_pending, hasher.queue_timeout = 'pbkdf2:sha256:1000', 1, 0, 0.05
+    release = threading.Event()
+    blocker = threading.Thread(target=hasher._submit, args=(release.wait,))
+    blocker.start()
+    try:
+        time.sleep(0.05)
+        with pytest.raises(HashingBusy):
+            hasher.hash('password123')
+    finally:
+        release.set()
+        blocker.join()
+    assert hasher.verify(hasher.hash('password123'), 'password123')
@@ -0,0 +1,143 @@
+# Tests for the upstream response cache and its backends.
+
+import sqlite3
+import time
+
+from cache import MemoryBackend, ResponseCache, SQLiteBackend, StaleWhileRevalidateCache, normalize_query
+
+
+def make_cache(backend, ttl=60):
+    cache = ResponseCache('test')
+    cache.backend = backend
+    cache.ttl = ttl
+    return cache
+
+
+def test_normalize_query_folds_case_and_whitespace():
+    """
+    GIVEN two searches differing only in case and spacing
+    WHEN their cache keys are built
+    THEN the keys are identical
+    """
+    assert normalize_query('GB', '  Data   Scientist ', 'London') == normalize_query('gb', 'data scientist', 'london')
+    assert normalize_query('gb', 'data', 'london') != normalize_query('gb', 'data', 'leeds')
+
+
+def test_memory_cache_counts_hits_misses_and_expires():
+    """
+    GIVEN an in-process cache with a short TTL
+    WHEN a value is read before and after it expires
+    THEN hits and misses are counted and expired values are not returned
+    """
+    cache = make_cache(MemoryBackend(max_entries=10, max_bytes=10_000), ttl=0.05)
+    loads = []
+    assert cache.get_or_load('k', lambda: loads.append(1) or [1, 2]) == [1, 2]
+    assert cache.get_or_load('k', lambda: loads.append(1) or [1, 2]) == [1, 2]
+    assert len(loads) == 1
+    time.sleep(0.06)
+    assert cache.get('k') is None
+    assert cache.stats() == {'hits': 1, 'misses': 2}
+
+
+def test_memory_backend_evicts_least_recently_used_by_count_and_bytes():
+    """
+    GIVEN a backend limited to 2 entries and 10 bytes
+    WHEN more entries are written
+    THEN the least recently used ones are evicted first
+    """
+    backend = MemoryBackend(max_entries=2, max_bytes=10)
+    backend.set('a', b'aaa', 60)
+    backend.set('b', b'bbb', 60)
+    backend.get('a')  # 'b' is now least recently used
+    backend.set('c', b'ccc', 60)
+    assert backend.get('b') is None
+    assert backend.get('a') is not None and backend.get('c') is not None
+
+    backend.set('d', b'dddddddd', 60)  # pushes total over 10 bytes
+    assert backend.get('d') is not None
+    assert backend.get('a') is None and backend.get('c') is None
+
+
+def test_sqlite_backend_is_shared_between_instances(tmp_path):
+    """
+    GIVEN two SQLite-backed caches pointing at the same file (as two gunicorn workers would)
+    WHEN one writes a value
+    THEN the other reads it, and LRU limits are enforced
+    """
+    path = str(tmp_path / 'cache.sqlite3')
+    worker_a = make_cache(SQLiteBackend(path, 'search', max_entries=2, max_bytes=10_000))
+    worker_b = make_cache(SQLiteBackend(path, 'search', max_entries=2, max_bytes=10_000))
+    worker_a.set('k1', {'count': 1})
+    assert worker_b.get('k1') == {'count': 1}
+
+    worker_a.set('k2', {'count': 2})
+    worker_a.set('k3', {'count': 3})
+    assert worker_b.get('k1') is None  # least recently used of the three
+    assert worker_b.get('k2') == {'count': 2}
+    assert worker_b.get('k3') == {'count': 3}
+
+
+def test_sqlite_backend_refreshes_lru_position_at_most_once_per_interval(tmp_path):
+    """
+    GIVEN an entry in the SQLite backend
+    WHEN it is read again within the touch interval, and then after it
+    THEN the first read leaves the row untouched (no write) and the later one refreshes accessed_at
+    """
+    path = str(tmp_path / 'cache.sqlite3')
+    backend = SQLiteBackend(path, 'search', max_entries=10, max_bytes=10_000)
+    backend.set('k', b'payload', 60)
+
+    def accessed_at():
+        with sqlite3.connect(path) as conn:
+            return conn.execute('SELECT accessed_at FROM cache_search WHERE key = ?', ('k',)).fetchone()[0]
+
+    stored = accessed_at()
+    time.sleep(0.01)
+    assert backend.get('k')[0] == b'payload'
+    assert accessed_at() == stored
+
+    backend.touch_interval = 0
+    assert backend.get('k')[0] == b'payload'
+    assert accessed_at() > stored
+
+
+def test_stale_histogram_is_served_and_refreshed_in_background(test_app):
+    """
+    GIVEN a stale-while-revalidate cache holding an entry older than its soft TTL
+    WHEN it is read, first with a working and then with a failing upstream
+    THEN the stale value comes back immediately, is refreshed in the background,
+         and a failing refresh keeps the previous value
+    """
+    cache = StaleWhileRevalidateCache('histogram')
+    cache.backend = MemoryBackend(max_entries=10, max_bytes=10_000)
+    cache.ttl, cache.soft_ttl = 60, 0
+    cache.set('gb|london|devops', {'average': 50000})
+
+    def failing_loader():
+        raise ConnectionError('adzuna down')
+
+    with test_app.app_context():
+        assert cache.get_or_revalidate('gb|london|devops', lambda: {'average': 52000}) == {'average': 50000}
+        deadline = time.time() + 2
+        while cache.get('gb|london|devops') != {'average': 52000} and time.time() < deadline:
+            time.sleep(0.01)
+        assert cache.get('gb|london|devops') == {'average': 52000}
+
+        assert cache.get_or_revalidate('gb|london|devops', failing_loader) == {'average': 52000}
+        while cache._refreshing and time.time() < deadline:
+            time.sleep(0.01)
+        assert cache.get('gb|london|devops') == {'average': 52000}
+
+
+def test_expired_entries_are_kept_for_stale_reads():
+    """
+    GIVEN a cache whose entries are kept past their TTL (STALE_TTL > TTL)
+    WHEN an entry is read after the TTL
+    THEN a normal read misses but an allow_stale read still returns it
+    """
+    cache = make_cache(MemoryBackend(10, 10_000), ttl=0.05)
+    cache.stale_ttl = 60
+    cache.set('k', ['v'])
+    time.sleep(0.1)
+    assert cache.get('k') is None
+    assert cache.get('k', allow_stale=True) == ['v']
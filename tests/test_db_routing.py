@@ -0,0 +1,96 @@
+# Tests for read-replica routing and the engine options built in config.py.
+
+from sqlalchemy import event, insert, select
+
+import app as main_app
+from app import db, SavedJob, User
+from config import engine_options, replica_binds
+from db_routing import REPLICA_BIND, read_replica
+
+
+def use_fake_replica(monkeypatch):
+    """ Registers an engine sharing the primary's pool (same in-memory DB) as the replica. """
+    replica = db.engine.execution_options(replica=True)
+    monkeypatch.setitem(db.engines, REPLICA_BIND, replica)
+    return replica
+
+
+def test_only_plain_selects_inside_read_replica_use_the_replica(test_client, monkeypatch):
+    """
+    GIVEN a configured read replica
+    WHEN the session picks an engine for various statements
+    THEN only SELECTs inside read_replica() without pending changes go to the replica
+    """
+    replica = use_fake_replica(monkeypatch)
+    assert db.session.get_bind(clause=select(User)) is db.engine
+    with read_replica():
+        assert db.session.get_bind(clause=select(User)) is replica
+        assert db.session.get_bind(clause=insert(User)) is db.engine
+        db.session.add(User(email='pending@example.com', password_hash='x'))
+        assert db.session.get_bind(clause=select(User)) is db.engine
+    db.session.rollback()
+
+
+def test_saved_jobs_page_reads_from_the_replica(test_client, monkeypatch):
+    """
+    GIVEN a logged-in user with a saved job and a configured read replica
+    WHEN they open their saved jobs
+    THEN the listing query runs on the replica
+    """
+    test_client.post('/register', data={'email': 'a@example.com', 'password': 'password123',
+                                        'confirm_password': 'password123'})
+    test_client.post('/login', data={'email': 'a@example.com', 'password': 'password123'})
+    test_client.post('/save_job', json={'adzuna_job_id': '1', 'title': 'Nurse', 'adzuna_url': 'u'})
+    replica = use_fake_replica(monkeypatch)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(replica, 'before_cursor_execute', record)
+    try:
+        response = test_client.get('/saved_jobs')
+    finally:
+        event.remove(replica, 'before_cursor_execute', record)
+    assert response.status_code == 200 and b'Nurse' in response.data
+    assert any(SavedJob.__tablename__ in statement for statement in statements)
+
+
+def test_saved_status_lookup_reads_the_primary(test_client, monkeypatch):
+    """
+    GIVEN a configured read replica and a job the user has just saved
+    WHEN the saved status of listings is looked up (and cached)
+    THEN the lookup runs on the primary, so replica lag can't cache the job as unsaved
+    """
+    test_client.post('/register', data={'email': 'b@example.com', 'password': 'password123',
+                                        'confirm_password': 'password123'})
+    test_client.post('/login', data={'email': 'b@example.com', 'password': 'password123'})
+    test_client.post('/save_job', json={'adzuna_job_id': '7', 'title': 'Welder', 'adzuna_url': 'u'})
+    user_id = User.query.filter_by(email='b@example.com').one().id
+    replica = use_fake_replica(monkeypatch)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(replica, 'before_cursor_execute', record)
+    try:
+        assert main_app.saved_job_ids_for(user_id, ['7', '8']) == {'7'}
+    finally:
+        event.remove(replica, 'before_cursor_execute', record)
+    assert not statements
+
+
+def test_engine_options_per_database(monkeypatch):
+    """
+    GIVEN database URLs for SQLite and Postgres
+    WHEN engine options are built
+    THEN SQLite keeps Flask-SQLAlchemy's defaults and Postgres gets pooling and a statement timeout
+    """
+    monkeypatch.delenv('DATABASE_POOL_SIZE', raising=False)
+    assert engine_options('sqlite:///:memory:') == {}
+    assert engine_options(None) == {}
+    options = engine_options('postgresql://db/app', pool_size=3, statement_timeout_ms=5000)
+    assert options['pool_size'] == 3 and options['pool_pre_ping'] is True
+    assert options['connect_args'] == {'options': '-c statement_timeout=5000'}
+    monkeypatch.setenv('DATABASE_POOL_SIZE', '7')
+    assert replica_binds('postgresql://replica/app')[REPLICA_BIND]['pool_size'] == 7
+    assert replica_binds(None) == {}
@@ -0,0 +1,134 @@
+# Tests for the shared pooled upstream HTTP client, against a throwaway local server.
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from http_client import UpstreamClient
+from recording import RecordingStore, ReplayMissError
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    statuses = []
+    client_ports = []
+    retry_after = None
+
+    def do_GET(self):
+        FlakyHandler.client_ports.append(self.client_address[1])
+        status = FlakyHandler.statuses.pop(0) if FlakyHandler.statuses else 200
+        body = b'{"ok": true}'
+        self.send_response(status)
+        if status != 200 and FlakyHandler.retry_after:
+            self.send_header('Retry-After', FlakyHandler.retry_after)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def flaky_server():
+    FlakyHandler.statuses = []
+    FlakyHandler.client_ports = []
+    FlakyHandler.retry_after = None
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_client_retries_5xx_and_reuses_connections(flaky_server):
+    """
+    GIVEN an upstream that answers 503 once and then 200
+    WHEN the client makes two requests
+    THEN the 503 is retried transparently and every request rides the same kept-alive connection
+    """
+    client = UpstreamClient()
+    client.settings.update(UPSTREAM_BACKOFF_FACTOR=0, UPSTREAM_BACKOFF_JITTER=0)
+    client.session = client._build_session()
+    FlakyHandler.statuses = [503]
+
+    first = client.get(f"{flaky_server}/search/1", 'adzuna_search')
+    second = client.get(f"{flaky_server}/histogram", 'adzuna_histogram')
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert len(FlakyHandler.client_ports) == 3  # 503, retry, second call
+    assert len(set(FlakyHandler.client_ports)) == 1
+
+
+def test_retry_after_is_capped_by_backoff_max(flaky_server):
+    """
+    GIVEN an upstream that answers 503 with Retry-After: 120 once
+    WHEN the client makes a request with a small UPSTREAM_BACKOFF_MAX
+    THEN the retry waits backoff_max rather than two minutes
+    """
+    client = UpstreamClient()
+    client.settings.update(UPSTREAM_BACKOFF_MAX=0.1, UPSTREAM_BACKOFF_JITTER=0)
+    client.session = client._build_session()
+    FlakyHandler.statuses, FlakyHandler.retry_after = [503], '120'
+
+    started = time.perf_counter()
+    response = client.get(f"{flaky_server}/search/1", 'adzuna_search')
+
+    assert response.status_code == 200 and len(FlakyHandler.client_ports) == 2
+    assert time.perf_counter() - started < 2
+
+
+def test_rate_limited_prefix_gets_no_status_retries(flaky_server):
+    """
+    GIVEN an upstream prefix whose caller retries through its own rate limiter
+    WHEN the upstream answers 429
+    THEN the session hands the 429 straight back instead of re-sending it
+    """
+    client = UpstreamClient()
+    client.rate_limited(f"{flaky_server}/search")
+    FlakyHandler.statuses = [429]
+
+    assert client.get(f"{flaky_server}/search/1", 'adzuna_search').status_code == 429
+    assert len(FlakyHandler.client_ports) == 1
+
+
+def test_client_uses_separate_connect_and_read_timeouts():
+    """
+    GIVEN the default client settings
+    WHEN timeouts are looked up per upstream
+    THEN each gets the shared connect timeout and its own read timeout
+    """
+    client = UpstreamClient()
+    assert client.timeout('adzuna_search') == (3.05, 20)
+    assert client.timeout('azure_ai') == (3.05, 30)
+
+
+def test_record_then_replay_without_network(flaky_server, tmp_path):
+    """
+    GIVEN a client in record mode talking to a live upstream
+    WHEN the upstream goes away and the same requests are replayed
+    THEN recorded responses come back without the network, and credentials were never stored
+    """
+    store = RecordingStore(str(tmp_path / 'recordings.sqlite3'))
+    recorder = UpstreamClient()
+    recorder.settings['UPSTREAM_MODE'] = 'record'
+    recorder.store = store
+    recorded = recorder.get(f"{flaky_server}/search/1", 'adzuna_search', params={'what': 'qa', 'app_key': 's3cret'})
+    assert recorded.json() == {'ok': True}
+
+    replayer = UpstreamClient()
+    replayer.settings.update(UPSTREAM_MODE='replay', UPSTREAM_REPLAY_LATENCY_SCALE=0)
+    replayer.store = store
+    FlakyHandler.client_ports = []
+    replayed = replayer.get(f"{flaky_server}/search/1", 'adzuna_search', params={'app_key': 'other', 'what': 'qa'})
+
+    assert replayed.status_code == 200 and replayed.json() == {'ok': True}
+    assert FlakyHandler.client_ports == []
+    stored_urls = [row[0] for row in store._connection().execute('SELECT url FROM recordings')]
+    assert stored_urls and not any('s3cret' in url or 'app_key' in url for url in stored_urls)
+    with pytest.raises(ReplayMissError):
+        replayer.get(f"{flaky_server}/histogram", 'adzuna_histogram')
@@ -0,0 +1,101 @@
+# Tests for the job listing store and local full-text search.
+
+from unittest.mock import MagicMock, patch
+
+import app as main_app
+from app import db, JobListing, SavedJob
+
+
+def listing(job_id, title, description='Python and SQL.', location='London'):
+    return {'adzuna_job_id': job_id, 'title': title, 'company': 'Acme', 'location': location,
+            'description': description, 'url': f"https://www.adzuna.co.uk/jobs/details/{job_id}",
+            'created': '2024-01-01T00:00:00Z'}
+
+
+def test_listings_are_upserted_and_full_text_searchable(test_client, monkeypatch):
+    """
+    GIVEN the listing store enabled
+    WHEN listings are recorded, re-recorded with new details and searched
+    THEN each listing is stored once, stays searchable by its current text (stemmed) and location,
+         and searches older than LOCAL_SEARCH_MAX_AGE or with too few matches fall through (None)
+    """
+    monkeypatch.setitem(test_client.application.config, 'JOB_LISTING_STORE_ENABLED', True)
+    monkeypatch.setitem(test_client.application.config, 'LOCAL_SEARCH_MIN_RESULTS', 1)
+    main_app.record_job_listings('GB', [listing('100001', 'Python Developer'), listing('100002', 'Nurse', 'Wards.'),
+                                        listing('100003', 'Data Engineer', location='Leeds')])
+    first_seen = db.session.query(JobListing.first_seen_at).filter_by(adzuna_job_id='100001').scalar()
+    main_app.record_job_listings('gb', [listing('100001', 'Senior Backend Engineer')])
+
+    assert JobListing.query.count() == 3
+    stored = JobListing.query.filter_by(adzuna_job_id='100001').one()
+    assert stored.first_seen_at == first_seen and stored.last_seen_at >= first_seen
+
+    total, jobs = main_app.search_local_listings('gb', 'backend engineers', 'london')
+    assert total == 1 and jobs[0]['title'] == 'Senior Backend Engineer' and jobs[0]['url'].endswith('100001')
+    assert main_app.search_local_listings('gb', 'developer', 'london') is None  # old title no longer indexed
+    assert main_app.search_local_listings('gb', 'engineer', 'leeds')[0] == 1
+    assert main_app.search_local_listings('gb', '") OR (', 'london') is None  # input is never FTS syntax
+    monkeypatch.setitem(test_client.application.config, 'LOCAL_SEARCH_MAX_AGE', -60)
+    assert main_app.search_local_listings('gb', 'engineer', 'leeds') is None
+
+
+def test_location_wildcards_are_matched_literally(test_client, monkeypatch):
+    """
+    GIVEN stored listings in London and in a location containing an underscore
+    WHEN local search is filtered by locations containing LIKE wildcards
+    THEN % and _ only match themselves instead of any text
+    """
+    monkeypatch.setitem(test_client.application.config, 'JOB_LISTING_STORE_ENABLED', True)
+    monkeypatch.setitem(test_client.application.config, 'LOCAL_SEARCH_MIN_RESULTS', 1)
+    main_app.record_job_listings('gb', [listing('200001', 'Python Developer'),
+                                        listing('200002', 'Python Tester', location='Site_B')])
+
+    assert main_app.search_local_listings('gb', 'python', '%') is None
+    assert main_app.search_local_listings('gb', 'python', 'l_ndon') is None
+    total, jobs = main_app.search_local_listings('gb', 'python', 'site_b')
+    assert total == 1 and jobs[0]['location'] == 'Site_B'
+
+
+@patch('app.upstream.session.get')
+def test_prefer_mode_answers_repeat_searches_locally_and_saved_jobs_show_details(mock_get, test_client, monkeypatch):
+    """
+    GIVEN LOCAL_SEARCH_MODE 'prefer' and an empty store
+    WHEN the same search runs twice and a listing from it is saved
+    THEN only the first search calls Adzuna, its listings are stored on the background pool rather than
+         inline, and the saved jobs page shows the stored description
+    """
+    def adzuna(url, *args, **kwargs):
+        response = MagicMock(status_code=200)
+        response.json.return_value = {'count': 500, 'results': [{
+            'title': f"Staff Nurse {i}", 'company': {'display_name': 'NHS'}, 'location': {'display_name': 'London'},
+            'description': f"Ward based nursing role number {i}.", 'created': '2024-01-01T00:00:00Z',
+            'redirect_url': f"https://www.adzuna.co.uk/jobs/details/20000{i}"} for i in range(3)]}
+        return response
+    mock_get.side_effect = adzuna
+    config = test_client.application.config
+    monkeypatch.setitem(config, 'JOB_LISTING_STORE_ENABLED', True)
+    monkeypatch.setitem(config, 'LOCAL_SEARCH_MODE', 'prefer')
+    monkeypatch.setitem(config, 'LOCAL_SEARCH_MIN_RESULTS', 3)
+    monkeypatch.setattr(main_app, 'ADZUNA_APP_ID', 'id')
+    monkeypatch.setattr(main_app, 'ADZUNA_APP_KEY', 'key')
+    queued = []
+
+    def submit_background(func, *args):
+        queued.append((func, args))
+    monkeypatch.setattr(main_app, 'submit_background', submit_background)
+
+    assert main_app.get_search_results('gb', 'nurse', 'london')[0] == 500
+    assert mock_get.call_count == 1
+    assert JobListing.query.count() == 0 and [func for func, _ in queued] == [main_app.record_job_listings]
+    for func, args in queued:
+        func(*args)
+    total, jobs = main_app.get_search_results('gb', 'nursing', 'london')
+    assert mock_get.call_count == 1 and total == 3 and {job['title'] for job in jobs} == {f"Staff Nurse {i}" for i in range(3)}
+
+    test_client.post('/register', data={'email': 'n@example.com', 'password': 'password123',
+                                        'confirm_password': 'password123'})
+    test_client.post('/login', data={'email': 'n@example.com', 'password': 'password123'})
+    test_client.post('/save_job', json={'adzuna_job_id': '200001', 'title': 'Staff Nurse 1', 'adzuna_url': 'u'})
+    response = test_client.get('/saved_jobs')
+    assert b'Ward based nursing role number 1.' in response.data
+    assert SavedJob.query.one().listing.company == 'NHS'
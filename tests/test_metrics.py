@@ -0,0 +1,90 @@
+# Tests for the Prometheus metrics endpoint and recorders.
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import metrics
+from app import db, upstream
+from config import ProductionConfig
+
+
+def test_histogram_exposes_cumulative_buckets():
+    """
+    GIVEN a histogram child with a few observations
+    WHEN the registry is rendered
+    THEN buckets are cumulative and _count/_sum match the observations
+    """
+    histogram = metrics.Histogram('test_duration_seconds', 'Test histogram.', ('kind',), buckets=(0.1, 1.0))
+    child = histogram.labels('a')
+    for value in (0.05, 0.5, 5.0):
+        child.observe(value)
+    text = metrics.render()
+    assert 'test_duration_seconds_bucket{kind="a",le="0.1"} 1' in text
+    assert 'test_duration_seconds_bucket{kind="a",le="1.0"} 2' in text
+    assert 'test_duration_seconds_bucket{kind="a",le="+Inf"} 3' in text
+    assert 'test_duration_seconds_count{kind="a"} 3' in text
+    metrics.REGISTRY.remove(histogram)
+
+
+def test_metrics_endpoint_reports_upstream_route_and_db_timings(test_client):
+    """
+    GIVEN an upstream call that returns an error and a page view that queries the database
+    WHEN /metrics is scraped
+    THEN upstream latency and errors, route latency and SQL timings are all exposed
+    """
+    failing = MagicMock(status_code=503)
+    with patch.object(upstream.session, 'get', return_value=failing):
+        upstream.get('https://example.test/', 'adzuna_histogram')
+    test_client.get('/login')
+    test_client.post('/login', data={'email': 'nobody@example.com', 'password': 'x'})
+
+    response = test_client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    text = response.get_data(as_text=True)
+    assert 'upstream_request_duration_seconds_count{upstream="adzuna_histogram"}' in text
+    assert 'upstream_errors_total{upstream="adzuna_histogram",kind="http_status"}' in text
+    assert 'http_request_duration_seconds_count{endpoint="main_bp.login"}' in text
+    assert 'db_query_duration_seconds_count{operation="select"}' in text
+    assert 'cache_requests_total{cache="search",result="miss"}' in text
+
+
+def test_metrics_token_is_required_when_configured(test_client, monkeypatch):
+    """
+    GIVEN a METRICS_TOKEN in the config
+    WHEN /metrics is scraped without it, with a wrong one and with the right one
+    THEN only the scrape presenting the right bearer token gets the metrics
+    """
+    monkeypatch.setitem(test_client.application.config, 'METRICS_TOKEN', 's3cret')
+    assert test_client.get('/metrics').status_code == 401
+    assert test_client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert test_client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
+
+
+def test_metrics_are_off_by_default_in_production():
+    """
+    GIVEN the production config without METRICS_ENABLED in the environment
+    WHEN it is loaded
+    THEN /metrics is disabled
+    """
+    assert ProductionConfig.METRICS_ENABLED is False
+
+
+def test_failing_statements_leave_no_timing_state_on_the_connection(test_client):
+    """
+    GIVEN SQL statements that raise, followed by one that succeeds on the same connection
+    WHEN they are executed
+    THEN nothing is left on the connection and the successful statement is still timed
+    """
+    before = sum(metrics._db_children['select'].counts)
+    with db.engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text('SELECT * FROM no_such_table'))
+            conn.rollback()
+        conn.execute(text('SELECT 1'))
+        assert not any(key.startswith('_metrics') for key in conn.info)
+    assert sum(metrics._db_children['select'].counts) == before + 1
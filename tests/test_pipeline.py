@@ -0,0 +1,112 @@
+# Tests for the concurrent stage pipeline used by fetch_market_insights.
+
+import threading
+import time
+
+from pipeline import StagePipeline
+
+
+def test_independent_stages_run_in_parallel(test_app):
+    """
+    GIVEN two independent stages that each sleep for 0.2s
+    WHEN the pipeline runs
+    THEN total latency is close to the longest stage rather than the sum
+    """
+    pipeline = StagePipeline()
+    pipeline.add('a', lambda: time.sleep(0.2) or 'a-done')
+    pipeline.add('b', lambda: time.sleep(0.2) or 'b-done')
+    with test_app.app_context():
+        outcome = pipeline.run()
+
+    assert outcome.results == {'a': 'a-done', 'b': 'b-done'}
+    assert outcome.total_ms < 350
+    assert set(outcome.timings) == {'a', 'b'}
+
+
+def test_dependent_stage_receives_results_and_is_skipped_on_failure(test_app):
+    """
+    GIVEN a stage that depends on one successful and one failing stage
+    WHEN the pipeline runs
+    THEN dependents get upstream results as arguments and are skipped when a dependency fails
+    """
+    def boom():
+        raise ValueError('upstream down')
+
+    pipeline = StagePipeline()
+    pipeline.add('search', lambda: 3)
+    pipeline.add('broken', boom)
+    pipeline.add('double', lambda n: n * 2, after=('search',))
+    pipeline.add('needs_broken', lambda n, b: n, after=('search', 'broken'))
+    with test_app.app_context():
+        outcome = pipeline.run()
+
+    assert outcome.get('double') == 6
+    assert isinstance(outcome.errors['broken'], ValueError)
+    assert 'needs_broken' in outcome.errors
+    assert not outcome.ok('needs_broken')
+
+
+class RejectingExecutor:
+    """ An executor that refuses every stage, like a pool that is shutting down. """
+
+    def submit(self, *args, **kwargs):
+        raise RuntimeError('cannot schedule new futures after shutdown')
+
+
+def test_stages_the_pool_rejects_fail_instead_of_hanging(test_app):
+    """
+    GIVEN a pool that rejects every submission
+    WHEN a pipeline with a dependent stage runs
+    THEN the run returns, the rejected stage records the error and its dependent is skipped
+    """
+    pipeline = StagePipeline(executor=RejectingExecutor(), timeout=5)
+    pipeline.add('search', lambda: 1)
+    pipeline.add('summary', lambda n: n, after=('search',))
+    with test_app.app_context():
+        outcome = pipeline.run()
+
+    assert isinstance(outcome.errors['search'], RuntimeError)
+    assert 'summary' in outcome.errors and outcome.results == {}
+    assert outcome.total_ms < 1000
+
+
+def test_run_stops_waiting_after_the_timeout(test_app):
+    """
+    GIVEN a stage slower than the pipeline timeout, and a stage depending on it
+    WHEN the pipeline runs
+    THEN it returns after the timeout with both stages recorded as timed out and fast stages kept
+    """
+    pipeline = StagePipeline(timeout=0.1)
+    pipeline.add('fast', lambda: 'ok')
+    pipeline.add('slow', lambda: time.sleep(0.5))
+    pipeline.add('after_slow', lambda _: 'never', after=('slow',))
+    with test_app.app_context():
+        outcome = pipeline.run()
+
+    assert outcome.get('fast') == 'ok' and outcome.total_ms < 400
+    assert isinstance(outcome.errors['slow'], TimeoutError)
+    assert isinstance(outcome.errors['after_slow'], TimeoutError)
+
+
+def test_stages_finishing_after_the_timeout_do_not_change_the_result(test_app):
+    """
+    GIVEN a stage that finishes only after the pipeline has timed out
+    WHEN the caller keeps reading the returned result
+    THEN the late stage's value never appears and the stage stays recorded only as timed out
+    """
+    done = threading.Event()
+
+    def late():
+        time.sleep(0.2)
+        done.set()
+        return 'late'
+
+    pipeline = StagePipeline(timeout=0.05)
+    pipeline.add('late', late)
+    with test_app.app_context():
+        outcome = pipeline.run()
+
+    assert done.wait(2)
+    time.sleep(0.05)
+    assert 'late' not in outcome.results and 'late' not in outcome.timings
+    assert isinstance(outcome.errors['late'], TimeoutError)
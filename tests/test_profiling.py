@@ -0,0 +1,59 @@
+# Tests for Server-Timing headers and sampled request profiling.
+
+import time
+
+from flask import Flask
+
+import profiling
+from pipeline import StagePipeline
+
+
+def make_app(**config):
+    app = Flask(__name__)
+    app.config.update(config)
+    profiling.init_app(app)
+
+    @app.route('/slow')
+    def slow():
+        pipeline = StagePipeline()
+        pipeline.add('search', lambda: _sleep_in_stage('adzuna', 0.02))
+        pipeline.run()
+        with profiling.timed('render'):
+            return 'ok'
+    return app
+
+
+def _sleep_in_stage(name, seconds):
+    with profiling.timed(name):
+        time.sleep(seconds)
+
+
+def test_server_timing_includes_stages_run_on_the_pool():
+    """
+    GIVEN Server-Timing enabled
+    WHEN a request runs one stage on the shared pool and one inline
+    THEN both stages and the total appear in the Server-Timing header
+    """
+    response = make_app(SERVER_TIMING_ENABLED=True).test_client().get('/slow')
+    header = response.headers['Server-Timing']
+    assert 'adzuna;dur=' in header and 'render;dur=' in header and 'total;dur=' in header
+    adzuna_ms = float(header.split('adzuna;dur=')[1].split(',')[0])
+    assert adzuna_ms >= 15
+
+
+def test_sampled_slow_requests_are_profiled_and_disabled_costs_nothing(tmp_path):
+    """
+    GIVEN every request sampled with a slow-request threshold, then a threshold alone or nothing enabled
+    WHEN requests are made
+    THEN only sampled requests slower than the threshold write a .prof file; without sampling no hooks exist
+    """
+    app = make_app(PROFILE_SAMPLE_RATE=1.0, PROFILE_SLOW_MS=1, PROFILE_DIR=str(tmp_path))
+    response = app.test_client().get('/slow')
+    assert 'Server-Timing' not in response.headers
+    assert len(list(tmp_path.glob('*-slow-*.prof'))) == 1
+    make_app(PROFILE_SAMPLE_RATE=1.0, PROFILE_SLOW_MS=60_000, PROFILE_DIR=str(tmp_path)).test_client().get('/slow')
+    assert len(list(tmp_path.glob('*.prof'))) == 1
+
+    for quiet in (make_app(), make_app(PROFILE_SLOW_MS=1, PROFILE_DIR=str(tmp_path))):
+        assert not quiet.before_request_funcs and not quiet.teardown_request_funcs
+    assert profiling.timed('render') is profiling.timed('adzuna')
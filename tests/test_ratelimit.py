@@ -0,0 +1,113 @@
+# Tests for the client-side Adzuna rate limiter and daily quota.
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import app as main_app
+from pipeline import StagePipeline
+from ratelimit import RateLimiter, RateLimitExceeded
+
+
+def make_limiter(path, rate=20.0, burst=2, daily_quota=100, max_wait=0.5):
+    limiter = RateLimiter('test')
+    limiter.enabled = True
+    limiter.rate, limiter.min_rate, limiter.burst = rate, 0.1, burst
+    limiter.daily_quota, limiter.max_wait = daily_quota, max_wait
+    limiter.open(str(path / 'ratelimit.sqlite3'))
+    return limiter
+
+
+def test_bucket_is_shared_and_waits_for_refill(tmp_path):
+    """
+    GIVEN two limiters (e.g. two gunicorn workers) on the same state file with a burst of 2
+    WHEN three requests are made across them
+    THEN the third waits for a refilled token and all count against one daily budget
+    """
+    first, second = make_limiter(tmp_path), make_limiter(tmp_path)
+    first.acquire()
+    second.acquire()
+    first.acquire()  # bucket empty: waits ~1/20s for a token
+    usage = second.usage()
+    assert usage['used_today'] == 3
+    assert usage['remaining_today'] == 97
+
+
+def test_refuses_when_no_token_in_time_or_quota_used(tmp_path):
+    """
+    GIVEN a slow bucket and a small daily quota
+    WHEN callers exceed them
+    THEN RateLimitExceeded is raised and the budget is reported as low
+    """
+    slow = make_limiter(tmp_path / 'slow', rate=0.1, burst=1, max_wait=0.05)
+    slow.acquire()
+    with pytest.raises(RateLimitExceeded):
+        slow.acquire()
+
+    small = make_limiter(tmp_path / 'small', burst=5, daily_quota=2)
+    small.acquire()
+    small.acquire()
+    assert small.budget_low()
+    with pytest.raises(RateLimitExceeded):
+        small.acquire()
+
+
+def test_rate_halves_on_429(tmp_path):
+    """
+    GIVEN a limiter running at its configured rate
+    WHEN Adzuna answers 429
+    THEN the client-side rate is halved and healthy responses straight after do not undo it
+    """
+    limiter = make_limiter(tmp_path)
+    limiter.record_response(429)
+    assert limiter.usage()['current_rate_per_second'] == 10.0
+    limiter.record_response(200)
+    assert limiter.usage()['current_rate_per_second'] == 10.0
+
+
+def test_adzuna_retries_go_through_the_limiter(tmp_path, monkeypatch):
+    """
+    GIVEN Adzuna answering 429 once and then 200
+    WHEN adzuna_get makes the call
+    THEN the retry happens in adzuna_get: both attempts take a token and count against the quota,
+         and the 429 halves the client-side rate
+    """
+    limiter = make_limiter(tmp_path, burst=5)
+    monkeypatch.setattr(main_app, 'adzuna_limiter', limiter)
+    monkeypatch.setitem(main_app.upstream.settings, 'UPSTREAM_BACKOFF_MAX', 0)
+    throttled, ok = MagicMock(status_code=429, headers={'Retry-After': '30'}), MagicMock(status_code=200, headers={})
+    with patch.object(main_app.upstream.session, 'get', side_effect=[throttled, ok]) as mock_get:
+        response = main_app.adzuna_get('https://api.adzuna.com/v1/api/jobs/gb/search/1', 'adzuna_search', {})
+
+    assert response is ok and mock_get.call_count == 2
+    usage = limiter.usage()
+    assert usage['used_today'] == 2 and usage['current_rate_per_second'] == 10.0
+
+
+def test_quota_endpoint_requires_login(test_client):
+    """
+    GIVEN an anonymous visitor
+    WHEN they request the Adzuna budget page
+    THEN access is refused
+    """
+    response = test_client.get('/quota')
+    assert response.status_code == 401
+
+
+def test_patient_callers_wait_for_a_token_including_in_pipeline_stages(tmp_path, test_app):
+    """
+    GIVEN an empty bucket refilling at 20/s and an interactive wait too short for a token
+    WHEN a batch caller acquires inside patient(), directly and from a pipeline stage it starts
+    THEN both wait for the refill instead of failing, and the short wait applies again afterwards
+    """
+    limiter = make_limiter(tmp_path, burst=1, max_wait=0.001)
+    limiter.batch_max_wait = 5.0
+    limiter.acquire()
+    with limiter.patient():
+        limiter.acquire()
+        pipeline = StagePipeline()
+        pipeline.add('search', limiter.acquire)
+        with test_app.app_context():
+            assert pipeline.run().errors == {}
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire()
@@ -0,0 +1,90 @@
+# Tests for the bulk market-report endpoint.
+
+import json
+import time
+from unittest.mock import patch, MagicMock
+
+import app as main_app
+from conftest import login
+from ratelimit import RateLimiter
+
+
+def slow_adzuna(url, *args, params=None, **kwargs):
+    time.sleep(0.1)
+    response = MagicMock(status_code=200)
+    if url.endswith('/histogram'):
+        response.json.return_value = {"histogram": {"50000": 1}}
+    elif params['what'] == 'broken':
+        response.raise_for_status.side_effect = main_app.requests.exceptions.HTTPError(response=MagicMock(status_code=500))
+    else:
+        response.json.return_value = {"count": len(params['what']), "results": []}
+    return response
+
+
+@patch('app.upstream.session.get', side_effect=slow_adzuna)
+def test_market_report_streams_rows_concurrently(mock_get, test_client, monkeypatch):
+    """
+    GIVEN 10 report queries against an upstream that takes 100ms per call
+    WHEN the report is requested as NDJSON
+    THEN every query gets a row (errors included) in far less time than running them one by one
+    """
+    monkeypatch.setattr(main_app, 'ADZUNA_APP_ID', 'id')
+    monkeypatch.setattr(main_app, 'ADZUNA_APP_KEY', 'key')
+    login(test_client)
+    queries = [{'what': f'role{i}', 'where': 'london', 'country': 'gb'} for i in range(9)]
+    queries.append({'what': 'broken', 'where': 'london', 'country': 'gb'})
+
+    started = time.perf_counter()
+    response = test_client.post('/reports/market', json={'queries': queries})
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    elapsed = time.perf_counter() - started
+
+    assert response.mimetype == 'application/x-ndjson'
+    assert len(rows) == 10
+    assert elapsed < 1.0  # sequentially this would take ~2s (search + histogram per query)
+    by_what = {row['what']: row for row in rows}
+    assert by_what['role1']['total_matching_jobs'] == 5 and by_what['role1']['average_salary'] == 50000
+    assert by_what['broken']['status'] == 'error' and 'Adzuna API Error (500)' in by_what['broken']['error']
+
+
+def test_market_report_csv_and_validation(test_client, monkeypatch):
+    """
+    GIVEN a logged-in user
+    WHEN a report is requested as CSV, and when the request is malformed
+    THEN the CSV has a header row and one row per query, and bad input gets a 400
+    """
+    login(test_client)
+    with patch('app.upstream.session.get', side_effect=slow_adzuna):
+        monkeypatch.setattr(main_app, 'ADZUNA_APP_ID', 'id')
+        monkeypatch.setattr(main_app, 'ADZUNA_APP_KEY', 'key')
+        response = test_client.post('/reports/market?format=csv',
+                                    json={'queries': [{'what': 'qa', 'where': 'leeds', 'country': 'gb'}]})
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0] == ','.join(main_app.REPORT_FIELDS)
+    assert lines[1].startswith('qa,leeds,gb,ok,2,50000')
+
+    assert test_client.post('/reports/market', json={'queries': []}).status_code == 400
+    assert test_client.post('/reports/market', json=[]).status_code == 400
+    assert test_client.post('/reports/market', json=[1]).status_code == 400
+    assert test_client.post('/reports/market', json={'queries': [{'what': 'qa'}]}).status_code == 400
+
+
+def test_market_report_is_paced_by_the_rate_limiter_not_failed(test_client, monkeypatch, tmp_path):
+    """
+    GIVEN the Adzuna rate limiter on, with a small burst and an interactive wait too short for a refill
+    WHEN a report of 8 queries (16 Adzuna calls) runs
+    THEN every row succeeds: report calls wait for tokens instead of being turned away
+    """
+    limiter = RateLimiter('adzuna_test')
+    limiter.enabled, limiter.rate, limiter.burst, limiter.max_wait, limiter.batch_max_wait = True, 50.0, 2, 0.001, 10.0
+    limiter.open(str(tmp_path / 'ratelimit.sqlite3'))
+    monkeypatch.setattr(main_app, 'adzuna_limiter', limiter)
+    monkeypatch.setattr(main_app, 'ADZUNA_APP_ID', 'id')
+    monkeypatch.setattr(main_app, 'ADZUNA_APP_KEY', 'key')
+    login(test_client)
+    queries = [{'what': f'role{i}', 'where': 'york', 'country': 'gb'} for i in range(8)]
+    with patch('app.upstream.session.get', side_effect=slow_adzuna):
+        response = test_client.post('/reports/market', json={'queries': queries})
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['status'] for row in rows] == ['ok'] * 8
+    assert limiter.usage()['used_today'] == 16
@@ -0,0 +1,91 @@
+# Tests for the vectorized salary statistics.
+
+import random
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+import app as main_app
+from cache import LocalLRU
+from salary_stats import compare, histogram_arrays, histogram_key, salary_stats, summarize
+
+
+def reference_percentiles(histogram):
+    """ The same statistics one histogram at a time, with np.interp. """
+    salaries, counts = histogram_arrays(histogram)
+    midpoints = (np.cumsum(counts) - counts / 2) / counts.sum()
+    return [float(np.interp(p / 100, midpoints, salaries)) for p in (10, 25, 50, 75, 90)]
+
+
+def test_percentiles_median_and_spread():
+    """
+    GIVEN a histogram with an unordered, malformed and empty bucket
+    WHEN its statistics are computed
+    THEN bad buckets are dropped and the mean, weighted percentiles and spread come from the rest
+    """
+    stats = salary_stats({"60000": 2, "junk": 5, "40000": 2, "90000": 0, "70000": None})
+    assert stats == {'count': 4, 'mean': 50000, 'median': 50000, 'p10': 40000, 'p25': 40000,
+                     'p75': 60000, 'p90': 60000, 'iqr': 20000, 'spread': 20000}
+    assert salary_stats({"10000": 1, "20000": 1, "30000": 2})['median'] == 23333  # 20000 + (0.5 - 0.375) / 0.375 * 10000
+    assert salary_stats({}) is None and salary_stats({"x": 1}) is None
+
+
+def test_batched_pass_matches_one_histogram_at_a_time():
+    """
+    GIVEN many histograms of different lengths
+    WHEN they are summarized in one batch
+    THEN each result matches computing that histogram alone
+    """
+    rng = random.Random(7)
+    histograms = [{str(rng.randint(10, 150) * 1000): rng.choice([1, 3, 20, 150]) for _ in range(rng.randint(1, 12))}
+                  for _ in range(300)]
+    for histogram, stats in zip(histograms, summarize(histograms)):
+        expected = reference_percentiles(histogram)
+        actual = [stats[key] for key in ('p10', 'p25', 'median', 'p75', 'p90')]
+        assert all(abs(a - e) <= 1 for a, e in zip(actual, expected))
+
+
+def test_results_are_memoized_by_histogram_content():
+    """
+    GIVEN a cache and two histograms with the same buckets in a different order
+    WHEN they are compared twice
+    THEN they share one cache entry and the second comparison computes nothing
+    """
+    cache = LocalLRU('salary_stats_test')
+    first, same = {"30000": 4, "50000": 1}, {"50000": 1, "30000": 4}
+    assert histogram_key(first) == histogram_key(same) != histogram_key({"30000": 4, "50000": 2})
+    results = compare([first, same, {}], cache)
+    assert results[0] == results[1] and results[2] is None
+    with patch('salary_stats.summarize') as summarize_mock:
+        assert compare([same], cache) == results[:1]
+    summarize_mock.assert_not_called()
+
+
+@patch('app.upstream.session.get')
+def test_salary_comparison_endpoint(mock_get, test_client, monkeypatch):
+    """
+    GIVEN a logged-in user and Adzuna histograms that differ by location
+    WHEN several locations are compared in one request
+    THEN each gets its statistics in input order, and a malformed request gets a 400
+    """
+    monkeypatch.setattr(main_app, 'ADZUNA_APP_ID', 'id')
+    monkeypatch.setattr(main_app, 'ADZUNA_APP_KEY', 'key')
+    histograms = {'london': {"50000": 3, "70000": 1}, 'leeds': {"30000": 1, "40000": 1}, 'nowhere': {}}
+
+    def adzuna(url, *args, params=None, **kwargs):
+        response = MagicMock(status_code=200)
+        response.json.return_value = {"histogram": histograms[params['location0']]}
+        return response
+    mock_get.side_effect = adzuna
+    test_client.post('/register', data={'email': 'pay@example.com', 'password': 'password123',
+                                        'confirm_password': 'password123'})
+    test_client.post('/login', data={'email': 'pay@example.com', 'password': 'password123'})
+
+    queries = [{'what': 'analyst', 'where': where, 'country': 'gb'} for where in ('london', 'leeds', 'nowhere')]
+    response = test_client.post('/salaries/compare', json={'queries': queries})
+    results = response.get_json()['results']
+    assert [result['where'] for result in results] == ['london', 'leeds', 'nowhere']
+    assert results[0]['stats']['median'] == 55000 and results[0]['stats']['p90'] == 70000
+    assert results[1]['stats']['mean'] == 35000 and results[2]['stats'] is None
+    assert test_client.post('/salaries/compare', json={'queries': [{'what': 'x'}]}).status_code == 400
+    assert test_client.post('/salaries/compare', json=[{'what': 'x'}]).status_code == 400
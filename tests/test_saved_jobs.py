@@ -0,0 +1,149 @@
+# Tests for saved-job lookups and the save/unsave endpoints.
+
+import json
+
+from sqlalchemy import event
+
+import app as main_app
+from app import db, SavedJob, User
+from conftest import login
+
+
+def count_queries(engine):
+    """ Starts recording the SQL run on engine; returns (statements, stop). """
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    def stop():
+        event.remove(engine, 'before_cursor_execute', record)
+    event.listen(engine, 'before_cursor_execute', record)
+    return statements, stop
+
+
+def test_saved_status_lookup_only_queries_shown_ids_and_is_cached(test_client):
+    """
+    GIVEN a user with many saved jobs
+    WHEN the saved status of a page of listings is looked up twice
+    THEN only the shown IDs are returned, the second lookup hits the cache, and saving invalidates it
+    """
+    login(test_client)
+    with test_client.application.app_context():
+        user = User.query.filter_by(email='recruiter@example.com').first()
+        db.session.add_all([SavedJob(adzuna_job_id=str(i), title=f"Job {i}", adzuna_url='u', user_id=user.id)
+                            for i in range(500)])
+        user_id = user.id
+        db.session.commit()
+        main_app.saved_ids_cache.clear()
+
+        statements, stop = count_queries(db.engine)
+        assert main_app.saved_job_ids_for(user_id, ['3', '42', 'not-saved']) == {'3', '42'}
+        assert main_app.saved_job_ids_for(user_id, ['3', 'not-saved']) == {'3'}
+        stop()
+        assert len(statements) == 1
+
+    response = test_client.post('/save_job', json={'adzuna_job_id': 'not-saved', 'title': 'New', 'adzuna_url': 'u'})
+    assert response.get_json()['status'] == 'success'
+    with test_client.application.app_context():
+        assert main_app.saved_job_ids_for(user_id, ['3', 'not-saved']) == {'3', 'not-saved'}
+
+
+def test_bulk_save_and_unsave_report_per_item_status(test_client):
+    """
+    GIVEN a logged-in user who already saved one job
+    WHEN a page of jobs is bulk saved and then bulk unsaved
+    THEN each item gets its own status and the rows are written/removed in single statements
+    """
+    login(test_client)
+
+    def job(job_id):
+        return {'adzuna_job_id': job_id, 'title': f"Job {job_id}", 'adzuna_url': f"https://x/{job_id}"}
+    test_client.post('/save_job', json=job('1'))
+
+    with test_client.application.app_context():
+        engine = db.engine
+    statements, stop = count_queries(engine)
+    response = test_client.post('/saved_jobs/bulk_save',
+                                json={'jobs': [job('1'), job('2'), job('3'), job('3'), {'adzuna_job_id': '4'}]})
+    stop()
+    body = response.get_json()
+    assert response.status_code == 200 and body['saved'] == 2
+    assert [item['status'] for item in body['results']] == ['already_saved', 'saved', 'saved',
+                                                             'already_saved', 'invalid']
+    assert sum(1 for statement in statements if statement.startswith('INSERT')) == 1
+    assert test_client.post('/save_job', json=job('2')).status_code == 409
+
+    response = test_client.post('/saved_jobs/bulk_unsave', json={'adzuna_job_ids': ['1', '2', 'missing']})
+    body = response.get_json()
+    assert [item['status'] for item in body['results']] == ['removed', 'removed', 'not_found']
+    with test_client.application.app_context():
+        assert [job.adzuna_job_id for job in SavedJob.query.all()] == ['3']
+    assert test_client.post('/saved_jobs/bulk_unsave', json={'adzuna_job_ids': []}).status_code == 400
+
+
+def test_bulk_endpoints_reject_malformed_bodies_and_fit_long_fields(test_client):
+    """
+    GIVEN a logged-in user
+    WHEN bulk requests send JSON lists, non-object jobs or non-string fields, and a job has an over-long title
+    THEN the malformed requests get a 400 instead of a 500, and the long title is truncated to fit its column
+    """
+    login(test_client)
+    job = {'adzuna_job_id': '9', 'title': 'T' * 500, 'adzuna_url': 'u', 'company': 'Acme'}
+    for path, body in [('/saved_jobs/bulk_save', [job]), ('/saved_jobs/bulk_save', {'jobs': ['9']}),
+                       ('/saved_jobs/bulk_save', {'jobs': [dict(job, company={'name': 'Acme'})]}),
+                       ('/saved_jobs/bulk_save', {'jobs': [dict(job, title=7)]}),
+                       ('/saved_jobs/bulk_unsave', ['9']), ('/save_job', ['9'])]:
+        assert test_client.post(path, json=body).status_code == 400, (path, body)
+
+    response = test_client.post('/saved_jobs/bulk_save', json={'jobs': [job]})
+    assert response.get_json()['saved'] == 1
+    assert len(SavedJob.query.one().title) == 200
+
+
+def test_portable_save_skips_jobs_already_saved(test_client):
+    """
+    GIVEN a user who already saved one job
+    WHEN jobs are saved through the fallback used on databases without ON CONFLICT
+    THEN only the missing ones are inserted and reported as inserted
+    """
+    login(test_client)
+    test_client.post('/save_job', json={'adzuna_job_id': '1', 'title': 'One', 'adzuna_url': 'u'})
+    user_id = User.query.filter_by(email='recruiter@example.com').one().id
+    rows = {job_id: {'adzuna_job_id': job_id, 'title': job_id, 'company': None, 'location': None,
+                     'adzuna_url': 'u', 'user_id': user_id} for job_id in ('1', '2')}
+    assert main_app._insert_missing_saved_jobs(user_id, rows) == {'2'}
+    db.session.commit()
+    assert sorted(job.adzuna_job_id for job in SavedJob.query.all()) == ['1', '2']
+
+
+def test_saved_jobs_are_keyset_paginated_and_exported_in_full(test_client, monkeypatch):
+    """
+    GIVEN a user with more saved jobs than fit on one page
+    WHEN they page through the list and export it
+    THEN pages follow each other without gaps or repeats and the export streams every row
+    """
+    login(test_client)
+    with test_client.application.app_context():
+        user = User.query.filter_by(email='recruiter@example.com').first()
+        db.session.add_all([SavedJob(adzuna_job_id=f"job-{i:03d}", title=f"Job {i}", adzuna_url='u', user_id=user.id)
+                            for i in range(25)])
+        db.session.commit()
+        user_id = user.id
+        first, cursor = main_app.saved_jobs_page(user_id, per_page=10)
+        second, cursor = main_app.saved_jobs_page(user_id, cursor, per_page=10)
+        third, cursor = main_app.saved_jobs_page(user_id, cursor, per_page=10)
+    ids = [job.adzuna_job_id for job in first + second + third]
+    assert ids == [f"job-{i:03d}" for i in range(24, -1, -1)]
+    assert cursor is None
+
+    monkeypatch.setitem(test_client.application.config, 'SAVED_JOBS_PER_PAGE', 10)
+    page = test_client.get('/saved_jobs').get_data(as_text=True)
+    assert 'Job 24' in page and 'Job 14' not in page and 'before=' in page
+
+    export = test_client.get('/saved_jobs/export?format=ndjson')
+    lines = export.get_data(as_text=True).splitlines()
+    assert export.mimetype == 'application/x-ndjson' and len(lines) == 25
+    assert json.loads(lines[0])['adzuna_job_id'] == 'job-024'
+    csv_export = test_client.get('/saved_jobs/export').get_data(as_text=True).splitlines()
+    assert csv_export[0] == 'id,adzuna_job_id,title,company,location,adzuna_url' and len(csv_export) == 26
@@ -0,0 +1,67 @@
+# Tests for single-flight coalescing of identical upstream calls.
+
+import threading
+import time
+
+from singleflight import SingleFlight
+
+
+def run_concurrently(n, target):
+    results = [None] * n
+    threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, target())) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    """
+    GIVEN eight threads requesting the same key at once
+    WHEN the upstream call takes a moment
+    THEN it runs once and every caller receives its result
+    """
+    flights = SingleFlight()
+    calls = []
+
+    def slow_search():
+        calls.append(1)
+        time.sleep(0.1)
+        return {'count': 42}
+
+    results = run_concurrently(8, lambda: flights.do('search:gb|devops|london', slow_search))
+    assert len(calls) == 1
+    assert results == [{'count': 42}] * 8
+
+
+def test_host_mode_lets_other_workers_reuse_the_cached_result(tmp_path):
+    """
+    GIVEN two single-flight groups in 'host' mode sharing a lock directory (two gunicorn workers)
+    WHEN both miss the same key at once
+    THEN only one calls upstream and the other picks the value up from the shared cache on recheck
+    """
+    shared_cache = {}
+    calls = []
+    workers = []
+    for _ in range(2):
+        flights = SingleFlight()
+        flights.mode, flights.lock_dir = 'host', str(tmp_path)
+        workers.append(flights)
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        shared_cache['k'] = 'histogram'
+        return 'histogram'
+
+    results = []
+    threads = [threading.Thread(target=lambda f=f: results.append(f.do('k', fetch, recheck=lambda: shared_cache.get('k'))))
+               for f in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ['histogram', 'histogram']
@@ -0,0 +1,89 @@
+# Tests for the local skill extractor.
+
+from unittest.mock import MagicMock, patch
+
+import app as main_app
+from skills import SkillMatcher, default_matcher, top_skills
+
+
+def test_matcher_finds_whole_word_aliases_including_multi_word_and_symbols():
+    """
+    GIVEN the built-in skill dictionary
+    WHEN a description mixing punctuation, multi-word aliases and look-alike words is scanned
+    THEN each skill is found by any of its aliases, only on whole tokens
+    """
+    text = ("Senior engineer: Python/Django, C++ & C#, ASP.NET Core and Node.js. Machine-learning "
+            "(scikit-learn) on AWS EC2 with CI/CD. Full UK driving licence. Go to the office; the rest is remote.")
+    assert default_matcher().extract(text) == {
+        'Python', 'Django', 'C++', 'C#', '.NET', 'Node.js', 'Machine Learning', 'scikit-learn', 'AWS', 'CI/CD',
+        'Driving Licence'}
+    assert default_matcher().extract('JavaScript and TypeScript') == {'JavaScript', 'TypeScript'}  # not Java
+    assert default_matcher().extract('golang and Rust lang') == {'Go', 'Rust'}
+
+
+def test_everyday_words_only_match_their_specific_aliases():
+    """
+    GIVEN skills whose names are also everyday words (Excel, Spark, Agile, Networking, Compliance)
+    WHEN descriptions use those words in their everyday sense, and then their skill aliases
+    THEN only the skill aliases match, and "ml" on its own (a millilitre) is not Machine Learning
+    """
+    everyday = ("You will excel in a fast-paced team, spark new ideas and stay agile. Networking events "
+                "and compliance with ward policy; give 5 ml doses.")
+    assert default_matcher().extract(everyday) == set()
+    specific = ("Microsoft Excel and pivot tables, Apache Spark, Agile methodologies, CCNA, regulatory "
+                "compliance, AI/ML.")
+    assert default_matcher().extract(specific) == {'Excel', 'Spark', 'Agile', 'Networking', 'Compliance',
+                                                   'Machine Learning', 'AI'}
+
+
+def test_overlapping_aliases_are_all_reported():
+    """
+    GIVEN a dictionary whose aliases overlap and share prefixes
+    WHEN a text contains them back to back
+    THEN every alias ending at a position is reported, not just the longest
+    """
+    matcher = SkillMatcher({'Test': {'Data': [], 'Data Engineering': [], 'Engineering Management': [],
+                                     'Big Data Engineering': []}})
+    assert matcher.extract('big data engineering management') == {
+        'Data', 'Data Engineering', 'Engineering Management', 'Big Data Engineering'}
+    assert matcher.extract('data big data') == {'Data'}
+
+
+def test_skills_are_ranked_by_listings_mentioning_them():
+    """
+    GIVEN listings where one mentions SQL several times
+    WHEN the top skills are computed
+    THEN each listing counts once per skill and the share is relative to all listings
+    """
+    listings = [{'title': 'Data Analyst', 'description': 'SQL, SQL and more SQL. Advanced Excel.'},
+                {'title': 'BI Developer', 'description': 'Power BI and Microsoft Excel.'},
+                {'title': 'Analyst', 'description': None}]
+    ranked = top_skills(listings, top=2)
+    assert [(skill['name'], skill['count']) for skill in ranked] == [('Excel', 2), ('SQL', 1)]
+    assert ranked[0]['share'] == 2 / 3 and ranked[0]['category'] == 'Data & AI'
+
+
+@patch('app.upstream.session.get')
+def test_results_page_shows_skills_from_every_listing(mock_get, test_client, monkeypatch):
+    """
+    GIVEN an Adzuna search returning listings that mention skills
+    WHEN the results page is rendered
+    THEN the skills panel lists them with their listing counts
+    """
+    def adzuna(url, *args, **kwargs):
+        response = MagicMock(status_code=200)
+        response.json.return_value = {'histogram': {}} if url.endswith('/histogram') else {'count': 2, 'results': [
+            {'title': 'Platform Engineer', 'description': 'Kubernetes and Terraform on AWS.',
+             'redirect_url': 'https://www.adzuna.co.uk/jobs/details/3000001', 'created': '2024-01-01T00:00:00Z'},
+            {'title': 'DevOps Engineer', 'description': 'Terraform, Docker.',
+             'redirect_url': 'https://www.adzuna.co.uk/jobs/details/3000002', 'created': '2024-01-01T00:00:00Z'}]}
+        return response
+    mock_get.side_effect = adzuna
+    monkeypatch.setattr(main_app, 'ADZUNA_APP_ID', 'id')
+    monkeypatch.setattr(main_app, 'ADZUNA_APP_KEY', 'key')
+
+    response = test_client.get('/?what=devops&where=london&country=gb&generate_summary=false')
+    page = response.get_data(as_text=True)
+    assert 'Skills in Demand' in page
+    assert 'Terraform <span class="ml-1.5 text-xs text-indigo-500">2 (100%)</span>' in page
+    assert 'DevOps <span class="ml-1.5 text-xs text-indigo-500">1 (50%)</span>' in page
@@ -0,0 +1,130 @@
+# Tests for the embedded database-backed task queue.
+
+import time
+from datetime import timedelta
+
+import app as main_app
+from app import task_queue
+
+calls = []
+
+
+@task_queue.task('test_echo')
+def echo_task(payload):
+    calls.append(payload['n'])
+    return {'n': payload['n']}
+
+
+@task_queue.task('test_slow')
+def slow_task(payload):
+    # Outlive the lease, then let another worker look for dead workers' tasks
+    time.sleep(payload['seconds'])
+    task_queue._requeue_expired_leases(main_app.utcnow())
+    calls.append(main_app.db.session.query(main_app.Task.status).filter_by(name='test_slow').scalar())
+    return 'ok'
+
+
+@task_queue.task('test_flaky')
+def flaky_task(payload):
+    calls.append('flaky')
+    if calls.count('flaky') < 2:
+        raise ConnectionError('upstream hiccup')
+    return 'ok'
+
+
+def test_tasks_run_by_priority_and_dedupe_by_key(test_client):
+    """
+    GIVEN queued tasks with different priorities, two of which share a key
+    WHEN the queue is drained
+    THEN the duplicate is not queued twice, higher priorities run first and results are stored
+    """
+    calls.clear()
+    with test_client.application.app_context():
+        low = task_queue.enqueue('test_echo', {'n': 1}, key='echo:1')
+        duplicate = task_queue.enqueue('test_echo', {'n': 1}, key='echo:1')
+        high = task_queue.enqueue('test_echo', {'n': 2}, priority=10)
+        assert duplicate.id == low.id
+        assert task_queue.run_pending() == 2
+
+        assert calls == [2, 1]
+        assert task_queue.get(low.id).to_dict()['result'] == {'n': 1}
+        assert task_queue.get(high.id).status == 'done'
+        # A finished task with the same key is reused instead of recomputed
+        assert task_queue.enqueue('test_echo', {'n': 1}, key='echo:1').id == low.id
+
+
+def test_failed_task_is_retried_with_backoff(test_client):
+    """
+    GIVEN a task that fails on its first attempt
+    WHEN it is run, then run again once its backoff has elapsed
+    THEN it is re-queued after the failure and succeeds on the retry
+    """
+    calls.clear()
+    with test_client.application.app_context():
+        task = task_queue.enqueue('test_flaky')
+        task_queue.run_pending()
+        task = task_queue.get(task.id)
+        assert (task.status, task.attempts) == ('queued', 1)
+        assert 'upstream hiccup' in task.error
+
+        task.run_after = main_app.utcnow()
+        main_app.db.session.commit()
+        task_queue.run_pending()
+        assert (task_queue.get(task.id).status, task_queue.get(task.id).result) == ('done', '"ok"')
+
+
+def test_task_status_endpoint(test_client):
+    """
+    GIVEN a queued task
+    WHEN its status URL is polled
+    THEN the task's status is returned as JSON by its token, and ids or unknown tokens give a 404
+    """
+    with test_client.application.app_context():
+        task = task_queue.enqueue('test_echo', {'n': 3})
+        task_id, token = task.id, task.token
+    assert len(token) >= 20
+    assert test_client.get(f'/tasks/{token}').get_json()['status'] == 'queued'
+    assert test_client.get(f'/tasks/{task_id}').status_code == 404
+    assert test_client.get('/tasks/not-a-token').status_code == 404
+
+
+def test_workers_start_on_the_first_request_not_on_enqueue(test_client, monkeypatch):
+    """
+    GIVEN a web process configured with one worker thread
+    WHEN a task is enqueued (as a CLI command would) and then a request is handled
+    THEN enqueueing starts no thread, and the first request starts the worker
+    """
+    started = []
+
+    def work():
+        started.append(True)
+    monkeypatch.setitem(test_client.application.config, 'TASK_QUEUE_WORKERS', 1)
+    monkeypatch.setattr(task_queue, 'work', work)
+    monkeypatch.setattr(task_queue, '_threads', [])
+    with test_client.application.app_context():
+        task_queue.enqueue('test_echo', {'n': 4})
+    assert task_queue._threads == []
+
+    test_client.get('/login')
+    task_queue._threads[0].join(1)
+    assert started == [True] and len(task_queue._threads) == 1
+
+
+def test_running_task_keeps_its_lease_and_dead_workers_tasks_are_reclaimed(test_client, monkeypatch):
+    """
+    GIVEN a short task lease
+    WHEN a task runs for longer than the lease, and separately a running task's lease has lapsed
+    THEN the live worker's heartbeat keeps its task from being reclaimed, and the lapsed task is re-queued
+    """
+    calls.clear()
+    monkeypatch.setitem(test_client.application.config, 'TASK_LEASE_SECONDS', 0.3)
+    with test_client.application.app_context():
+        task = task_queue.enqueue('test_slow', {'seconds': 0.6})
+        assert task_queue.run_pending() == 1
+        assert calls == ['running'] and task_queue.get(task.id).attempts == 1
+
+        orphan = task_queue.enqueue('test_echo', {'n': 5})
+        orphan.status, orphan.leased_until = 'running', main_app.utcnow() - timedelta(seconds=1)
+        main_app.db.session.commit()
+        task_queue._requeue_expired_leases(main_app.utcnow())
+        assert task_queue.get(orphan.id).status == 'queued'
@@ -0,0 +1,81 @@
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# --- Time Buckets ---
+# Snapshots are stored one row per (tracked query, bucket). A bucket starts at a multiple of its
+# width (`resolution`, seconds) counted from a Monday midnight, so day buckets start at midnight
+# and week buckets on Mondays. New snapshots go into TREND_SNAPSHOT_INTERVAL buckets; older ones
+# are merged into coarser buckets as they age (see downsample_plan).
+DAY = 24 * 3600
+WEEK = 7 * DAY
+_ALIGN = datetime(1970, 1, 5)  # a Monday
+
+SALARY_FIELDS = ('salary_p10', 'salary_p25', 'salary_median', 'salary_p75', 'salary_p90')
+
+
+def bucket_start(moment, resolution):
+    """ Start of the `resolution`-second bucket containing `moment` (a naive UTC datetime). """
+    offset = (moment - _ALIGN) // timedelta(seconds=resolution)
+    return _ALIGN + timedelta(seconds=offset * resolution)
+
+
+def tiers(config):
+    """ [(minimum age in seconds, resolution)] for snapshots past the raw retention, coarsest last. """
+    return [(config.get('TREND_RAW_RETENTION_DAYS', 14) * DAY, DAY),
+            (config.get('TREND_DAILY_RETENTION_DAYS', 180) * DAY, WEEK)]
+
+
+# --- Downsampling ---
+def merge(points):
+    """
+    Combines snapshot points (dicts with the MarketSnapshot columns) into one: job counts and
+    salary percentiles are averaged over the snapshots they cover (weighted by `samples`, missing
+    values ignored) and skill mentions are summed (into a Counter).
+    """
+    samples = sum(point['samples'] for point in points)
+    merged = {'samples': samples, 'listings_sampled': sum(point['listings_sampled'] or 0 for point in points)}
+    for field in ('total_jobs', *SALARY_FIELDS):
+        known = [(point[field], point['samples']) for point in points if point[field] is not None]
+        weight = sum(w for _, w in known)
+        merged[field] = round(sum(value * w for value, w in known) / weight) if weight else None
+    skills = Counter()
+    for point in points:
+        skills.update(point['top_skills'] or {})
+    merged['top_skills'] = skills
+    return merged
+
+
+def downsample_plan(points, now, tiers, max_age=None, top_skills=10):
+    """
+    Works out how to compact one query's snapshots. Once a whole bucket of a tier's resolution
+    is older than the tier's minimum age, the points in it are merged into one. Points whose bucket
+    ended more than `max_age` seconds ago are dropped.
+
+    Returns (ids to delete, new points to insert): each new point has `bucket_start`,
+    `resolution` and the merge() fields, and replaces all the ids in its bucket.
+    """
+    groups, expired = {}, []
+    for point in points:
+        if max_age is not None and (now - point['bucket_start']).total_seconds() - point['resolution'] > max_age:
+            expired.append(point['id'])
+            continue
+        key = (point['resolution'], point['bucket_start'])
+        for min_age, resolution in tiers:
+            start = bucket_start(point['bucket_start'], resolution)
+            # Only whole buckets are compacted, so a merged row never overlaps a finer one
+            if resolution > key[0] and (now - start).total_seconds() - resolution >= min_age:
+                key = (resolution, start)
+        groups.setdefault(key, []).append(point)
+
+    delete_ids, inserts = list(expired), []
+    for (resolution, start), members in groups.items():
+        if len(members) == 1 and members[0]['resolution'] == resolution:
+            continue  # already compact
+        merged = merge(members)
+        merged['top_skills'] = dict(merged['top_skills'].most_common(top_skills))
+        inserts.append({**merged, 'bucket_start': start, 'resolution': resolution})
+        delete_ids.extend(member['id'] for member in members)
+    return delete_ids, inserts